@@ -0,0 +1,222 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from metrics import ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+
+# Upstream concurrency settings
+UPSTREAM_MAX_CONCURRENT = int(os.getenv('UPSTREAM_MAX_CONCURRENT', '8'))
+UPSTREAM_MODEL_LIMITS = os.getenv('UPSTREAM_MODEL_LIMITS', '')  # e.g. "sonar-pro=4,sonar=8"
+UPSTREAM_QUEUE_SIZE = int(os.getenv('UPSTREAM_QUEUE_SIZE', '32'))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', '30'))
+UPSTREAM_RETRY_AFTER = int(os.getenv('UPSTREAM_RETRY_AFTER', '5'))
+
+# Lower values are admitted first
+PRIORITY_WIDGET = 0
+PRIORITY_DASHBOARD = 1
+
+
+def parse_model_limits(spec):
+    """Parse "model=limit,model=limit" into a dict, ignoring malformed entries"""
+    limits = {}
+    for item in spec.split(','):
+        model, _, limit = item.partition('=')
+        if model.strip() and limit.strip().isdigit():
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+class Overloaded(Exception):
+    """No upstream slot could be granted; maps to a 503 with Retry-After"""
+
+    def __init__(self, message, retry_after=UPSTREAM_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A granted upstream slot; release() is idempotent"""
+
+    def __init__(self, controller, model):
+        self._controller = controller
+        self._model = model
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self._model)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class _Waiter:
+    def __init__(self, model, priority):
+        self.model = model
+        self.priority = priority
+        self.event = threading.Event()
+        self.admitted = False
+
+    def notify(self):
+        self.event.set()
+
+
+class _AsyncWaiter(_Waiter):
+    # Woken from whichever thread releases the slot, so hand off to the waiter's loop
+    def __init__(self, model, priority):
+        super().__init__(model, priority)
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def notify(self):
+        self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionController:
+    """
+    Limits concurrent upstream calls globally and per model. Callers that can't
+    run immediately wait in a bounded queue ordered by priority, then arrival;
+    when the queue is full or the wait runs out they get Overloaded instead of
+    holding a worker thread for the length of an upstream timeout.
+    """
+
+    def __init__(self, max_concurrent, model_limits=None, max_queue=32, queue_timeout=30.0,
+                 retry_after=UPSTREAM_RETRY_AFTER):
+        self.max_concurrent = max_concurrent
+        self.model_limits = model_limits or {}
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._active = 0
+        self._active_by_model = {}
+        self._waiters = []  # heap of (priority, sequence, waiter)
+        self._sequence = itertools.count()
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0, "wait_timeouts": 0}
+
+    def _has_capacity(self, model):
+        if self._active >= self.max_concurrent:
+            return False
+        limit = self.model_limits.get(model)
+        return limit is None or self._active_by_model.get(model, 0) < limit
+
+    def _admit(self, model):
+        self._active += 1
+        self._active_by_model[model] = self._active_by_model.get(model, 0) + 1
+        self.counters['admitted'] += 1
+
+    def _try_admit_or_enqueue(self, model, priority, waiter_class):
+        """Admit immediately (returning None) or enqueue and return the new waiter"""
+        with self._lock:
+            # Queued waiters are always blocked on a limit (see _dispatch), so a
+            # caller with capacity available doesn't jump ahead of anyone runnable
+            if self._has_capacity(model):
+                self._admit(model)
+                ADMISSION_WAIT_SECONDS.observe(0, priority=str(priority))
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.counters['rejected'] += 1
+                ADMISSION_REJECTIONS.inc(reason='queue_full')
+                raise Overloaded("Server is at capacity, please retry shortly", self.retry_after)
+            waiter = waiter_class(model, priority)
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+            self.counters['queued'] += 1
+            return waiter
+
+    def _dequeue(self, waiter):
+        self._waiters = [item for item in self._waiters if item[2] is not waiter]
+        heapq.heapify(self._waiters)
+
+    def _finish_wait(self, waiter, started):
+        """Return a Slot for a woken waiter, or dequeue it and raise Overloaded"""
+        with self._lock:
+            # A release may have admitted the waiter just as its wait timed out
+            if not waiter.admitted:
+                self._dequeue(waiter)
+                self.counters['wait_timeouts'] += 1
+                ADMISSION_REJECTIONS.inc(reason='wait_timeout')
+                raise Overloaded("Timed out waiting for upstream capacity, please retry shortly", self.retry_after)
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, priority=str(waiter.priority))
+        return Slot(self, waiter.model)
+
+    def acquire(self, model, priority=PRIORITY_DASHBOARD):
+        """Return a Slot for one upstream call, waiting in the queue if needed"""
+        started = time.perf_counter()
+        waiter = self._try_admit_or_enqueue(model, priority, _Waiter)
+        if waiter is None:
+            return Slot(self, model)
+        waiter.event.wait(self.queue_timeout)
+        return self._finish_wait(waiter, started)
+
+    async def acquire_async(self, model, priority=PRIORITY_DASHBOARD):
+        """acquire() for coroutines: waits on the event loop instead of blocking a thread"""
+        started = time.perf_counter()
+        waiter = self._try_admit_or_enqueue(model, priority, _AsyncWaiter)
+        if waiter is None:
+            return Slot(self, model)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away while queued; give back a slot granted in the meantime
+            with self._lock:
+                admitted = waiter.admitted
+                if not admitted:
+                    self._dequeue(waiter)
+            if admitted:
+                self._release(model)
+            raise
+        return self._finish_wait(waiter, started)
+
+    def _release(self, model):
+        with self._lock:
+            self._active -= 1
+            self._active_by_model[model] -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        # Admit queued callers in priority order, skipping ones whose model is at
+        # its own limit so a saturated model doesn't block the others
+        blocked = []
+        while self._waiters and self._active < self.max_concurrent:
+            item = heapq.heappop(self._waiters)
+            waiter = item[2]
+            if self._has_capacity(waiter.model):
+                self._admit(waiter.model)
+                waiter.admitted = True
+                waiter.notify()
+            else:
+                blocked.append(item)
+        for item in blocked:
+            heapq.heappush(self._waiters, item)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "active_by_model": {model: count for model, count in self._active_by_model.items() if count},
+                "queue_depth": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                **self.counters
+            }
+
+
+upstream_admission = AdmissionController(
+    UPSTREAM_MAX_CONCURRENT,
+    parse_model_limits(UPSTREAM_MODEL_LIMITS),
+    UPSTREAM_QUEUE_SIZE,
+    UPSTREAM_QUEUE_TIMEOUT
+)
@@ -1,61 +1,179 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+from functools import partial, wraps
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import requests
 import os
+import sys
 import json
-from pandasai import SmartDataframe
-import pandas as pd
+import sqlite3
 import time
 from dotenv import load_dotenv
 
-from pandasai.llm.openai import OpenAI
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 # Load environment variables
 load_dotenv()
 
+# Imported after load_dotenv so the client picks up settings from .env
+from admission import PRIORITY_DASHBOARD, PRIORITY_WIDGET, Overloaded, upstream_admission
+from perplexity_client import PERPLEXITY_API_KEY, UpstreamError, post_chat_completion, stream_chat_completion
+from response_cache import make_cache_key, response_cache
+from prompt_index import prompt_index
+from singleflight import SingleFlight, payload_key
+from dataset_store import DATASET_MAX_UPLOAD_BYTES, DatasetError, dataset_store
+from dashboard_store import DashboardError, dashboard_store, etag_matches, stale_widgets, widget_ttl
+from metrics import FALLBACK_WIDGETS, JSON_DECODE_FAILURES, JSON_REPAIRS, REQUESTS, REQUEST_SECONDS, record_stage, record_usage, registry
+from json_repair import JSONRepairError, extract_json
+from stream_parser import WidgetStreamParser
+from model_router import model_router
+from compression import COMPRESSION_MIN_BYTES, choose_encoding, compress, compressible, weak_etag
+from widget_data import SeriesOptionsError, parse_series_options, series_etag, shape_dashboard, shape_widget
+# csv_engine and csv_profile pull in pandas and numpy, which dominate startup time and
+# memory, so they are imported inside the CSV code paths rather than here
+
 app = Flask(__name__)
 
 # Configure CORS with environment variable support
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
 CORS(app, origins=ALLOWED_ORIGINS)  # Enable CORS for all routes
 
-# Configure Perplexity API
-PERPLEXITY_API_KEY = os.getenv('PERPLEXITY_API_KEY')
-PERPLEXITY_BASE_URL = 'https://api.perplexity.ai'
+# Largest request body: a dataset upload at the limit, plus room for multipart framing.
+# Flask enforces it while reading; reject_oversized_body turns a declared
+# Content-Length away before anything is buffered or parsed
+MAX_REQUEST_BYTES = DATASET_MAX_UPLOAD_BYTES + 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({"status": "healthy", "message": "Flask backend is running"})
+def request_too_large_body():
+    return {"error": f"Request body exceeds the {MAX_REQUEST_BYTES} byte limit; upload large CSVs to /datasets"}
 
-@app.route('/generate-dashboard', methods=['POST'])
-def generate_dashboard():
+@app.before_request
+def reject_oversized_body():
+    if request.content_length is not None and request.content_length > MAX_REQUEST_BYTES:
+        return jsonify(request_too_large_body()), 413
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON bodies for clients that accept br or gzip; streamed responses pass through"""
+    if response.is_streamed or response.direct_passthrough or not compressible(response.mimetype, response.content_encoding):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    body = response.get_data()
+    if encoding and len(body) >= COMPRESSION_MIN_BYTES:
+        response.set_data(compress(body, encoding))
+        response.content_encoding = encoding
+        if 'ETag' in response.headers:
+            response.headers['ETag'] = weak_etag(response.headers['ETag'])
+    return response
+
+# Identical concurrent upstream requests share a single in-flight call
+upstream_flight = SingleFlight()
+SINGLEFLIGHT_WAIT_TIMEOUT = float(os.getenv('SINGLEFLIGHT_WAIT_TIMEOUT', '120'))
+
+# Widget replacements and refreshes are small and interactive, so they get upstream slots before full dashboards
+ENDPOINT_PRIORITIES = {
+    'generate-single-widget': PRIORITY_WIDGET,
+    'generate-widgets': PRIORITY_WIDGET,
+    'generate-widgets-stream': PRIORITY_WIDGET,
+    'refresh-dashboard': PRIORITY_WIDGET,
+}
+
+def endpoint_priority(endpoint):
+    """The admission priority of an endpoint's upstream calls"""
+    return ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_DASHBOARD)
+
+def call_perplexity(payload, read_timeout, endpoint=''):
     """
-    Enhanced dashboard generation endpoint:
-    1. Gets prompt from frontend
-    2. Uses Perplexity AI to research the topic and gather actual data
-    3. Returns dashboard with real, structured data ready for visualization
+    Send a chat completion, coalescing with any identical request already in flight.
+    Returns (status_code, data, led) where data is the parsed JSON body on success
+    and the raw response text otherwise, and led is whether this caller made the
+    upstream call rather than sharing another's. Raises Overloaded if no upstream
+    slot can be granted.
     """
+    led = False
+    
+    def fetch():
+        nonlocal led
+        led = True
+        # Only the leader takes an upstream slot; coalesced waiters don't
+        with upstream_admission.acquire(payload.get('model', ''), endpoint_priority(endpoint)):
+            response = post_chat_completion(payload, read_timeout=read_timeout)
+        if response.status_code != 200:
+            return response.status_code, response.text
+        response_data = response.json()
+        # Recorded once per upstream call, not once per coalesced waiter
+        record_usage(endpoint, payload.get('model', ''), response_data.get('usage'))
+        return response.status_code, response_data
+    
+    status_code, data = upstream_flight.do(payload_key(payload), fetch, timeout=SINGLEFLIGHT_WAIT_TIMEOUT)
+    return status_code, data, led
+
+def output_truncated(response_data, result):
+    """Whether a completion was cut off at max_tokens, by its finish_reason or the repair that closed it"""
     try:
-        # Get JSON data from request
-        data = request.get_json()
-        
-        if not data or 'prompt' not in data:
-            return jsonify({"error": "No prompt provided"}), 400
-        
-        prompt = data['prompt']
-        model = data.get('model', 'sonar-pro')
-        
-        if not prompt.strip():
-            return jsonify({"error": "Empty prompt provided"}), 400
-        
-        # Check if API key is configured
-        if not PERPLEXITY_API_KEY:
-            return jsonify({"error": "Perplexity API key not configured"}), 500
-        
-        # Enhanced system prompt for comprehensive data gathering
-        system_prompt = """You are a data analyst AI that researches topics and creates comprehensive dashboards with real data. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
+        if response_data['choices'][0].get('finish_reason') == 'length':
+            return True
+    except (KeyError, IndexError, TypeError, AttributeError):
+        pass
+    return isinstance(result, dict) and 'truncated' in result.get('json_repairs', ())
+
+def next_route(route, status_code, response_data, result, error, started, record=True):
+    """
+    Record a routed attempt with the model router and return the route to
+    retry on if its output was truncated or invalid, else None. Callers that
+    shared a coalesced upstream call pass record=False, so the call is
+    recorded once, by the caller that made it.
+    """
+    if status_code != 200:
+        outcome = 'upstream_error'
+    elif isinstance(error, TruncatedOutputError):
+        outcome = 'truncated'
+    elif error is not None:
+        outcome = 'invalid'
+    elif output_truncated(response_data, result):
+        outcome = 'truncated'
+    else:
+        outcome = 'ok'
+    if record:
+        usage = response_data.get('usage') if isinstance(response_data, dict) else None
+        model_router.record(route, usage, time.perf_counter() - started, outcome)
+    return model_router.escalate(route, outcome, record) if outcome in ('invalid', 'truncated') else None
+
+def call_routed(payload, read_timeout, endpoint, kind, finish):
+    """
+    call_perplexity on the model and max_tokens the model router picks for this
+    endpoint and kind of output, returning finish(status_code, response_data, model).
+    A truncated or invalid output is retried on an escalated route; if that
+    fails, a truncated result from before is returned rather than an error.
+    """
+    route = model_router.route(endpoint, kind, payload)
+    fallback = None
+    while True:
+        started = time.perf_counter()
+        try:
+            status_code, response_data, led = call_perplexity(route.apply(payload), read_timeout=read_timeout, endpoint=endpoint)
+        except Exception:
+            if fallback is None:
+                raise
+            return fallback
+        result = error = None
+        try:
+            result = finish(status_code, response_data, route.model)
+        except GenerationError as e:
+            error = e
+        route = next_route(route, status_code, response_data, result, error, started, led)
+        if route is None:
+            if error is None:
+                return result
+            if fallback is not None:
+                return fallback
+            raise error
+        if error is None:
+            fallback = result
+
+# Enhanced system prompt for comprehensive data gathering
+DASHBOARD_SYSTEM_PROMPT = """You are a data analyst AI that researches topics and creates comprehensive dashboards with real data. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
 
 Research the given topic thoroughly and return a JSON object with this exact structure:
 
@@ -90,113 +208,688 @@ Examples:
 - Events: attendance, impact metrics, timeline data, comparisons
 
 User topic: """
+
+def build_dashboard_payload(prompt, model):
+    """Build the Perplexity request for a research dashboard"""
+    return {
+        'model': model,
+        'messages': [
+            {"role": "system", "content": "You are a data research assistant that provides factual, current information in structured JSON format."},
+            {"role": "user", "content": DASHBOARD_SYSTEM_PROMPT + prompt}
+        ],
+        'max_tokens': 2000,
+        'temperature': 0.2
+    }
+
+class GenerationError(Exception):
+    """A generation step failed in a way that maps to an error response"""
+    
+    def __init__(self, message, status_code=500, raw_response=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.raw_response = raw_response
+    
+    def to_dict(self):
+        error = {"error": str(self)}
+        if self.raw_response is not None:
+            error['raw_response'] = self.raw_response
+        return error
+
+class TruncatedOutputError(GenerationError):
+    """The model's output was cut off before anything usable was complete"""
+
+def validate_widget(widget, endpoint=''):
+    """Replace malformed widget data with a fallback structure for its type"""
+    if widget.get('type') == 'number':
+        if not isinstance(widget.get('data'), dict) or 'value' not in widget['data']:
+            # Provide fallback structure for number widgets
+            widget['data'] = {"value": 0, "label": "No data available"}
+            FALLBACK_WIDGETS.inc(endpoint=endpoint, widget_type='number')
+    elif widget.get('type') in ['bar', 'line']:
+        if not isinstance(widget.get('data'), list):
+            # Provide fallback structure for chart widgets
+            widget['data'] = [{"name": "No data", "value": 0}]
+            FALLBACK_WIDGETS.inc(endpoint=endpoint, widget_type=widget['type'])
+    return widget
+
+def record_repairs(endpoint, result, repairs):
+    """Count the repairs a model output needed and list them on the result as json_repairs"""
+    for repair in repairs:
+        JSON_REPAIRS.inc(endpoint=endpoint, repair=repair)
+    if repairs and isinstance(result, dict):
+        result['json_repairs'] = repairs
+    return result
+
+def parse_ai_response(response_data, endpoint=''):
+    """
+    Extract the model's JSON content from a Perplexity response body, repairing
+    fences, surrounding prose, truncation and other near-misses (see json_repair)
+    """
+    started = time.perf_counter()
+    ai_response = response_data['choices'][0]['message']['content']
+    
+    try:
+        result, repairs = extract_json(ai_response)
+    except JSONRepairError as e:
+        JSON_DECODE_FAILURES.inc(endpoint=endpoint)
+        raise GenerationError(f"Invalid JSON response from Perplexity AI: {str(e)}", raw_response=ai_response)
+    finally:
+        record_stage(endpoint, 'parse_response', started)
+    return record_repairs(endpoint, result, repairs)
+
+def mark_truncated(dashboard_data):
+    """A dashboard recovered from cut-off output is partial, and unusable if no widget survived"""
+    if 'truncated' in dashboard_data.get('json_repairs', ()):
+        if not dashboard_data.get('widgets'):
+            raise TruncatedOutputError("Truncated response from Perplexity AI with no complete widgets")
+        dashboard_data['partial'] = True
+    return dashboard_data
+
+def finish_dashboard(status_code, response_data, model, endpoint='generate-dashboard'):
+    """
+    Turn a research dashboard completion into validated dashboard data.
+    Raises GenerationError on an upstream error or an unusable response.
+    """
+    if status_code != 200:
+        raise GenerationError(f"Perplexity API error: {status_code} - {response_data}")
+    
+    # Extract and parse the Perplexity response
+    dashboard_data = parse_ai_response(response_data, endpoint)
+    
+    # Validate the dashboard structure
+    if not isinstance(dashboard_data, dict) or 'widgets' not in dashboard_data:
+        raise GenerationError("Invalid dashboard structure from Perplexity AI")
+    mark_truncated(dashboard_data)
+    
+    # Add metadata
+    dashboard_data['generated_at'] = time.time()
+    dashboard_data['data_source'] = 'Perplexity AI Research'
+    dashboard_data['model_used'] = model
+    
+    # Validate each widget has the correct data structure
+    started = time.perf_counter()
+    for widget in dashboard_data.get('widgets', []):
+        validate_widget(widget, endpoint)
+    record_stage(endpoint, 'validate', started)
+    return dashboard_data
+
+def instrumented(endpoint):
+    """
+    Count requests by endpoint, model and outcome and time the whole handler.
+    A streamed response is timed until its stream ends or the client disconnects.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = view(*args, **kwargs)
+            status = result[1] if isinstance(result, tuple) else getattr(result, 'status_code', 200)
+            if status < 400:
+                outcome = 'success'
+            elif status < 500:
+                outcome = 'client_error'
+            else:
+                outcome = 'error'
+            model = request_model(request.get_json(silent=True))
+            
+            def record():
+                REQUESTS.inc(endpoint=endpoint, model=model, outcome=outcome)
+                REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+            
+            if isinstance(result, Response) and result.is_streamed:
+                result.call_on_close(record)
+            else:
+                record()
+            return result
+        return wrapper
+    return decorator
+
+def request_model(data):
+    """The model a request body asks for, as counted in the request metrics"""
+    return data.get('model', 'sonar-pro') if isinstance(data, dict) else ''
+
+# Widget spec format for CSV dashboards: the model picks the aggregation and
+# the csv_engine computes the numbers over the full dataset
+CSV_SPEC_RULES = """SPEC rules (the server computes the widget data from the spec over every row):
+- "aggregate": "sum" | "mean" | "median" | "min" | "max" | "count" | "nunique"
+- "value_column": the column to aggregate (omit it with "count" to count rows)
+- For "bar" charts: {"group_by": "Category column", "aggregate": ..., "value_column": ..., "limit": 10, "sort": "desc" | "asc" | "label"}
+- For "line" charts: {"time_column": "Date, year or sequence column", "bucket": "day" | "week" | "month" | "quarter" | "year", "aggregate": ..., "value_column": ...} (only use "bucket" with date columns)
+- For "number" widgets: {"aggregate": ..., "value_column": ..., "label": "Description"}"""
+
+def try_load_dataframe(csv_data):
+    """Parse uploaded data for the local CSV engine, or None if it isn't tabular"""
+    import pandas as pd
+    from csv_engine import load_dataframe
+    try:
+        df = load_dataframe(csv_data)
+    except (ValueError, UnicodeError):
+        return None
+    # Rows with more fields than the header make pandas build an implicit index: not a clean table
+    if df.empty or not isinstance(df.index, pd.RangeIndex):
+        return None
+    return df
+
+def describe_csv(csv_data, token_budget):
+    """Column profile and a random row sample of the whole file, packed into the token budget"""
+    from csv_profile import format_profile, get_profile
+    return format_profile(get_profile(csv_data), token_budget)
+
+def apply_widget_spec(df, widget):
+    """Compute a CSV widget's data locally from the spec the model returned"""
+    from csv_engine import SpecError, compute_widget_data
+    spec = widget.get('spec')
+    if spec is None:
+        return widget
+    try:
+        widget['data'] = compute_widget_data(df, widget.get('type'), spec)
+    except (SpecError, TypeError, ValueError) as e:
+        # Keep any data the model supplied; validate_widget fills in a fallback otherwise
+        widget['spec_error'] = str(e)
+    return widget
+
+def describe_error(error):
+    """(body, status_code) for an exception from a generation, matching the routes' error responses"""
+    if isinstance(error, Overloaded):
+        return {"error": str(error), "retry_after": error.retry_after}, 503
+    if isinstance(error, GenerationError):
+        return error.to_dict(), error.status_code
+    if isinstance(error, (DatasetError, DashboardError)):
+        return {"error": str(error)}, error.status_code
+    if isinstance(error, requests.exceptions.RequestException):
+        return {"error": f"Network error connecting to Perplexity API: {str(error)}"}, 500
+    if isinstance(error, KeyError):
+        return {"error": f"Unexpected response format from Perplexity API: {str(error)}"}, 500
+    if isinstance(error, TimeoutError):
+        return {"error": f"Timed out waiting for Perplexity API: {str(error)}"}, 504
+    return {"error": f"Internal server error: {str(error)}"}, 500
+
+def error_headers(error):
+    """Headers for an error response: when to retry after an overload"""
+    return {'Retry-After': str(error.retry_after)} if isinstance(error, Overloaded) else {}
+
+def error_response(error):
+    """The JSON error response for an exception from a generation"""
+    body, status_code = describe_error(error)
+    return jsonify(body), status_code, error_headers(error)
+
+def finish_streamed_dashboard(parser, widgets, prompt, model):
+    """
+    Build the final dashboard once a stream ends from the widgets already sent,
+    or return None if the output was unusable and no widgets were sent.
+    """
+    dashboard_data = parser.finish()
+    if dashboard_data is None or 'widgets' not in dashboard_data:
+        if not widgets:
+            return None
+        # Keep the widgets already delivered even if the tail of the output is unusable
+        dashboard_data = {"dash_name": prompt, "category": "other", "partial": True}
+    else:
+        record_repairs('generate-dashboard-stream', dashboard_data, parser.repairs)
+        if 'truncated' in parser.repairs:
+            dashboard_data['partial'] = True
+    
+    # Add metadata
+    dashboard_data['widgets'] = widgets
+    dashboard_data['generated_at'] = time.time()
+    dashboard_data['data_source'] = 'Perplexity AI Research'
+    dashboard_data['model_used'] = model
+    return dashboard_data
+
+def record_streamed_route(route, usage, started, parser, dashboard_data):
+    """Record a streamed dashboard with the model router; a stream can't be retried once widgets are sent"""
+    if dashboard_data is None:
+        outcome = 'invalid'
+    elif 'truncated' in parser.repairs:
+        outcome = 'truncated'
+    else:
+        outcome = 'ok'
+    model_router.record(route, usage, time.perf_counter() - started, outcome)
+
+class DashboardStream:
+    """
+    One streamed dashboard generation: routes the request, turns the completion
+    stream into server-sent events and builds the final dashboard. The Flask and
+    ASGI routes drive it from their own upstream streams.
+    """
+    
+    def __init__(self, prompt, model, options):
+        self.prompt = prompt
+        self.model = model
+        self.options = options
+        self.route = model_router.route('generate-dashboard-stream', 'dashboard', build_dashboard_payload(prompt, model))
+        self.parser = WidgetStreamParser()
+        self.widgets = []
+        self.usage = None
+        self.started = None
+    
+    def payload(self):
+        """The routed request to stream; the attempt is timed from here"""
+        self.started = time.perf_counter()
+        return self.route.apply(build_dashboard_payload(self.prompt, self.model))
+    
+    def feed(self, kind, value):
+        """The events for one (kind, value) item of the completion stream"""
+        if kind == 'usage':
+            self.usage = value
+            record_usage('generate-dashboard-stream', self.route.model, value)
+        if kind != 'delta':
+            return []
+        events = []
+        for widget in self.parser.feed(value):
+            validate_widget(widget, 'generate-dashboard-stream')
+            self.widgets.append(widget)
+            events.append(sse_event('widget', {"index": len(self.widgets) - 1, "widget": shape_widget(widget, *self.options)}))
+        return events
+    
+    def finish(self):
+        """The final dashboard once the stream ends, or None if the output was unusable"""
+        dashboard_data = finish_streamed_dashboard(self.parser, self.widgets, self.prompt, self.route.model)
+        record_streamed_route(self.route, self.usage, self.started, self.parser, dashboard_data)
+        return dashboard_data
+    
+    def final_event(self, dashboard_data):
+        if dashboard_data is None:
+            return sse_event('error', {"error": "Invalid JSON response from Perplexity AI", "raw_response": self.parser.text})
+        return sse_event('dashboard', shape_dashboard(dashboard_data, *self.options))
+    
+    def error_event(self, error, describe=describe_error):
+        """The event for an exception raised while streaming"""
+        if isinstance(error, UpstreamError):
+            model_router.record(self.route, None, time.perf_counter() - self.started, 'upstream_error')
+            return sse_event('error', {"error": str(error)})
+        body, _ = describe(error)
+        return sse_event('error', body)
+
+def get_cached_dashboard(cache_endpoint, prompt, model):
+    """
+    The cached dashboard for this prompt, or for a recent paraphrase of it.
+    Returns (dashboard, similar_prompt): similar_prompt is the indexed prompt
+    on an approximate match and None on an exact hit, and dashboard is None on a miss.
+    """
+    if response_cache is None:
+        return None, None
+    cache_key = make_cache_key(cache_endpoint, prompt, model)
+    dashboard = response_cache.get(cache_key)
+    if prompt_index is None:
+        return dashboard, None
+    namespace = f"{cache_endpoint}:{model}"
+    if dashboard is not None:
+        # Results cached by another worker or before a restart become matchable too
+        prompt_index.add(namespace, prompt, cache_key)
+        return dashboard, None
+    
+    match = prompt_index.lookup(namespace, prompt)
+    if match is None:
+        return None, None
+    similar_key, similar_prompt, _ = match
+    dashboard = response_cache.get(similar_key)
+    if dashboard is None:
+        # The matched result has expired from the cache
+        prompt_index.discard(similar_key)
+        return None, None
+    return dashboard, similar_prompt
+
+def cache_dashboard(cache_endpoint, prompt, model, dashboard):
+    """Cache a generated dashboard and index its prompt for approximate matches"""
+    if response_cache is None:
+        return
+    cache_key = make_cache_key(cache_endpoint, prompt, model)
+    response_cache.set(cache_key, dashboard)
+    if prompt_index is not None:
+        prompt_index.add(f"{cache_endpoint}:{model}", prompt, cache_key)
+
+def cached_dashboard_fields(similar_prompt):
+    """Extra response fields marking a cache hit"""
+    if similar_prompt is None:
+        return {"cached": True}
+    return {"cached": True, "similar_prompt": similar_prompt}
+
+def dashboard_cache_endpoint(mode):
+    """The response cache namespace for a research dashboard generated in mode"""
+    return 'generate-dashboard:fanout' if mode == 'fanout' else 'generate-dashboard'
+
+def cached_dashboard_body(cache_endpoint, prompt, model, options):
+    """The response body for a dashboard served from the response cache, or None on a miss"""
+    dashboard, similar_prompt = get_cached_dashboard(cache_endpoint, prompt, model)
+    if dashboard is None:
+        return None
+    return {**dashboard_body(dashboard, options), **cached_dashboard_fields(similar_prompt)}
+
+def cached_dashboard_events(dashboard, similar_prompt, options):
+    """A cached dashboard as the events a streamed generation would send"""
+    shaped = shape_dashboard(dashboard, *options)
+    for index, widget in enumerate(shaped.get('widgets', [])):
+        yield sse_event('widget', {"index": index, "widget": widget})
+    yield sse_event('dashboard', {**shaped, **cached_dashboard_fields(similar_prompt)})
+
+def stamp_widget(widget, prompt, generated_at=None):
+    """Record what a stored widget needs to be refreshed on its own: its prompt, generation time and TTL"""
+    widget['prompt'] = prompt
+    widget['generated_at'] = generated_at or time.time()
+    widget['ttl_seconds'] = widget_ttl(widget.get('type'))
+    return widget
+
+def persist_dashboard(dashboard, prompt):
+    """
+    Store a research dashboard so it can be reopened and refreshed by its
+    dashboard_id. Fan-out widgets keep their plan prompt; widgets from a single
+    research call are regenerated from their title.
+    """
+    if dashboard_store is None:
+        return
+    dashboard['prompt'] = prompt
+    for widget in dashboard.get('widgets', []):
+        stamp_widget(widget, widget.get('prompt') or widget.get('name') or prompt, dashboard.get('generated_at'))
+    try:
+        dashboard_store.create(dashboard)
+    except sqlite3.Error:
+        # Still return the dashboard, it just can't be refreshed later
+        dashboard.pop('dashboard_id', None)
+
+
+def store_dashboard(cache_endpoint, prompt, model, dashboard):
+    """
+    Store a freshly generated dashboard, then cache it unless it is partial. The
+    cache entry carries the stored dashboard_id, so exact and paraphrased repeats
+    reopen the same dashboard rather than storing a copy on every hit.
+    """
+    persist_dashboard(dashboard, prompt)
+    if not dashboard.get('partial'):
+        cache_dashboard(cache_endpoint, prompt, model, dashboard)
+
+def series_options(data, args):
+    """
+    (max_points, columnar) for the widget series in a response, from the body's
+    max_points and format, else the query string's. Cached and stored
+    dashboards keep full series; only the response is cut down.
+    """
+    data = data if isinstance(data, dict) else {}
+    try:
+        return parse_series_options(data.get('max_points', args.get('max_points')), data.get('format', args.get('format')))
+    except SeriesOptionsError as e:
+        raise GenerationError(str(e), 400)
+
+def require_api_key():
+    if not PERPLEXITY_API_KEY:
+        raise GenerationError("Perplexity API key not configured", 500)
+
+def parse_prompt_request(data, args, missing_error="No prompt provided"):
+    """
+    (prompt, model, options) for a generation request body. Raises
+    GenerationError when it has no usable prompt or the API key isn't configured.
+    """
+    if not isinstance(data, dict) or 'prompt' not in data:
+        raise GenerationError(missing_error, 400)
+    prompt = data['prompt']
+    if not prompt.strip():
+        raise GenerationError("Empty prompt provided", 400)
+    options = series_options(data, args)
+    require_api_key()
+    return prompt, data.get('model', 'sonar-pro'), options
+
+def parse_csv_dashboard_request(data, args):
+    """parse_prompt_request for a CSV dashboard, which also needs inline CSV text or a dataset_id"""
+    if not isinstance(data, dict) or ('csv_data' not in data and 'dataset_id' not in data):
+        raise GenerationError("Both prompt and CSV data are required", 400)
+    return parse_prompt_request(data, args, "Both prompt and CSV data are required")
+
+def request_csv_data(data):
+    """A request's CSV text: the uploaded dataset it names, else its inline csv_data, if any"""
+    if data.get('dataset_id'):
+        return dataset_store.load(data['dataset_id'])
+    return data.get('csv_data')
+
+def dashboard_body(dashboard, options, message="Dashboard generated with real-time research data"):
+    """A generation route's response body, with the dashboard's series shaped by options"""
+    return {"success": True, "dashboard": shape_dashboard(dashboard, *options), "message": message}
+
+def widget_body(widget_data, cached, options):
+    body = {
+        "success": True,
+        "widget": shape_widget(widget_data, *options),
+        "message": "Single widget generated successfully"
+    }
+    if cached:
+        body['cached'] = True
+    return body
+
+def shape_batch_result(result, options):
+    """A batch item's result with its widget's series shaped for the response"""
+    return dict(result, widget=shape_widget(result['widget'], *options)) if 'widget' in result else result
+
+def sse_event(event, data):
+    """Format one server-sent event with a compact JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify({"status": "healthy", "message": "Flask backend is running"})
+
+def collect_runtime_metrics():
+    """Expose the cache, coalescing and admission state kept by other modules at scrape time"""
+    samples = []
+    if response_cache is not None:
+        cache = response_cache.stats()
+        for tier in ('memory', 'disk'):
+            samples.append(('fastboard_response_cache_hits_total', 'counter', 'Response cache hits by tier',
+                            {'tier': tier}, cache[f'{tier}_hits']))
+            samples.append(('fastboard_response_cache_entries', 'gauge', 'Response cache entries by tier',
+                            {'tier': tier}, cache[tier]['entries']))
+        samples.append(('fastboard_response_cache_misses_total', 'counter', 'Response cache misses', {}, cache['misses']))
+    if prompt_index is not None:
+        index = prompt_index.stats()
+        samples.append(('fastboard_prompt_index_entries', 'gauge', 'Prompts indexed for approximate matching',
+                        {}, index['entries']))
+        samples.append(('fastboard_prompt_index_hits_total', 'counter', 'Requests served from a similar cached prompt',
+                        {}, index['hits']))
+        samples.append(('fastboard_prompt_index_evictions_total', 'counter', 'Prompts evicted from the index',
+                        {}, index['evictions']))
+    flight = upstream_flight.stats()
+    samples.append(('fastboard_upstream_in_flight', 'gauge', 'Upstream calls currently in flight', {}, flight['in_flight']))
+    samples.append(('fastboard_upstream_coalesced_total', 'counter', 'Requests that joined an identical in-flight call',
+                    {}, flight['coalesced']))
+    admission = upstream_admission.stats()
+    samples.append(('fastboard_admission_active', 'gauge', 'Upstream slots in use', {}, admission['active']))
+    samples.append(('fastboard_admission_queue_depth', 'gauge', 'Requests waiting for an upstream slot',
+                    {}, admission['queue_depth']))
+    # Only once a CSV request has loaded the engine; scraping shouldn't import pandas
+    csv_engine = sys.modules.get('csv_engine')
+    if csv_engine is not None:
+        frames = csv_engine.dataframe_cache.stats()
+        samples.append(('fastboard_dataframe_cache_hits_total', 'counter', 'Parsed DataFrame cache hits', {}, frames['hits']))
+        samples.append(('fastboard_dataframe_cache_misses_total', 'counter', 'Parsed DataFrame cache misses', {}, frames['misses']))
+    return samples
+
+registry.register_collector(collect_runtime_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Response cache hit/miss/eviction counters"""
+    if response_cache is None:
+        return jsonify({"enabled": False})
+    stats = response_cache.stats()
+    if prompt_index is not None:
+        stats['prompt_index'] = prompt_index.stats()
+    return jsonify({"enabled": True, **stats})
+
+@app.route('/admin/routing/stats', methods=['GET'])
+def routing_stats():
+    """Model routing state: observed completion sizes, latencies and outcomes per bucket, and the max_tokens each now gets"""
+    return jsonify(model_router.stats())
+
+@app.route('/datasets', methods=['POST'])
+def upload_dataset():
+    """
+    Dataset upload endpoint:
+    1. Streams a CSV (multipart "file" field or raw request body) to disk in chunks
+    2. Returns a content-hash dataset_id, reusing the stored copy for repeat uploads
+    3. The ID can be sent as dataset_id instead of csv_data to the generation endpoints
+    """
+    try:
+        upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+        stream = upload.stream if upload is not None else request.stream
         
-        full_prompt = system_prompt + prompt
-        
-        # Make request to Perplexity API
-        headers = {
-            'Authorization': f'Bearer {PERPLEXITY_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            'model': model,
-            'messages': [
-                {"role": "system", "content": "You are a data research assistant that provides factual, current information in structured JSON format."},
-                {"role": "user", "content": full_prompt}
-            ],
-            'max_tokens': 2000,
-            'temperature': 0.2
-        }
-        
-        response = requests.post(
-            f'{PERPLEXITY_BASE_URL}/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=45
-        )
-        
-        if response.status_code != 200:
-            return jsonify({"error": f"Perplexity API error: {response.status_code} - {response.text}"}), 500
-        
-        # Extract and parse the Perplexity response
-        response_data = response.json()
-        ai_response = response_data['choices'][0]['message']['content']
-        
-        # Clean up the response (remove markdown formatting if present)
-        ai_response = ai_response.strip()
-        if ai_response.startswith('```json'):
-            ai_response = ai_response.replace('```json', '').replace('```', '').strip()
-        
-        try:
-            dashboard_data = json.loads(ai_response)
-        except json.JSONDecodeError as e:
-            return jsonify({"error": f"Invalid JSON response from Perplexity AI: {str(e)}", "raw_response": ai_response}), 500
-        
-        # Validate the dashboard structure
-        if not isinstance(dashboard_data, dict) or 'widgets' not in dashboard_data:
-            return jsonify({"error": "Invalid dashboard structure from Perplexity AI"}), 500
-        
-        # Add metadata
-        dashboard_data['generated_at'] = time.time()
-        dashboard_data['data_source'] = 'Perplexity AI Research'
-        dashboard_data['model_used'] = model
-        
-        # Validate each widget has the correct data structure
-        for widget in dashboard_data.get('widgets', []):
-            if widget.get('type') == 'number':
-                if not isinstance(widget.get('data'), dict) or 'value' not in widget['data']:
-                    # Provide fallback structure for number widgets
-                    widget['data'] = {"value": 0, "label": "No data available"}
-            elif widget.get('type') in ['bar', 'line']:
-                if not isinstance(widget.get('data'), list):
-                    # Provide fallback structure for chart widgets
-                    widget['data'] = [{"name": "No data", "value": 0}]
+        dataset_id, size, deduplicated = dataset_store.save_stream(stream)
         
         return jsonify({
             "success": True,
-            "dashboard": dashboard_data,
-            "message": "Dashboard generated with real-time research data"
+            "dataset_id": dataset_id,
+            "size": size,
+            "deduplicated": deduplicated
         })
         
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Network error connecting to Perplexity API: {str(e)}"}), 500
-    except KeyError as e:
-        return jsonify({"error": f"Unexpected response format from Perplexity API: {str(e)}"}), 500
+    except RequestEntityTooLarge:
+        # A multipart body with no Content-Length that ran past MAX_CONTENT_LENGTH
+        return jsonify(request_too_large_body()), 413
+    except DatasetError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except Exception as e:
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
 
-@app.route('/generate-csv-dashboard', methods=['POST'])
-def generate_csv_dashboard():
+@app.route('/generate-dashboard', methods=['POST'])
+@instrumented('generate-dashboard')
+def generate_dashboard():
     """
-    CSV-based dashboard generation endpoint:
-    1. Gets CSV data and prompt from frontend
-    2. Uses Perplexity AI to analyze the CSV data and generate insights
-    3. Returns dashboard with real, structured data from the CSV analysis
+    Enhanced dashboard generation endpoint:
+    1. Gets prompt from frontend
+    2. Uses Perplexity AI to research the topic and gather actual data
+    3. Returns dashboard with real, structured data ready for visualization
     """
     try:
         # Get JSON data from request
-        data = request.get_json()
+        started = time.perf_counter()
+        data = request.get_json(silent=True)
+        prompt, model, options = parse_prompt_request(data, request.args)
+        mode = data.get('mode', 'single')  # single or fanout
+        record_stage('generate-dashboard', 'parse_request', started)
         
-        if not data or 'prompt' not in data or 'csv_data' not in data:
-            return jsonify({"error": "Both prompt and CSV data are required"}), 400
+        # Serve repeated and paraphrased prompts from the response cache
+        cache_endpoint = dashboard_cache_endpoint(mode)
+        cached_body = cached_dashboard_body(cache_endpoint, prompt, model, options)
+        if cached_body is not None:
+            return jsonify(cached_body)
         
-        prompt = data['prompt']
-        csv_data = data['csv_data']
-        model = data.get('model', 'sonar-pro')
-        
-        if not prompt.strip():
-            return jsonify({"error": "Empty prompt provided"}), 400
+        if mode == 'fanout':
+            # Plan the widgets, then generate each one concurrently
+            dashboard_data = generate_fanout_dashboard(prompt, model)
+        else:
+            # Build the research request for Perplexity
+            started = time.perf_counter()
+            payload = build_dashboard_payload(prompt, model)
+            record_stage('generate-dashboard', 'build_prompt', started)
+            dashboard_data = call_routed(payload, 45, 'generate-dashboard', 'dashboard', finish_dashboard)
         
-        if not csv_data.strip():
-            return jsonify({"error": "Empty CSV data provided"}), 400
+        store_dashboard(cache_endpoint, prompt, model, dashboard_data)
+        return jsonify(dashboard_body(dashboard_data, options))
         
-        # Check if API key is configured
-        if not PERPLEXITY_API_KEY:
-            return jsonify({"error": "Perplexity API key not configured"}), 500
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/generate-dashboard/stream', methods=['POST'])
+@instrumented('generate-dashboard-stream')
+def generate_dashboard_stream():
+    """
+    Streaming dashboard generation endpoint:
+    1. Gets prompt from frontend
+    2. Streams the Perplexity completion and parses it incrementally
+    3. Sends each widget as a server-sent "widget" event as soon as it is complete,
+       then a final "dashboard" event with the full dashboard (or an "error" event)
+    """
+    # Get JSON data from request
+    started = time.perf_counter()
+    data = request.get_json(silent=True)
+    try:
+        prompt, model, options = parse_prompt_request(data, request.args)
+    except GenerationError as e:
+        return error_response(e)
+    record_stage('generate-dashboard-stream', 'parse_request', started)
+    
+    # Shares cache entries with /generate-dashboard
+    cached_dashboard, similar_prompt = get_cached_dashboard('generate-dashboard', prompt, model)
+    
+    # Take the upstream slot before the response starts so overload can still be a 503
+    slot = None
+    if cached_dashboard is None:
+        stream = DashboardStream(prompt, model, options)
+        try:
+            slot = upstream_admission.acquire(stream.route.model, endpoint_priority('generate-dashboard-stream'))
+        except Overloaded as e:
+            return error_response(e)
+    
+    def events():
+        if cached_dashboard is not None:
+            yield from cached_dashboard_events(cached_dashboard, similar_prompt, options)
+            return
         
-        # Limit CSV data size (first 5000 characters to avoid token limits)
-        csv_preview = csv_data[:5000] if len(csv_data) > 5000 else csv_data
+        try:
+            for kind, value in stream_chat_completion(stream.payload(), read_timeout=45):
+                yield from stream.feed(kind, value)
+            dashboard_data = stream.finish()
+            if dashboard_data is not None:
+                store_dashboard('generate-dashboard', prompt, model, dashboard_data)
+            yield stream.final_event(dashboard_data)
+        except Exception as e:
+            yield stream.error_event(e)
+    
+    response = Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if slot is not None:
+        # Runs when the stream ends or the client disconnects, even if it never started
+        response.call_on_close(slot.release)
+    return response
+
+def build_csv_dashboard_payload(prompt, csv_data, model):
+    """
+    Build the CSV dashboard request. Returns (payload, df) where df is the
+    parsed dataset when widgets can be computed from specs, or None. Raises
+    GenerationError on empty CSV text.
+    """
+    from csv_profile import CSV_PROMPT_TOKEN_BUDGET, truncate_to_budget
+    if not csv_data or not csv_data.strip():
+        raise GenerationError("Empty CSV data provided", 400)
+    # Parse the CSV locally so widget values are computed over every row
+    started = time.perf_counter()
+    df = try_load_dataframe(csv_data)
+    
+    if df is not None:
+        # Describe the columns instead of pasting the data; the model only returns widget specs
+        system_prompt = f"""You are a data analyst AI that designs dashboards for CSV data. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
+
+{describe_csv(csv_data, CSV_PROMPT_TOKEN_BUDGET)}
+
+Based on the CSV columns above and the user's request, create a JSON object with this exact structure:
+
+{{"dash_name": "Descriptive dashboard name", "category": "business" | "sales" | "finance" | "analytics" | "performance" | "other", "widgets": [{{"name": "Widget title", "type": "bar" | "line" | "number", "spec": SPEC, "source_url": "CSV Data Analysis"}}]}}
+
+{CSV_SPEC_RULES}
+
+Guidelines:
+- Create 3-4 relevant widgets that best represent the CSV data and answer the user's question
+- Do not compute any values yourself; each spec is evaluated over the full dataset
+- Use column names exactly as listed above
+- Choose appropriate chart types based on the data:
+  * "bar" for comparisons, categories, rankings
+  * "line" for time series, trends, sequential data
+  * "number" for key metrics, totals, averages, counts
+- Make widget names descriptive and specific to the CSV content
+- For source_url, always use "CSV Data Analysis"
+- Return compact JSON without any newlines, spaces, or formatting
+- Focus on the most interesting and relevant insights from the data
+
+User's question about the CSV: """
+    else:
+        # Limit CSV data size to the prompt token budget, cutting at a line boundary
+        csv_preview = truncate_to_budget(csv_data, CSV_PROMPT_TOKEN_BUDGET)
         
         # Enhanced system prompt for CSV analysis
         system_prompt = f"""You are a data analyst AI that analyzes CSV data and creates comprehensive dashboards. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
@@ -230,128 +923,120 @@ Guidelines:
 - Focus on the most interesting and relevant insights from the data
 
 User's question about the CSV: """
+    
+    full_prompt = system_prompt + prompt
+    
+    # Make request to Perplexity API
+    payload = {
+        'model': model,
+        'messages': [
+            {"role": "system", "content": "You are a data analyst that analyzes CSV data and provides structured JSON responses for dashboard creation."},
+            {"role": "user", "content": full_prompt}
+        ],
+        'max_tokens': 2000,
+        'temperature': 0.1  # Lower temperature for more consistent CSV analysis
+    }
+    record_stage('generate-csv-dashboard', 'build_prompt', started)
+    return payload, df
+
+def finish_csv_dashboard(status_code, response_data, df, model):
+    """
+    Turn a CSV dashboard completion into validated dashboard data, computing
+    spec-based widgets over df. Raises GenerationError on an unusable response.
+    """
+    if status_code != 200:
+        raise GenerationError(f"Perplexity API error: {status_code} - {response_data}")
+    
+    # Extract and parse the Perplexity response
+    dashboard_data = parse_ai_response(response_data, 'generate-csv-dashboard')
+    
+    # Validate the dashboard structure
+    if not isinstance(dashboard_data, dict) or 'widgets' not in dashboard_data:
+        raise GenerationError("Invalid dashboard structure from Perplexity AI")
+    mark_truncated(dashboard_data)
+    
+    # Add metadata
+    dashboard_data['generated_at'] = time.time()
+    dashboard_data['data_source'] = 'CSV Data Analysis'
+    dashboard_data['model_used'] = model
+    dashboard_data['csv_filename'] = 'uploaded_data.csv'  # Could be enhanced to get actual filename
+    
+    # Validate each widget has the correct data structure
+    started = time.perf_counter()
+    for widget in dashboard_data.get('widgets', []):
+        if df is not None:
+            apply_widget_spec(df, widget)
+        validate_widget(widget, 'generate-csv-dashboard')
         
-        full_prompt = system_prompt + prompt
-        
-        # Make request to Perplexity API
-        headers = {
-            'Authorization': f'Bearer {PERPLEXITY_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            'model': model,
-            'messages': [
-                {"role": "system", "content": "You are a data analyst that analyzes CSV data and provides structured JSON responses for dashboard creation."},
-                {"role": "user", "content": full_prompt}
-            ],
-            'max_tokens': 2000,
-            'temperature': 0.1  # Lower temperature for more consistent CSV analysis
-        }
-        
-        response = requests.post(
-            f'{PERPLEXITY_BASE_URL}/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=45
-        )
-        
-        if response.status_code != 200:
-            return jsonify({"error": f"Perplexity API error: {response.status_code} - {response.text}"}), 500
-        
-        # Extract and parse the Perplexity response
-        response_data = response.json()
-        ai_response = response_data['choices'][0]['message']['content']
-        
-        # Clean up the response (remove markdown formatting if present)
-        ai_response = ai_response.strip()
-        if ai_response.startswith('```json'):
-            ai_response = ai_response.replace('```json', '').replace('```', '').strip()
-        
-        try:
-            dashboard_data = json.loads(ai_response)
-        except json.JSONDecodeError as e:
-            return jsonify({"error": f"Invalid JSON response from Perplexity AI: {str(e)}", "raw_response": ai_response}), 500
-        
-        # Validate the dashboard structure
-        if not isinstance(dashboard_data, dict) or 'widgets' not in dashboard_data:
-            return jsonify({"error": "Invalid dashboard structure from Perplexity AI"}), 500
-        
-        # Add metadata
-        dashboard_data['generated_at'] = time.time()
-        dashboard_data['data_source'] = 'CSV Data Analysis'
-        dashboard_data['model_used'] = model
-        dashboard_data['csv_filename'] = 'uploaded_data.csv'  # Could be enhanced to get actual filename
-        
-        # Validate each widget has the correct data structure
-        for widget in dashboard_data.get('widgets', []):
-            if widget.get('type') == 'number':
-                if not isinstance(widget.get('data'), dict) or 'value' not in widget['data']:
-                    # Provide fallback structure for number widgets
-                    widget['data'] = {"value": 0, "label": "No data available"}
-            elif widget.get('type') in ['bar', 'line']:
-                if not isinstance(widget.get('data'), list):
-                    # Provide fallback structure for chart widgets
-                    widget['data'] = [{"name": "No data", "value": 0}]
-            
-            # Ensure source_url is set for CSV widgets
-            if 'source_url' not in widget:
-                widget['source_url'] = 'CSV Data Analysis'
-        
-        return jsonify({
-            "success": True,
-            "dashboard": dashboard_data,
-            "message": "Dashboard generated from CSV data analysis"
-        })
-        
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Network error connecting to Perplexity API: {str(e)}"}), 500
-    except KeyError as e:
-        return jsonify({"error": f"Unexpected response format from Perplexity API: {str(e)}"}), 500
-    except Exception as e:
-        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+        # Ensure source_url is set for CSV widgets
+        if 'source_url' not in widget:
+            widget['source_url'] = 'CSV Data Analysis'
+    record_stage('generate-csv-dashboard', 'validate', started)
+    return dashboard_data
 
-@app.route('/generate-single-widget', methods=['POST'])
-def generate_single_widget():
+@app.route('/generate-csv-dashboard', methods=['POST'])
+@instrumented('generate-csv-dashboard')
+def generate_csv_dashboard():
     """
-    Single widget generation endpoint for widget replacement:
-    1. Gets prompt from frontend for a specific widget
-    2. Uses Perplexity AI to research and generate data for just one widget
-    3. Returns single widget data ready for replacement
+    CSV-based dashboard generation endpoint:
+    1. Gets CSV data and prompt from frontend
+    2. Uses Perplexity AI to analyze the CSV data and generate insights
+    3. Returns dashboard with real, structured data from the CSV analysis
     """
     try:
         # Get JSON data from request
-        data = request.get_json()
-        
-        if not data or 'prompt' not in data:
-            return jsonify({"error": "No prompt provided"}), 400
-        
-        prompt = data['prompt']
-        model = data.get('model', 'sonar-pro')
-        widget_type = data.get('widget_type', 'auto')  # auto, bar, line, number
-        csv_data = data.get('csv_data')  # Optional CSV data
-        dashboard_context = data.get('dashboard_context', '')  # Dashboard context for maintaining topic
+        started = time.perf_counter()
+        data = request.get_json(silent=True)
+        prompt, model, options = parse_csv_dashboard_request(data, request.args)
+        # Prefer a previously uploaded dataset over inline CSV text
+        csv_data = request_csv_data(data)
+        record_stage('generate-csv-dashboard', 'parse_request', started)
         
-        if not prompt.strip():
-            return jsonify({"error": "Empty prompt provided"}), 400
+        payload, df = build_csv_dashboard_payload(prompt, csv_data, model)
         
-        # Check if API key is configured
-        if not PERPLEXITY_API_KEY:
-            return jsonify({"error": "Perplexity API key not configured"}), 500
+        dashboard_data = call_routed(
+            payload, 45, 'generate-csv-dashboard', 'dashboard',
+            lambda status_code, response_data, routed_model: finish_csv_dashboard(status_code, response_data, df, routed_model)
+        )
         
-        # Combine context with user prompt if context is available
-        if dashboard_context and not csv_data:
-            # For research-based widgets, prepend context to make the prompt more specific
-            contextual_prompt = f"For the topic '{dashboard_context}', show me {prompt}"
-        else:
-            contextual_prompt = prompt
+        return jsonify(dashboard_body(dashboard_data, options, "Dashboard generated from CSV data analysis"))
         
-        # System prompt for single widget generation
-        if csv_data:
-            # CSV-based widget generation
-            csv_preview = csv_data[:3000] if len(csv_data) > 3000 else csv_data
-            context_instruction = f"The dashboard is about: {dashboard_context}. " if dashboard_context else ""
-            system_prompt = f"""You are a data analyst AI that creates individual dashboard widgets from CSV data. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
+    except Exception as e:
+        return error_response(e)
+
+def build_widget_system_prompt(widget_type='auto', csv_data=None, df=None, dashboard_context=''):
+    """System prompt for single widget generation; df is the parsed csv_data when widgets are computed from specs"""
+    if csv_data:
+        from csv_profile import CSV_WIDGET_PROMPT_TOKEN_BUDGET, truncate_to_budget
+    
+    if df is not None:
+        # Spec-based CSV widget generation
+        context_instruction = f"The dashboard is about: {dashboard_context}. " if dashboard_context else ""
+        system_prompt = f"""You are a data analyst AI that creates individual dashboard widgets from CSV data. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
+
+{describe_csv(csv_data, CSV_WIDGET_PROMPT_TOKEN_BUDGET)}
+
+{context_instruction}Based on the CSV columns above and the user's request, create a JSON object for a SINGLE widget with this exact structure:
+
+{{"name": "Widget title", "type": "bar" | "line" | "number", "spec": SPEC, "source_url": "CSV Data Analysis"}}
+
+{CSV_SPEC_RULES}
+
+Guidelines:
+- Create ONE widget that best answers the user's specific question
+- Do not compute any values yourself; the spec is evaluated over the full dataset
+- Use column names exactly as listed above
+- {context_instruction}Focus on the specific aspect requested while maintaining relevance to the main topic
+- Choose the most appropriate chart type for the requested data
+- Make the widget name descriptive and specific
+- Return compact JSON without any newlines, spaces, or formatting
+
+User's widget request: """
+    elif csv_data:
+        # CSV-based widget generation
+        csv_preview = truncate_to_budget(csv_data, CSV_WIDGET_PROMPT_TOKEN_BUDGET)
+        context_instruction = f"The dashboard is about: {dashboard_context}. " if dashboard_context else ""
+        system_prompt = f"""You are a data analyst AI that creates individual dashboard widgets from CSV data. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
 
 Here is the CSV data to analyze:
 ```
@@ -377,14 +1062,14 @@ Guidelines:
 - Return compact JSON without any newlines, spaces, or formatting
 
 User's widget request: """
-        else:
-            # Regular research-based widget generation
-            widget_type_hint = ""
-            if widget_type != 'auto':
-                widget_type_hint = f"Use widget type: {widget_type}. "
-            
-            context_instruction = f"This widget is for a dashboard about: {dashboard_context}. " if dashboard_context else ""
-            system_prompt = f"""You are a data analyst AI that researches topics and creates individual dashboard widgets. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
+    else:
+        # Regular research-based widget generation
+        widget_type_hint = ""
+        if widget_type != 'auto':
+            widget_type_hint = f"Use widget type: {widget_type}. "
+        
+        context_instruction = f"This widget is for a dashboard about: {dashboard_context}. " if dashboard_context else ""
+        system_prompt = f"""You are a data analyst AI that researches topics and creates individual dashboard widgets. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
 
 {context_instruction}Research the given topic thoroughly and return a JSON object for a SINGLE widget with this exact structure:
 
@@ -411,17 +1096,53 @@ Guidelines:
 - Return compact JSON without any newlines, spaces, or formatting
 
 User's widget request: """
+    return system_prompt
+
+class WidgetContext:
+    """
+    What the widgets of one request share: the model, the parsed dataset and
+    the dashboard context. System prompts are built once per widget type, so
+    a batch of widgets doesn't rebuild (or re-profile the CSV for) each one.
+    """
+    
+    def __init__(self, model='sonar-pro', csv_data=None, dashboard_context='', endpoint='generate-single-widget'):
+        self.model = model
+        self.csv_data = csv_data
+        self.dashboard_context = dashboard_context
+        self.endpoint = endpoint
+        # Parse CSV data locally so the widget's values are computed over every row
+        started = time.perf_counter()
+        self.df = try_load_dataframe(csv_data) if csv_data else None
+        if csv_data:
+            record_stage(endpoint, 'parse_csv', started)
+        self._system_prompts = {}
+    
+    def system_prompt(self, widget_type='auto'):
+        # Only the research prompt mentions the widget type
+        key = None if self.csv_data else widget_type
+        if key not in self._system_prompts:
+            self._system_prompts[key] = build_widget_system_prompt(widget_type, self.csv_data, self.df, self.dashboard_context)
+        return self._system_prompts[key]
+    
+    def prepare(self, widget_types):
+        """Build the system prompts for these widget types now, before widgets are generated on other threads"""
+        for widget_type in set(widget_types):
+            self.system_prompt(widget_type)
+    
+    def payload(self, prompt, widget_type='auto'):
+        """The Perplexity request for one widget"""
+        started = time.perf_counter()
+        # Combine context with user prompt if context is available
+        if self.dashboard_context and not self.csv_data:
+            # For research-based widgets, prepend context to make the prompt more specific
+            contextual_prompt = f"For the topic '{self.dashboard_context}', show me {prompt}"
+        else:
+            contextual_prompt = prompt
         
-        full_prompt = system_prompt + contextual_prompt
-        
-        # Make request to Perplexity API
-        headers = {
-            'Authorization': f'Bearer {PERPLEXITY_API_KEY}',
-            'Content-Type': 'application/json'
-        }
+        full_prompt = self.system_prompt(widget_type) + contextual_prompt
         
         payload = {
-            'model': model,
+            'model': self.model,
             'messages': [
                 {"role": "system", "content": "You are a data research assistant that provides factual, current information in structured JSON format for individual dashboard widgets."},
                 {"role": "user", "content": full_prompt}
@@ -429,62 +1150,551 @@ User's widget request: """
             'max_tokens': 1000,
             'temperature': 0.2
         }
+        record_stage(self.endpoint, 'build_prompt', started)
+        return payload
+
+def finish_widget(status_code, response_data, df=None, csv_data=None, endpoint='generate-single-widget', model=None):
+    """
+    Turn a single-widget completion into validated widget data, computing it
+    from the spec when df is given, and noting the model it was generated on
+    as model_used. Raises GenerationError on an unusable response.
+    """
+    if status_code != 200:
+        raise GenerationError(f"Perplexity API error: {status_code} - {response_data}")
+    
+    # Extract and parse the Perplexity response
+    widget_data = parse_ai_response(response_data, endpoint)
+    
+    # Compute CSV widget data from the returned spec
+    started = time.perf_counter()
+    if df is not None and isinstance(widget_data, dict):
+        apply_widget_spec(df, widget_data)
+        if 'data' not in widget_data and 'spec_error' in widget_data:
+            raise GenerationError(f"Invalid widget spec from Perplexity AI: {widget_data['spec_error']}")
+    
+    # Validate the widget structure
+    required_fields = ['name', 'type', 'data']
+    if not isinstance(widget_data, dict) or not all(field in widget_data for field in required_fields):
+        raise GenerationError("Invalid widget structure from Perplexity AI")
+    
+    # Validate data structure based on type
+    validate_widget(widget_data, endpoint)
+    record_stage(endpoint, 'validate', started)
+    
+    # Ensure source_url is present
+    if 'source_url' not in widget_data:
+        widget_data['source_url'] = 'CSV Data Analysis' if csv_data else 'AI Research'
+    if model:
+        widget_data['model_used'] = model
+    return widget_data
+
+def widget_cache_key(prompt, model, widget_type, csv_data, dashboard_context):
+    """
+    Response cache key for a widget request, or None when it can't be cached
+    (CSV-backed widgets depend on the uploaded data, so they are not cached).
+    """
+    if response_cache is None or csv_data:
+        return None
+    return make_cache_key('generate-single-widget', prompt, model, widget_type, dashboard_context)
+
+def widget_cacheable(widget_data):
+    """Whether a generated widget may be cached; one closed from truncated output may be missing data"""
+    return 'truncated' not in widget_data.get('json_repairs', ())
+
+def generate_widget(prompt, model='sonar-pro', widget_type='auto', csv_data=None, dashboard_context='', read_timeout=30, endpoint='generate-single-widget', context=None, refresh=False):
+    """
+    Generate a single widget with Perplexity AI, reusing context (a
+    WidgetContext for the same model, data and dashboard) when given.
+    With refresh, a cached result is ignored (and replaced) rather than served.
+    Returns (widget_data, cached) and raises GenerationError when the
+    upstream response can't be turned into a widget.
+    """
+    # Serve repeated research widget requests from the response cache
+    cache_key = widget_cache_key(prompt, model, widget_type, csv_data, dashboard_context)
+    if cache_key is not None and not refresh:
+        cached_widget = response_cache.get(cache_key)
+        if cached_widget is not None:
+            return cached_widget, True
+    
+    if context is None:
+        context = WidgetContext(model, csv_data, dashboard_context, endpoint)
+    payload = context.payload(prompt, widget_type)
+    widget_data = call_routed(
+        payload, read_timeout, endpoint, 'csv' if csv_data else widget_type,
+        lambda status_code, response_data, routed_model: finish_widget(
+            status_code, response_data, context.df, csv_data, endpoint, routed_model)
+    )
+    
+    if cache_key is not None and widget_cacheable(widget_data):
+        response_cache.set(cache_key, widget_data)
+    
+    return widget_data, False
+
+# Fan-out dashboard generation settings. The pool has room for every request
+# thread's widgets at once, so one fan-out never queues behind another's
+FANOUT_MAX_WIDGETS = 4
+FANOUT_MAX_WORKERS = int(os.getenv('FANOUT_MAX_WORKERS', str(int(os.getenv('WEB_THREADS', '8')) * FANOUT_MAX_WIDGETS)))
+FANOUT_WIDGET_TIMEOUT = float(os.getenv('FANOUT_WIDGET_TIMEOUT', '30'))
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix='fanout')
+
+def run_with_deadlines(executor, calls, timeout, max_running=None):
+    """
+    Run calls, a list of (key, zero-argument callable), on executor and yield
+    (key, outcome) as each finishes, where outcome is the call's result or the
+    exception it raised. Each call gets timeout seconds from when a worker
+    starts it, so time spent queued behind other requests doesn't count
+    against it; a call still queued after timeout seconds is cancelled. Calls
+    past their deadline come back as a TimeoutError, and closing the generator
+    early cancels the calls that haven't started. With max_running, at most
+    that many calls are on the executor at once and the rest wait their turn.
+    """
+    waiting = list(reversed(calls))
+    futures = {}
+    submitted = {}
+    started = {}
+    pending = set()
+    
+    def run(key, call):
+        started[key] = time.monotonic()
+        return call()
+    
+    def submit_waiting():
+        while waiting and (max_running is None or len(pending) < max_running):
+            key, call = waiting.pop()
+            submitted[key] = time.monotonic()
+            future = executor.submit(run, key, call)
+            futures[future] = key
+            pending.add(future)
+    
+    def deadline(future):
+        key = futures[future]
+        return started.get(key, submitted[key]) + timeout
+    
+    try:
+        submit_waiting()
+        while pending:
+            now = time.monotonic()
+            for future in [future for future in pending if not future.done() and deadline(future) <= now]:
+                key = futures[future]
+                if key in started:
+                    pending.discard(future)
+                    yield key, TimeoutError(f"no result within {timeout:g}s")
+                elif future.cancel():
+                    pending.discard(future)
+                    yield key, TimeoutError(f"not started within {timeout:g}s")
+                else:
+                    # Picked up by a worker just now; its deadline runs from here
+                    started.setdefault(key, now)
+            submit_waiting()
+            if not pending:
+                break
+            next_deadline = min(deadline(future) for future in pending)
+            done, _ = wait(pending, timeout=max(0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = e
+                yield futures[future], outcome
+            submit_waiting()
+    finally:
+        for future in pending:
+            future.cancel()
+
+# Planning prompt: picks the widgets without researching their data
+DASHBOARD_PLAN_PROMPT = """You are a data analyst AI that plans research dashboards. You must respond ONLY with valid JSON on a single line without any newlines or formatting.
+
+Do not research or include any data yet. Plan the dashboard for the given topic and return a JSON object with this exact structure:
+
+{"dash_name": "Descriptive dashboard name", "category": "sports" | "business" | "entertainment" | "technology" | "science" | "finance" | "health" | "education" | "other", "widgets": [{"prompt": "Specific description of the data this widget should show", "type": "bar" | "line" | "number"}]}
+
+Guidelines:
+- Plan 3-4 relevant widgets that best represent the topic
+- Each widget prompt must be specific enough to research on its own
+- Choose appropriate chart types:
+  * "bar" for comparisons (stats, rankings, categories)
+  * "line" for trends over time (years, seasons, periods)
+  * "number" for single key metrics (totals, averages, records)
+- Return compact JSON without any newlines, spaces, or formatting
+
+User topic: """
+
+def build_plan_payload(prompt, model):
+    """Build the planning request for fan-out dashboards"""
+    return {
+        'model': model,
+        'messages': [
+            {"role": "system", "content": "You are a data research assistant that plans dashboards in structured JSON format."},
+            {"role": "user", "content": DASHBOARD_PLAN_PROMPT + prompt}
+        ],
+        'max_tokens': 300,
+        'temperature': 0.2
+    }
+
+def parse_dashboard_plan(status_code, response_data, prompt):
+    """
+    Turn a planning completion into (plan, widget_specs), where widget_specs is
+    a list of (index, spec) for the widgets to generate.
+    """
+    if status_code != 200:
+        raise GenerationError(f"Perplexity API error: {status_code} - {response_data}")
+    
+    plan = parse_ai_response(response_data, 'generate-dashboard')
+    specs = plan.get('widgets') if isinstance(plan, dict) else None
+    if not isinstance(specs, list) or not specs:
+        raise GenerationError("Invalid dashboard plan from Perplexity AI")
+    
+    plan['dash_name'] = plan.get('dash_name') or prompt
+    widget_specs = [
+        (index, spec) for index, spec in enumerate(specs[:FANOUT_MAX_WIDGETS])
+        if isinstance(spec, dict) and spec.get('prompt')
+    ]
+    return plan, widget_specs
+
+def assemble_fanout_dashboard(plan, outcomes, model):
+    """
+    Build the dashboard from each planned widget's outcome, given as
+    ((index, widget_prompt), outcome) where outcome is generate_widget's result
+    or the exception it raised. Raises when no widget succeeded.
+    """
+    widgets = {}
+    failed_widgets = []
+    overloaded = None
+    for (index, widget_prompt), outcome in outcomes:
+        if isinstance(outcome, Exception):
+            if isinstance(outcome, Overloaded):
+                overloaded = outcome
+            error = "Timed out generating widget" if isinstance(outcome, TimeoutError) else str(outcome)
+            failed_widgets.append({"index": index, "prompt": widget_prompt, "error": error})
+        else:
+            widgets[index] = dict(outcome[0], prompt=widget_prompt)
+    
+    if not widgets:
+        if overloaded is not None:
+            raise overloaded
+        raise GenerationError("All widgets failed to generate")
+    
+    dashboard_data = {
+        "dash_name": plan['dash_name'],
+        "category": plan.get('category', 'other'),
+        "widgets": [widgets[index] for index in sorted(widgets)],
+        "generated_at": time.time(),
+        "data_source": 'Perplexity AI Research',
+        "model_used": model,
+        "generation_mode": 'fanout',
+        "partial": bool(failed_widgets)
+    }
+    if failed_widgets:
+        dashboard_data['failed_widgets'] = sorted(failed_widgets, key=lambda failure: failure['index'])
+    return dashboard_data
+
+def generate_fanout_dashboard(prompt, model):
+    """
+    Generate a dashboard with one cheap planning call followed by concurrent
+    single-widget generations. Widgets that fail or time out are dropped and
+    reported in failed_widgets, so a dashboard can come back partial.
+    """
+    payload = build_plan_payload(prompt, model)
+    plan, widget_specs = call_routed(
+        payload, FANOUT_WIDGET_TIMEOUT, 'generate-dashboard', 'plan',
+        lambda status_code, response_data, routed_model: parse_dashboard_plan(status_code, response_data, prompt)
+    )
+    context = WidgetContext(model, None, plan['dash_name'], 'generate-dashboard')
+    context.prepare(spec.get('type', 'auto') for _, spec in widget_specs)
+    
+    calls = [
+        ((index, spec['prompt']), partial(
+            generate_widget, spec['prompt'], model, spec.get('type', 'auto'), None, plan['dash_name'], FANOUT_WIDGET_TIMEOUT,
+            'generate-dashboard', context
+        ))
+        for index, spec in widget_specs
+    ]
+    
+    # Collect widgets as they finish; the slowest widget bounds the wall-clock time
+    return assemble_fanout_dashboard(plan, run_with_deadlines(fanout_executor, calls, FANOUT_WIDGET_TIMEOUT), model)
+
+@app.route('/generate-single-widget', methods=['POST'])
+@instrumented('generate-single-widget')
+def generate_single_widget():
+    """
+    Single widget generation endpoint for widget replacement:
+    1. Gets prompt from frontend for a specific widget
+    2. Uses Perplexity AI to research and generate data for just one widget
+    3. Returns single widget data ready for replacement
+    """
+    try:
+        # Get JSON data from request
+        started = time.perf_counter()
+        data = request.get_json(silent=True)
+        prompt, model, options = parse_prompt_request(data, request.args)
+        widget_type = data.get('widget_type', 'auto')  # auto, bar, line, number
+        csv_data = request_csv_data(data)  # Optional CSV data, inline or a previously uploaded dataset
+        dashboard_context = data.get('dashboard_context', '')  # Dashboard context for maintaining topic
+        record_stage('generate-single-widget', 'parse_request', started)
         
-        response = requests.post(
-            f'{PERPLEXITY_BASE_URL}/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        
-        if response.status_code != 200:
-            return jsonify({"error": f"Perplexity API error: {response.status_code} - {response.text}"}), 500
-        
-        # Extract and parse the Perplexity response
-        response_data = response.json()
-        ai_response = response_data['choices'][0]['message']['content']
-        
-        # Clean up the response (remove markdown formatting if present)
-        ai_response = ai_response.strip()
-        if ai_response.startswith('```json'):
-            ai_response = ai_response.replace('```json', '').replace('```', '').strip()
-        
-        try:
-            widget_data = json.loads(ai_response)
-        except json.JSONDecodeError as e:
-            return jsonify({"error": f"Invalid JSON response from Perplexity AI: {str(e)}", "raw_response": ai_response}), 500
+        widget_data, cached = generate_widget(prompt, model, widget_type, csv_data, dashboard_context)
+        return jsonify(widget_body(widget_data, cached, options))
         
-        # Validate the widget structure
-        required_fields = ['name', 'type', 'data']
-        if not isinstance(widget_data, dict) or not all(field in widget_data for field in required_fields):
-            return jsonify({"error": "Invalid widget structure from Perplexity AI"}), 500
+    except Exception as e:
+        return error_response(e)
+
+# Batch widget generation settings
+WIDGET_BATCH_MAX_ITEMS = int(os.getenv('WIDGET_BATCH_MAX_ITEMS', '12'))
+WIDGET_BATCH_TIMEOUT = float(os.getenv('WIDGET_BATCH_TIMEOUT', '60'))
+# Batches run on a pool of their own, apart from fan-out dashboards, and each
+# runs at most WIDGET_BATCH_CONCURRENCY widgets at once so one large batch
+# can't hold every worker
+WIDGET_BATCH_CONCURRENCY = int(os.getenv('WIDGET_BATCH_CONCURRENCY', '4'))
+WIDGET_BATCH_MAX_WORKERS = int(os.getenv(
+    'WIDGET_BATCH_MAX_WORKERS', str(int(os.getenv('WEB_THREADS', '8')) * WIDGET_BATCH_CONCURRENCY)))
+batch_executor = ThreadPoolExecutor(max_workers=WIDGET_BATCH_MAX_WORKERS, thread_name_prefix='batch')
+
+def parse_widget_batch(data):
+    """
+    Validate a batch request body and return its widgets as a list of
+    (index, item). Raises GenerationError with a 400 status on a bad batch.
+    """
+    items = data.get('widgets') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise GenerationError("No widgets provided", 400)
+    if len(items) > WIDGET_BATCH_MAX_ITEMS:
+        raise GenerationError(f"Too many widgets in one batch (at most {WIDGET_BATCH_MAX_ITEMS})", 400)
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('prompt'), str) or not item['prompt'].strip():
+            raise GenerationError(f"Widget {index} has no prompt", 400)
+    return list(enumerate(items))
+
+def parse_batch_request(data, args):
+    """(items, options) for a batch request body, as parse_widget_batch and series_options give them"""
+    items = parse_widget_batch(data)
+    require_api_key()
+    return items, series_options(data, args)
+
+def widget_batch_result(index, item, outcome, describe=describe_error):
+    """A batch item's result; outcome is (widget_data, cached) or the exception its generation raised"""
+    result = {"index": index}
+    if 'id' in item:
+        # Echoed back so clients can match results to their widgets
+        result['id'] = item['id']
+    if isinstance(outcome, Exception):
+        body, status_code = describe(outcome)
+        result.update(status='error', status_code=status_code, **body)
+    else:
+        widget_data, cached = outcome
+        result.update(status='success', widget=widget_data, cached=cached)
+    return result
+
+def widget_batch_response_status(results):
+    """
+    HTTP status and headers for a finished batch: 200 with per-item statuses,
+    unless every widget was turned away by admission control
+    """
+    if any(result['status'] == 'success' for result in results) or not all('retry_after' in result for result in results):
+        return 200, {}
+    retry_after = min(result['retry_after'] for result in results)
+    return 503, {'Retry-After': str(retry_after)}
+
+def widget_batch_body(results, options):
+    """(body, status_code, headers) for a finished batch, with its results in request order"""
+    results = sorted(results, key=lambda result: result['index'])
+    succeeded = sum(result['status'] == 'success' for result in results)
+    status_code, headers = widget_batch_response_status(results)
+    return {
+        "success": succeeded > 0,
+        "results": [shape_batch_result(result, options) for result in results],
+        "message": f"Generated {succeeded} of {len(results)} widgets"
+    }, status_code, headers
+
+def batch_done_event(succeeded, total):
+    """The event ending a streamed batch"""
+    return sse_event('done', {"succeeded": succeeded, "failed": total - succeeded})
+
+def generate_widget_batch(items, context, refresh=False):
+    """
+    Generate a batch's widgets concurrently on the batch pool, yielding each
+    item's result as it finishes; an item gets WIDGET_BATCH_TIMEOUT from when
+    it starts before it comes back as a timeout.
+    """
+    context.prepare(item.get('widget_type', 'auto') for _, item in items)
+    calls = [
+        (index, partial(
+            generate_widget, item['prompt'], context.model, item.get('widget_type', 'auto'), context.csv_data,
+            context.dashboard_context, endpoint=context.endpoint, context=context, refresh=refresh
+        ))
+        for index, item in items
+    ]
+    items_by_index = dict(items)
+    for index, outcome in run_with_deadlines(batch_executor, calls, WIDGET_BATCH_TIMEOUT, WIDGET_BATCH_CONCURRENCY):
+        yield widget_batch_result(index, items_by_index[index], outcome)
+
+def widget_batch_context(data, endpoint):
+    """The WidgetContext shared by a batch request's widgets, loading its dataset if it names one"""
+    return WidgetContext(data.get('model', 'sonar-pro'), request_csv_data(data), data.get('dashboard_context', ''), endpoint)
+
+@app.route('/generate-widgets', methods=['POST'])
+@instrumented('generate-widgets')
+def generate_widgets():
+    """
+    Batch widget generation: regenerates several widgets of one dashboard in a
+    single round trip. The widgets share one model, dataset and dashboard
+    context, are generated concurrently, and each gets its own status.
+    """
+    try:
+        started = time.perf_counter()
+        data = request.get_json(silent=True)
+        items, options = parse_batch_request(data, request.args)
+        context = widget_batch_context(data, 'generate-widgets')
+        record_stage('generate-widgets', 'parse_request', started)
         
-        # Validate data structure based on type
-        widget_type = widget_data.get('type')
-        if widget_type == 'number':
-            if not isinstance(widget_data.get('data'), dict) or 'value' not in widget_data['data']:
-                widget_data['data'] = {"value": 0, "label": "No data available"}
-        elif widget_type in ['bar', 'line']:
-            if not isinstance(widget_data.get('data'), list):
-                widget_data['data'] = [{"name": "No data", "value": 0}]
+        body, status_code, headers = widget_batch_body(generate_widget_batch(items, context), options)
+        return jsonify(body), status_code, headers
         
-        # Ensure source_url is present
-        if 'source_url' not in widget_data:
-            widget_data['source_url'] = 'CSV Data Analysis' if csv_data else 'AI Research'
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/generate-widgets/stream', methods=['POST'])
+@instrumented('generate-widgets-stream')
+def generate_widgets_stream():
+    """
+    Streaming batch widget generation over Server-Sent Events: a `widget`
+    event with each item's result as soon as it finishes, then `done`.
+    """
+    started = time.perf_counter()
+    data = request.get_json(silent=True)
+    try:
+        items, options = parse_batch_request(data, request.args)
+        context = widget_batch_context(data, 'generate-widgets-stream')
+    except Exception as e:
+        return error_response(e)
+    record_stage('generate-widgets-stream', 'parse_request', started)
+    
+    def events():
+        succeeded = 0
+        for result in generate_widget_batch(items, context):
+            succeeded += result['status'] == 'success'
+            yield sse_event('widget', shape_batch_result(result, options))
+        yield batch_done_event(succeeded, len(items))
+    
+    return Response(
+        events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def load_dashboard(dashboard_id):
+    """The stored dashboard and its ETag, raising DashboardError when there isn't one"""
+    if dashboard_store is None:
+        raise DashboardError("Dashboard storage is disabled", 404)
+    return dashboard_store.load(dashboard_id)
+
+def refresh_items(dashboard, force=False):
+    """A stored dashboard's stale widgets (every widget with force) as batch items for generate_widget_batch"""
+    return [
+        (index, {"prompt": dashboard['widgets'][index]['prompt'], "widget_type": dashboard['widgets'][index].get('type', 'auto')})
+        for index in stale_widgets(dashboard, force=force)
+    ]
 
+def refresh_request_items(dashboard, etag, data, options, if_none_match):
+    """
+    The batch items a refresh request regenerates, or None when nothing is
+    stale and If-None-Match names the stored version, so the answer is a 304
+    """
+    items = refresh_items(dashboard, data.get('force', False))
+    if not items and etag_matches(if_none_match, series_etag(etag, *options)):
+        return None
+    if items:
+        require_api_key()
+    return items
+
+def refresh_context(dashboard):
+    """The WidgetContext a stored dashboard's widgets are regenerated with"""
+    return WidgetContext(dashboard.get('model_used', 'sonar-pro'), None, dashboard.get('dash_name', ''), 'refresh-dashboard')
+
+def finish_refresh(dashboard, results):
+    """
+    Swap the regenerated widgets into a stored dashboard and save it; widgets
+    that failed keep their old data. Returns (body, etag, status_code, headers).
+    """
+    refreshed = []
+    failed_widgets = []
+    for result in sorted(results, key=lambda result: result['index']):
+        index = result['index']
+        if result['status'] == 'success':
+            dashboard['widgets'][index] = stamp_widget(result['widget'], dashboard['widgets'][index]['prompt'])
+            refreshed.append(index)
+        else:
+            failed_widgets.append({"index": index, "prompt": dashboard['widgets'][index]['prompt'], "error": result['error']})
+    
+    if refreshed:
+        dashboard['refreshed_at'] = time.time()
+        etag = dashboard_store.save(dashboard)
+    else:
+        etag = None
+    status_code, headers = widget_batch_response_status(results) if results else (200, {})
+    body = {
+        "success": not failed_widgets,
+        "dashboard": dashboard,
+        "refreshed": refreshed,
+        "message": f"Refreshed {len(refreshed)} of {len(results)} stale widgets"
+    }
+    if failed_widgets:
+        body['failed_widgets'] = failed_widgets
+    return body, etag, status_code, headers
+
+def revalidation_headers(etag, options):
+    """Headers letting clients revalidate a stored dashboard, shaped by options, with If-None-Match"""
+    return {'ETag': series_etag(etag, *options), 'Cache-Control': 'no-cache'}
+
+def stored_dashboard_body(body, etag, options, headers=None):
+    """(body, headers) for a stored dashboard's response, with its series shaped by options"""
+    return dict(body, dashboard=shape_dashboard(body['dashboard'], *options)), {**(headers or {}), **revalidation_headers(etag, options)}
+
+def dashboard_response(body, etag, options, status_code=200, headers=None):
+    body, headers = stored_dashboard_body(body, etag, options, headers)
+    return jsonify(body), status_code, headers
+
+def not_modified_response(etag, options):
+    return Response(status=304, headers=revalidation_headers(etag, options))
+
+@app.route('/dashboards/<dashboard_id>', methods=['GET'])
+def get_dashboard(dashboard_id):
+    """A stored dashboard, or 304 with no body when If-None-Match names its current version"""
+    try:
+        options = series_options(None, request.args)
+        dashboard, etag = load_dashboard(dashboard_id)
+        if etag_matches(request.headers.get('If-None-Match'), series_etag(etag, *options)):
+            return not_modified_response(etag, options)
+        return dashboard_response({"success": True, "dashboard": dashboard}, etag, options)
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/dashboards/<dashboard_id>/refresh', methods=['POST'])
+@instrumented('refresh-dashboard')
+def refresh_dashboard(dashboard_id):
+    """
+    Incremental dashboard refresh:
+    1. Loads a stored dashboard and finds the widgets past their TTL (all of them with "force")
+    2. Regenerates just those, concurrently, through the single-widget path
+    3. Returns 304 with no body when nothing was stale and If-None-Match names the stored version
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        options = series_options(data, request.args)
+        dashboard, etag = load_dashboard(dashboard_id)
+        items = refresh_request_items(dashboard, etag, data, options, request.headers.get('If-None-Match'))
+        if items is None:
+            return not_modified_response(etag, options)
         
-        return jsonify({
-            "success": True,
-            "widget": widget_data,
-            "message": "Single widget generated successfully"
-        })
+        # Two clients refreshing the same dashboard share the upstream calls; the last save wins
+        results = list(generate_widget_batch(items, refresh_context(dashboard), refresh=True)) if items else []
+        body, new_etag, status_code, headers = finish_refresh(dashboard, results)
+        return dashboard_response(body, new_etag or etag, options, status_code, headers)
         
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Network error connecting to Perplexity API: {str(e)}"}), 500
-    except KeyError as e:
-        return jsonify({"error": f"Unexpected response format from Perplexity API: {str(e)}"}), 500
     except Exception as e:
-        return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+        return error_response(e)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8000) 
\ No newline at end of file
+    # Local development only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(debug=os.getenv('FLASK_DEBUG', 'true').lower() == 'true', host='0.0.0.0',
+            port=int(os.getenv('PORT', '8000')))
\ No newline at end of file
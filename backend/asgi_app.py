@@ -0,0 +1,509 @@
+# Async serving mode: the /generate-* routes run as coroutines with a pooled async
+# HTTP client, so a generation waiting on Perplexity holds a socket rather than a
+# thread. Every other route is served by the Flask app.
+#
+# Run with: uvicorn asgi_app:application --host 0.0.0.0 --port 8000
+import asyncio
+import contextlib
+import inspect
+import json
+import time
+
+import aiohttp
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask, BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from admission import Overloaded, upstream_admission
+from app import (
+    ALLOWED_ORIGINS, FANOUT_WIDGET_TIMEOUT, MAX_REQUEST_BYTES, SINGLEFLIGHT_WAIT_TIMEOUT, WIDGET_BATCH_TIMEOUT,
+    DashboardStream, GenerationError, WidgetContext, app as flask_app, assemble_fanout_dashboard, batch_done_event,
+    build_csv_dashboard_payload, build_dashboard_payload, build_plan_payload, cached_dashboard_body, cached_dashboard_events,
+    dashboard_body, dashboard_cache_endpoint, describe_error, endpoint_priority, error_headers, finish_csv_dashboard,
+    finish_dashboard, finish_refresh, finish_widget, get_cached_dashboard, load_dashboard, next_route, parse_batch_request,
+    parse_csv_dashboard_request, parse_dashboard_plan, parse_prompt_request, refresh_context, refresh_request_items,
+    request_model, request_too_large_body, revalidation_headers, series_options, shape_batch_result, sse_event,
+    store_dashboard, stored_dashboard_body, widget_batch_body, widget_batch_result, widget_body, widget_cache_key,
+    widget_cacheable
+)
+from compression import CompressionMiddleware
+from dataset_store import dataset_store
+from model_router import model_router
+from metrics import REQUESTS, REQUEST_SECONDS, record_stage, record_usage
+from perplexity_async import async_post_chat_completion, async_stream_chat_completion, close_async_session
+from response_cache import response_cache
+from singleflight import AsyncSingleFlight, payload_key
+
+upstream_flight = AsyncSingleFlight()
+
+
+async def call_perplexity(payload, read_timeout, endpoint=''):
+    """Async counterpart of app.call_perplexity, returning (status_code, data, led)"""
+    led = False
+
+    async def fetch():
+        nonlocal led
+        led = True
+        slot = await upstream_admission.acquire_async(payload.get('model', ''), endpoint_priority(endpoint))
+        with slot:
+            status_code, text = await async_post_chat_completion(payload, read_timeout=read_timeout)
+        if status_code != 200:
+            return status_code, text
+        response_data = json.loads(text)
+        record_usage(endpoint, payload.get('model', ''), response_data.get('usage'))
+        return status_code, response_data
+
+    status_code, data = await upstream_flight.do(payload_key(payload), fetch, timeout=SINGLEFLIGHT_WAIT_TIMEOUT)
+    return status_code, data, led
+
+
+async def call_routed(payload, read_timeout, endpoint, kind, finish):
+    """Async counterpart of app.call_routed; finish may return an awaitable"""
+    route = model_router.route(endpoint, kind, payload)
+    fallback = None
+    while True:
+        started = time.perf_counter()
+        try:
+            status_code, response_data, led = await call_perplexity(route.apply(payload), read_timeout, endpoint)
+        except Exception:
+            if fallback is None:
+                raise
+            return fallback
+        result = error = None
+        try:
+            result = finish(status_code, response_data, route.model)
+            if inspect.isawaitable(result):
+                result = await result
+        except GenerationError as e:
+            error = e
+        route = next_route(route, status_code, response_data, result, error, started, led)
+        if route is None:
+            if error is None:
+                return result
+            if fallback is not None:
+                return fallback
+            raise error
+        if error is None:
+            fallback = result
+
+
+async def cache_get(key):
+    # The disk tier is SQLite, so lookups stay off the event loop
+    if response_cache is None:
+        return None
+    return await run_in_threadpool(response_cache.get, key)
+
+
+async def cache_set(key, value):
+    if response_cache is not None:
+        await run_in_threadpool(response_cache.set, key, value)
+
+
+async def read_json(request):
+    """The request's JSON body, or None if it is missing or malformed"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def describe_async_error(e):
+    """app.describe_error, plus the async client's network errors"""
+    if isinstance(e, aiohttp.ClientError):
+        return {"error": f"Network error connecting to Perplexity API: {str(e)}"}, 500
+    return describe_error(e)
+
+
+def error_response(e):
+    """Map an exception from a generation to the same response the Flask routes give"""
+    body, status_code = describe_async_error(e)
+    return JSONResponse(body, status_code=status_code, headers=error_headers(e))
+
+
+def instrumented(endpoint):
+    """Async counterpart of app.instrumented"""
+    def decorator(handler):
+        async def wrapper(request):
+            started = time.perf_counter()
+            response = await handler(request)
+            if response.status_code < 400:
+                outcome = 'success'
+            elif response.status_code < 500:
+                outcome = 'client_error'
+            else:
+                outcome = 'error'
+            model = getattr(request.state, 'model', '')
+            recorded = False
+
+            def record():
+                nonlocal recorded
+                if not recorded:
+                    recorded = True
+                    REQUESTS.inc(endpoint=endpoint, model=model, outcome=outcome)
+                    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+            if isinstance(response, StreamingResponse):
+                record_on_close(response, record)
+            else:
+                record()
+            return response
+        return wrapper
+    return decorator
+
+
+def record_on_close(response, record):
+    """
+    Call record when a streaming response's body ends or the client disconnects,
+    or after the response if its body never started; record must be idempotent
+    """
+    body = response.body_iterator
+
+    async def timed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            record()
+
+    response.body_iterator = timed_body()
+    tasks = BackgroundTasks([response.background] if response.background is not None else [])
+    tasks.add_task(record)
+    response.background = tasks
+
+
+async def generate_widget(prompt, model='sonar-pro', widget_type='auto', csv_data=None, dashboard_context='',
+                          read_timeout=30, endpoint='generate-single-widget', context=None, refresh=False):
+    """Async counterpart of app.generate_widget, returning (widget_data, cached)"""
+    cache_key = widget_cache_key(prompt, model, widget_type, csv_data, dashboard_context)
+    if cache_key is not None and not refresh:
+        cached_widget = await cache_get(cache_key)
+        if cached_widget is not None:
+            return cached_widget, True
+
+    if context is None:
+        context = await new_widget_context(model, csv_data, dashboard_context, endpoint, [widget_type])
+    payload = context.payload(prompt, widget_type)
+
+    def finish(status_code, response_data, routed_model):
+        if context.df is not None:
+            return run_in_threadpool(finish_widget, status_code, response_data, context.df, csv_data, endpoint,
+                                     routed_model)
+        return finish_widget(status_code, response_data, context.df, csv_data, endpoint, routed_model)
+
+    widget_data = await call_routed(payload, read_timeout, endpoint, 'csv' if csv_data else widget_type, finish)
+
+    if cache_key is not None and widget_cacheable(widget_data):
+        await cache_set(cache_key, widget_data)
+    return widget_data, False
+
+
+async def new_widget_context(model, csv_data, dashboard_context, endpoint, widget_types):
+    """A WidgetContext with the system prompts for widget_types already built"""
+    def build():
+        context = WidgetContext(model, csv_data, dashboard_context, endpoint)
+        context.prepare(widget_types)
+        return context
+
+    if csv_data:
+        # Parsing and profiling the CSV is CPU work, so it runs in the thread pool
+        return await run_in_threadpool(build)
+    return build()
+
+
+async def generate_widget_batch(items, context, refresh=False):
+    """Async counterpart of app.generate_widget_batch, yielding each item's result as it finishes"""
+    async def generate(index, item):
+        try:
+            outcome = await asyncio.wait_for(
+                generate_widget(item['prompt'], context.model, item.get('widget_type', 'auto'), context.csv_data,
+                                context.dashboard_context, endpoint=context.endpoint, context=context,
+                                refresh=refresh),
+                WIDGET_BATCH_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            outcome = TimeoutError(f"no result within {WIDGET_BATCH_TIMEOUT:g}s")
+        except Exception as e:
+            outcome = e
+        return widget_batch_result(index, item, outcome, describe_async_error)
+
+    for result in asyncio.as_completed([generate(index, item) for index, item in items]):
+        yield await result
+
+
+async def load_csv_data(data):
+    """Async counterpart of app.request_csv_data"""
+    if data.get('dataset_id'):
+        return await run_in_threadpool(dataset_store.load, data['dataset_id'])
+    return data.get('csv_data')
+
+
+async def batch_widget_context(data, items, endpoint):
+    """The shared WidgetContext for a batch request, loading its dataset if it names one"""
+    return await new_widget_context(data.get('model', 'sonar-pro'), await load_csv_data(data),
+                                    data.get('dashboard_context', ''), endpoint,
+                                    [item.get('widget_type', 'auto') for _, item in items])
+
+
+async def generate_fanout_dashboard(prompt, model):
+    """Async counterpart of app.generate_fanout_dashboard"""
+    payload = build_plan_payload(prompt, model)
+    plan, widget_specs = await call_routed(
+        payload, FANOUT_WIDGET_TIMEOUT, 'generate-dashboard', 'plan',
+        lambda status_code, response_data, routed_model: parse_dashboard_plan(status_code, response_data, prompt)
+    )
+    context = await new_widget_context(model, None, plan['dash_name'], 'generate-dashboard',
+                                       [spec.get('type', 'auto') for _, spec in widget_specs])
+
+    results = await asyncio.gather(*[
+        asyncio.wait_for(
+            generate_widget(spec['prompt'], model, spec.get('type', 'auto'), None, plan['dash_name'],
+                            FANOUT_WIDGET_TIMEOUT, 'generate-dashboard', context),
+            FANOUT_WIDGET_TIMEOUT
+        )
+        for _, spec in widget_specs
+    ], return_exceptions=True)
+    return assemble_fanout_dashboard(plan, zip([(index, spec['prompt']) for index, spec in widget_specs], results), model)
+
+
+@instrumented('generate-dashboard')
+async def generate_dashboard(request):
+    started = time.perf_counter()
+    data = await read_json(request)
+    request.state.model = request_model(data)
+    try:
+        prompt, model, options = parse_prompt_request(data, request.query_params)
+        mode = data.get('mode', 'single')  # single or fanout
+        record_stage('generate-dashboard', 'parse_request', started)
+
+        cache_endpoint = dashboard_cache_endpoint(mode)
+        cached_body = await run_in_threadpool(cached_dashboard_body, cache_endpoint, prompt, model, options)
+        if cached_body is not None:
+            return JSONResponse(cached_body)
+
+        if mode == 'fanout':
+            dashboard_data = await generate_fanout_dashboard(prompt, model)
+        else:
+            started = time.perf_counter()
+            payload = build_dashboard_payload(prompt, model)
+            record_stage('generate-dashboard', 'build_prompt', started)
+            dashboard_data = await call_routed(payload, 45, 'generate-dashboard', 'dashboard', finish_dashboard)
+
+        await run_in_threadpool(store_dashboard, cache_endpoint, prompt, model, dashboard_data)
+        return JSONResponse(dashboard_body(dashboard_data, options))
+    except Exception as e:
+        return error_response(e)
+
+
+@instrumented('generate-dashboard-stream')
+async def generate_dashboard_stream(request):
+    started = time.perf_counter()
+    data = await read_json(request)
+    request.state.model = request_model(data)
+    try:
+        prompt, model, options = parse_prompt_request(data, request.query_params)
+    except GenerationError as e:
+        return error_response(e)
+    record_stage('generate-dashboard-stream', 'parse_request', started)
+
+    # Shares cache entries with /generate-dashboard
+    cached_dashboard, similar_prompt = await run_in_threadpool(get_cached_dashboard, 'generate-dashboard', prompt, model)
+
+    # Take the upstream slot before the response starts so overload can still be a 503
+    slot = None
+    if cached_dashboard is None:
+        stream = DashboardStream(prompt, model, options)
+        try:
+            slot = await upstream_admission.acquire_async(stream.route.model, endpoint_priority('generate-dashboard-stream'))
+        except Overloaded as e:
+            return error_response(e)
+
+    async def events():
+        if cached_dashboard is not None:
+            for event in cached_dashboard_events(cached_dashboard, similar_prompt, options):
+                yield event
+            return
+
+        try:
+            async for kind, value in async_stream_chat_completion(stream.payload(), read_timeout=45):
+                for event in stream.feed(kind, value):
+                    yield event
+            dashboard_data = stream.finish()
+            if dashboard_data is not None:
+                await run_in_threadpool(store_dashboard, 'generate-dashboard', prompt, model, dashboard_data)
+            yield stream.final_event(dashboard_data)
+        except Exception as e:
+            yield stream.error_event(e, describe_async_error)
+        finally:
+            if slot is not None:
+                slot.release()
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        # Covers a client that disconnects before the stream starts; release() is idempotent
+        background=BackgroundTask(slot.release) if slot is not None else None
+    )
+
+
+@instrumented('generate-csv-dashboard')
+async def generate_csv_dashboard(request):
+    started = time.perf_counter()
+    data = await read_json(request)
+    request.state.model = request_model(data)
+    try:
+        prompt, model, options = parse_csv_dashboard_request(data, request.query_params)
+        # Prefer a previously uploaded dataset over inline CSV text
+        csv_data = await load_csv_data(data)
+        record_stage('generate-csv-dashboard', 'parse_request', started)
+
+        payload, df = await run_in_threadpool(build_csv_dashboard_payload, prompt, csv_data, model)
+        dashboard_data = await call_routed(
+            payload, 45, 'generate-csv-dashboard', 'dashboard',
+            lambda status_code, response_data, routed_model: run_in_threadpool(
+                finish_csv_dashboard, status_code, response_data, df, routed_model)
+        )
+        return JSONResponse(dashboard_body(dashboard_data, options, "Dashboard generated from CSV data analysis"))
+    except Exception as e:
+        return error_response(e)
+
+
+@instrumented('generate-single-widget')
+async def generate_single_widget(request):
+    started = time.perf_counter()
+    data = await read_json(request)
+    request.state.model = request_model(data)
+    try:
+        prompt, model, options = parse_prompt_request(data, request.query_params)
+        widget_type = data.get('widget_type', 'auto')  # auto, bar, line, number
+        csv_data = await load_csv_data(data)  # Optional CSV data, inline or a previously uploaded dataset
+        dashboard_context = data.get('dashboard_context', '')  # Dashboard context for maintaining topic
+        record_stage('generate-single-widget', 'parse_request', started)
+
+        widget_data, cached = await generate_widget(prompt, model, widget_type, csv_data, dashboard_context)
+        return JSONResponse(widget_body(widget_data, cached, options))
+    except Exception as e:
+        return error_response(e)
+
+
+@instrumented('generate-widgets')
+async def generate_widgets(request):
+    started = time.perf_counter()
+    data = await read_json(request)
+    request.state.model = request_model(data)
+    try:
+        items, options = parse_batch_request(data, request.query_params)
+        context = await batch_widget_context(data, items, 'generate-widgets')
+        record_stage('generate-widgets', 'parse_request', started)
+
+        body, status_code, headers = widget_batch_body(
+            [result async for result in generate_widget_batch(items, context)], options)
+        return JSONResponse(body, status_code=status_code, headers=headers)
+    except Exception as e:
+        return error_response(e)
+
+
+@instrumented('generate-widgets-stream')
+async def generate_widgets_stream(request):
+    started = time.perf_counter()
+    data = await read_json(request)
+    request.state.model = request_model(data)
+    try:
+        items, options = parse_batch_request(data, request.query_params)
+        context = await batch_widget_context(data, items, 'generate-widgets-stream')
+    except Exception as e:
+        return error_response(e)
+    record_stage('generate-widgets-stream', 'parse_request', started)
+
+    async def events():
+        succeeded = 0
+        async for result in generate_widget_batch(items, context):
+            succeeded += result['status'] == 'success'
+            yield sse_event('widget', shape_batch_result(result, options))
+        yield batch_done_event(succeeded, len(items))
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@instrumented('refresh-dashboard')
+async def refresh_dashboard(request):
+    data = await read_json(request) or {}
+    try:
+        options = series_options(data, request.query_params)
+        dashboard, etag = await run_in_threadpool(load_dashboard, request.path_params['dashboard_id'])
+        request.state.model = dashboard.get('model_used', 'sonar-pro')
+        items = refresh_request_items(dashboard, etag, data, options, request.headers.get('if-none-match'))
+        if items is None:
+            return Response(status_code=304, headers=revalidation_headers(etag, options))
+
+        results = []
+        if items:
+            context = refresh_context(dashboard)
+            context.prepare(item['widget_type'] for _, item in items)
+            results = [result async for result in generate_widget_batch(items, context, refresh=True)]
+        body, new_etag, status_code, headers = await run_in_threadpool(finish_refresh, dashboard, results)
+        body, headers = stored_dashboard_body(body, new_etag or etag, options, headers)
+        return JSONResponse(body, status_code=status_code, headers=headers)
+    except Exception as e:
+        return error_response(e)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_):
+    yield
+    await close_async_session()
+
+
+async_app = Starlette(
+    routes=[
+        Route('/generate-dashboard', generate_dashboard, methods=['POST']),
+        Route('/generate-dashboard/stream', generate_dashboard_stream, methods=['POST']),
+        Route('/generate-csv-dashboard', generate_csv_dashboard, methods=['POST']),
+        Route('/generate-single-widget', generate_single_widget, methods=['POST']),
+        Route('/generate-widgets', generate_widgets, methods=['POST']),
+        Route('/generate-widgets/stream', generate_widgets_stream, methods=['POST']),
+        Route('/dashboards/{dashboard_id}/refresh', refresh_dashboard, methods=['POST']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=ALLOWED_ORIGINS, allow_methods=['*'], allow_headers=['*']),
+        Middleware(CompressionMiddleware),
+    ],
+    lifespan=lifespan
+)
+ASYNC_PATHS = [route.path_regex for route in async_app.routes]
+
+# Flask keeps serving everything else (health, metrics, dataset uploads, stored dashboards) on its own CORS setup
+wsgi_app = WSGIMiddleware(flask_app)
+
+
+def declared_length(scope):
+    """The request's Content-Length, or 0 if it has none"""
+    for name, value in scope.get('headers', ()):
+        if name == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return 0
+    return 0
+
+
+async def application(scope, receive, send):
+    """ASGI entrypoint: async routes on the event loop, the rest through the Flask app"""
+    if scope['type'] == 'lifespan' or any(path.match(scope.get('path', '')) for path in ASYNC_PATHS):
+        if declared_length(scope) > MAX_REQUEST_BYTES:
+            # Flask's MAX_CONTENT_LENGTH, enforced before the body is read
+            await JSONResponse(request_too_large_body(), status_code=413)(scope, receive, send)
+            return
+        await async_app(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
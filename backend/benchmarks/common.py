@@ -0,0 +1,135 @@
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+
+# Shared pieces of the benchmark scripts: process management, load driving and stats
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    # What `python app.py` runs, minus the debug reloader: one OS thread per request
+    'sync': [sys.executable, '-c',
+             'import sys; from werkzeug.serving import run_simple; from app import app; '
+             'run_simple("127.0.0.1", int(sys.argv[1]), app, threaded=True)'],
+    'async': [sys.executable, '-m', 'uvicorn', 'asgi_app:application', '--host', '127.0.0.1',
+              '--log-level', 'warning', '--backlog', '4096', '--port'],
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def read_proc_status(pid):
+    """Return (rss_mb, threads) for a process from /proc (Linux only)"""
+    rss_kb, threads = 0, 0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss_kb = int(line.split()[1])
+                elif line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return rss_kb / 1024, threads
+
+
+def start(command, env):
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def start_fake_upstream(port, env, *options):
+    """Start benchmarks/fake_perplexity.py on port with extra CLI options"""
+    return start([sys.executable, 'benchmarks/fake_perplexity.py', '--port', str(port), *map(str, options)], env)
+
+
+def start_server(mode, port, env):
+    return start(SERVERS[mode] + [str(port)], env)
+
+
+async def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url):
+                    return
+            except aiohttp.ClientConnectionError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+async def drive(base_url, path, make_body, concurrency, total, pid, timeout=120):
+    """
+    POST make_body(index) to path `total` times with `concurrency` requests in
+    flight and return throughput, latency percentiles, status counts and the
+    server's peak RSS and thread count.
+    """
+    latencies = []
+    statuses = Counter()
+    peak = {"rss_mb": 0.0, "threads": 0}
+    done = asyncio.Event()
+
+    async def sample():
+        while not done.is_set():
+            rss_mb, threads = read_proc_status(pid)
+            peak['rss_mb'] = max(peak['rss_mb'], rss_mb)
+            peak['threads'] = max(peak['threads'], threads)
+            await asyncio.sleep(0.1)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(base_url, connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(index):
+            body = make_body(index)
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with session.post(path, json=body) as response:
+                        await response.read()
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = type(e).__name__
+                statuses[str(status)] += 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - started)
+
+        sampler = asyncio.create_task(sample())
+        started = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(total)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await sampler
+
+    return {
+        "requests": total,
+        "errors": total - len(latencies),
+        "statuses": dict(statuses),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_s": round(percentile(latencies, 0.50), 3),
+        "p95_s": round(percentile(latencies, 0.95), 3),
+        "p99_s": round(percentile(latencies, 0.99), 3),
+        "mean_s": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "peak_rss_mb": round(peak['rss_mb'], 1),
+        "peak_threads": peak['threads'],
+    }
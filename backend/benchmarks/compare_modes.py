@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import json
+import os
+
+from common import SERVERS, drive, start_fake_upstream, start_server, stop, wait_until_up
+
+# Compares the threaded Flask server with the ASGI mode under concurrent
+# /generate-dashboard load against the fake Perplexity server.
+#
+#   cd backend && python benchmarks/compare_modes.py --concurrency 50 200 1000
+
+
+async def run(args):
+    env = {
+        **os.environ,
+        'PERPLEXITY_API_KEY': 'benchmark',
+        'PERPLEXITY_BASE_URL': f'http://127.0.0.1:{args.upstream_port}',
+        # A single-call /generate-dashboard request holds one upstream connection
+        'PERPLEXITY_POOL_SIZE': str(max(args.concurrency)),
+        'PERPLEXITY_ASYNC_POOL_SIZE': str(max(args.concurrency)),
+        'CACHE_ENABLED': 'false',
+        # Measure the serving model itself, not the admission limits
+        'UPSTREAM_MAX_CONCURRENT': '100000',
+        'UPSTREAM_QUEUE_SIZE': '100000',
+    }
+    upstream = start_fake_upstream(args.upstream_port, env, '--latency', args.latency)
+    results = []
+    try:
+        for mode in args.modes:
+            server = start_server(mode, args.port, env)
+            try:
+                await wait_until_up(f'http://127.0.0.1:{args.port}/health')
+                for concurrency in args.concurrency:
+                    tag = f'{mode}-{concurrency}'
+                    result = await drive(f'http://127.0.0.1:{args.port}', '/generate-dashboard',
+                                         lambda index: {"prompt": f"{tag} topic {index}"},
+                                         concurrency, concurrency * args.rounds, server.pid)
+                    results.append({"mode": mode, "concurrency": concurrency, **result})
+                    print(f"{mode:>5} c={concurrency:<5} {result['throughput_rps']:>8} req/s  "
+                          f"p50 {result['p50_s']:>6}s  p95 {result['p95_s']:>6}s  p99 {result['p99_s']:>6}s  "
+                          f"errors {result['errors']:<5} rss {result['peak_rss_mb']:>6} MB  "
+                          f"threads {result['peak_threads']}", flush=True)
+            finally:
+                stop(server)
+    finally:
+        stop(upstream)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"latency_s": args.latency, "results": results}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the sync (Flask) and async (ASGI) serving modes')
+    parser.add_argument('--modes', nargs='+', choices=sorted(SERVERS), default=['sync', 'async'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[50, 200, 1000])
+    parser.add_argument('--rounds', type=int, default=2, help='Requests per client')
+    parser.add_argument('--latency', type=float, default=2.0, help='Fake upstream latency in seconds')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--upstream-port', type=int, default=9100)
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
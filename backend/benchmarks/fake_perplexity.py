@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Stand-in for the Perplexity chat completions API, for benchmarking without quota
+
+DASHBOARD = {
+    "dash_name": "Benchmark dashboard",
+    "category": "other",
+    "widgets": [
+        {"name": "Points by season", "type": "line", "source_url": "https://example.com",
+         "data": [{"name": str(2015 + i), "value": 20 + i} for i in range(8)]},
+        {"name": "Points by team", "type": "bar", "source_url": "https://example.com",
+         "data": [{"name": f"Team {i}", "value": 100 - i * 7} for i in range(6)]},
+        {"name": "Career points", "type": "number", "source_url": "https://example.com",
+         "data": {"value": 40000, "label": "Total points"}},
+    ]
+}
+WIDGET = DASHBOARD['widgets'][1]
+
+PLAN = {
+    "dash_name": "Benchmark dashboard",
+    "category": "other",
+    "widgets": [
+        {"prompt": "Points per season", "type": "line"},
+        {"prompt": "Points per team", "type": "bar"},
+        {"prompt": "Career points", "type": "number"},
+    ]
+}
+
+# Specs over the columns of the CSVs generated by run_benchmarks.make_csv
+CSV_DASHBOARD = {
+    "dash_name": "Sales overview",
+    "category": "sales",
+    "widgets": [
+        {"name": "Revenue by month", "type": "line", "source_url": "CSV Data Analysis",
+         "spec": {"time_column": "date", "bucket": "month", "aggregate": "sum", "value_column": "revenue"}},
+        {"name": "Units by region", "type": "bar", "source_url": "CSV Data Analysis",
+         "spec": {"group_by": "region", "aggregate": "sum", "value_column": "units", "limit": 10}},
+        {"name": "Average order value", "type": "number", "source_url": "CSV Data Analysis",
+         "spec": {"aggregate": "mean", "value_column": "revenue", "label": "Mean revenue per order"}},
+    ]
+}
+CSV_WIDGET = CSV_DASHBOARD['widgets'][1]
+
+
+def canned_content(payload):
+    """Pick the canned completion that matches the kind of prompt the backend sent"""
+    text = json.dumps(payload)
+    if 'plans research dashboards' in text:
+        content = PLAN
+    elif 'SPEC rules' in text:
+        content = CSV_WIDGET if 'SINGLE widget' in text else CSV_DASHBOARD
+    else:
+        content = WIDGET if 'SINGLE widget' in text else DASHBOARD
+    return json.dumps(content, separators=(',', ':'))
+
+
+def create_app(latency=2.0, jitter=0.0, error_rate=0.0, error_statuses=(429, 503), retry_after=0,
+               malformed_rate=0.0, fenced_rate=0.0, chunk_chars=40, seed=None):
+    """
+    Starlette app answering /chat/completions with canned output after
+    latency +/- jitter seconds. A share of requests (error_rate) fails with one
+    of error_statuses, and shares of completions come back malformed (cut off
+    mid-object) or wrapped in a ```json fence. Streaming requests get the
+    content as SSE chunks of chunk_chars characters spread over the latency.
+    """
+    rng = random.Random(seed)
+    counts = {"requests": 0, "errors": 0, "malformed": 0, "fenced": 0, "streams": 0}
+
+    async def chat_completions(request):
+        payload = await request.json()
+        counts['requests'] += 1
+        delay = max(0.0, latency + rng.uniform(-jitter, jitter))
+
+        if rng.random() < error_rate:
+            counts['errors'] += 1
+            await asyncio.sleep(delay / 4)
+            return JSONResponse({"error": {"message": "Injected failure"}}, status_code=rng.choice(error_statuses),
+                                headers={'Retry-After': str(retry_after)})
+
+        content = canned_content(payload)
+        if rng.random() < malformed_rate:
+            counts['malformed'] += 1
+            content = content[:len(content) // 2]
+        elif rng.random() < fenced_rate:
+            counts['fenced'] += 1
+            content = f"```json\n{content}\n```"
+        usage = {"prompt_tokens": len(json.dumps(payload)) // 4, "completion_tokens": len(content) // 4}
+
+        if payload.get('stream'):
+            counts['streams'] += 1
+            return StreamingResponse(stream(content, usage, delay), media_type='text/event-stream')
+
+        await asyncio.sleep(delay)
+        return JSONResponse({"choices": [{"message": {"role": "assistant", "content": content}}], "usage": usage})
+
+    async def stream(content, usage, delay):
+        chunks = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+        # Half the latency before the first token, the rest spread over the chunks
+        await asyncio.sleep(delay / 2)
+        for chunk in chunks:
+            yield 'data: ' + json.dumps({"choices": [{"delta": {"content": chunk}}]}) + '\n\n'
+            await asyncio.sleep(delay / 2 / len(chunks))
+        yield 'data: ' + json.dumps({"choices": [], "usage": usage}) + '\n\n'
+        yield 'data: [DONE]\n\n'
+
+    async def stats(request):
+        return JSONResponse(counts)
+
+    return Starlette(routes=[
+        Route('/chat/completions', chat_completions, methods=['POST']),
+        Route('/stats', stats, methods=['GET']),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Perplexity API for benchmarks')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', type=float, default=2.0, help='Seconds before each response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform +/- jitter on the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests that fail')
+    parser.add_argument('--error-statuses', type=int, nargs='+', default=[429, 503])
+    parser.add_argument('--retry-after', type=int, default=0, help='Retry-After seconds sent with failures')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Share of truncated JSON completions')
+    parser.add_argument('--fenced-rate', type=float, default=0.0, help='Share of ```json fenced completions')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    app = create_app(args.latency, args.jitter, args.error_rate, tuple(args.error_statuses), args.retry_after,
+                     args.malformed_rate, args.fenced_rate, seed=args.seed)
+    uvicorn.run(app, host='127.0.0.1', port=args.port, log_level='warning', backlog=4096)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from json_repair import JSONRepairError, extract_json  # noqa: E402
+
+# Salvage rate and cost of json_repair over a corpus of bad model outputs,
+# against the previous handling (strip a leading ```json fence, then json.loads).
+#
+#   cd backend && python benchmarks/json_repair_bench.py
+#
+# The corpus holds one kind of failure per line; every clean output is also
+# cut off at 10%..90% of its length to stand in for max_tokens truncation.
+
+DEFAULT_CORPUS = os.path.join(BACKEND_DIR, 'benchmarks', 'corpus', 'model_outputs.jsonl')
+
+
+def previous_parse(text):
+    """What the handlers did before json_repair"""
+    text = text.strip()
+    if text.startswith('```json'):
+        text = text.replace('```json', '').replace('```', '').strip()
+    return json.loads(text)
+
+
+def usable(value):
+    """A dashboard with widgets, or a single widget with data"""
+    if not isinstance(value, dict):
+        return False
+    return bool(value.get('widgets')) if 'widgets' in value else 'data' in value
+
+
+def count_widgets(value):
+    return len(value.get('widgets', [])) if 'widgets' in value else 1
+
+
+def load_corpus(path):
+    with open(path) as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    for case in list(cases):
+        if case['kind'] == 'clean':
+            output = case['output']
+            for tenth in range(1, 10):
+                cases.append({"kind": "truncated", "name": f"{case['name']} cut at {tenth * 10}%",
+                              "output": output[:len(output) * tenth // 10]})
+    return cases
+
+
+def time_call(function, text, repeat):
+    """Median seconds per call over repeat runs"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            function(text)
+        except ValueError:
+            pass
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON extraction and repair on bad model outputs')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--repeat', type=int, default=200, help='Timed runs per output')
+    parser.add_argument('--verbose', action='store_true', help='Print the outcome for every output')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    by_kind = defaultdict(lambda: {"outputs": 0, "previous_ok": 0, "repaired_ok": 0, "widgets": 0,
+                                   "previous_us": [], "repair_us": []})
+    for case in load_corpus(args.corpus):
+        text = case['output']
+        try:
+            previous_ok = usable(previous_parse(text))
+        except ValueError:
+            previous_ok = False
+        try:
+            value, repairs = extract_json(text)
+            repaired_ok = usable(value)
+        except JSONRepairError as e:
+            value, repairs, repaired_ok = None, [f"failed: {e}"], False
+
+        kind = by_kind[case['kind']]
+        kind['outputs'] += 1
+        kind['previous_ok'] += previous_ok
+        kind['repaired_ok'] += repaired_ok
+        kind['widgets'] += count_widgets(value) if repaired_ok else 0
+        kind['previous_us'].append(time_call(previous_parse, text, args.repeat) * 1e6)
+        kind['repair_us'].append(time_call(extract_json, text, args.repeat) * 1e6)
+        if args.verbose:
+            print(f"{case['kind']:<16} {case['name'][:44]:<44} before {'ok' if previous_ok else '--'}  "
+                  f"after {'ok' if repaired_ok else '--'}  {', '.join(repairs)}")
+
+    report = {}
+    print(f"{'kind':<16} {'outputs':>7} {'before':>7} {'after':>7} {'widgets':>8} {'json.loads':>11} {'extract':>9}")
+    for name, kind in sorted(by_kind.items()):
+        report[name] = {
+            "outputs": kind['outputs'], "previous_ok": kind['previous_ok'], "repaired_ok": kind['repaired_ok'],
+            "widgets_salvaged": kind['widgets'],
+            "previous_median_us": round(statistics.median(kind['previous_us']), 1),
+            "repair_median_us": round(statistics.median(kind['repair_us']), 1),
+        }
+        row = report[name]
+        print(f"{name:<16} {row['outputs']:>7} {row['previous_ok']:>7} {row['repaired_ok']:>7} "
+              f"{row['widgets_salvaged']:>8} {row['previous_median_us']:>9}us {row['repair_median_us']:>7}us")
+
+    total = sum(row['outputs'] for row in report.values())
+    before = sum(row['previous_ok'] for row in report.values())
+    after = sum(row['repaired_ok'] for row in report.values())
+    print(f"usable outputs: {before}/{total} before, {after}/{total} after "
+          f"({after - before} upstream calls saved)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"outputs": total, "previous_ok": before, "repaired_ok": after, "kinds": report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+import aiohttp
+
+from common import BACKEND_DIR, SERVERS, drive, start_fake_upstream, start_server, stop, wait_until_up
+
+# Load and latency benchmarks for the generation endpoints against the fake
+# Perplexity server. Results are written as JSON and compared against a saved
+# baseline; the exit status is 1 when a case regressed past the tolerance.
+#
+#   cd backend
+#   python benchmarks/run_benchmarks.py --save-baseline      # on the base commit
+#   python benchmarks/run_benchmarks.py                      # after a change
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, 'latest.json')
+
+SCENARIOS = {
+    # name: (path, needs CSV)
+    'dashboard': ('/generate-dashboard', False),
+    'fanout': ('/generate-dashboard', False),
+    'stream': ('/generate-dashboard/stream', False),
+    'csv': ('/generate-csv-dashboard', True),
+    'widget': ('/generate-single-widget', False),
+    'csv-widget': ('/generate-single-widget', True),
+    'widget-batch': ('/generate-widgets', False),
+    'csv-widget-batch': ('/generate-widgets', True),
+}
+# Widgets regenerated per request in the batch scenarios
+BATCH_SIZE = 4
+# Upstream calls one request can have in flight at once (fan-out plans up to 4 widgets), for sizing the client pools
+PARALLEL_UPSTREAM_CALLS = {'fanout': 4, 'widget-batch': BATCH_SIZE, 'csv-widget-batch': BATCH_SIZE}
+
+REGIONS = ['North', 'South', 'East', 'West', 'Central']
+PRODUCTS = [f'Product {i}' for i in range(40)]
+
+
+def make_csv(rows, seed=0):
+    """Deterministic sales CSV with the columns the fake server's specs refer to"""
+    rng = random.Random(seed)
+    start = date(2022, 1, 1)
+    lines = ['date,region,product,units,revenue']
+    for _ in range(rows):
+        units = rng.randint(1, 50)
+        lines.append(f"{start + timedelta(days=rng.randrange(730))},{rng.choice(REGIONS)},"
+                     f"{rng.choice(PRODUCTS)},{units},{units * rng.uniform(5, 120):.2f}")
+    return '\n'.join(lines) + '\n'
+
+
+async def upload_dataset(base_url, csv_data):
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f'{base_url}/datasets', data=csv_data.encode('utf-8'),
+                                headers={'Content-Type': 'text/csv'}) as response:
+            body = await response.json()
+            if response.status != 200:
+                raise RuntimeError(f"Dataset upload failed: {body}")
+            return body['dataset_id']
+
+
+def body_factory(scenario, tag, csv_field, reuse_prompts):
+    """Return make_body(index) for a scenario; prompts are unique unless reuse_prompts"""
+    def prompt(index):
+        return f"{tag} topic {index % 10 if reuse_prompts else index}"
+
+    def make_body(index):
+        body = {"prompt": prompt(index)}
+        if scenario == 'fanout':
+            body['mode'] = 'fanout'
+        elif scenario in ('widget', 'csv-widget'):
+            body['dashboard_context'] = 'Benchmark dashboard'
+        elif scenario in ('widget-batch', 'csv-widget-batch'):
+            body = {"dashboard_context": 'Benchmark dashboard',
+                    "widgets": [{"prompt": f"{prompt(index)} part {part}"} for part in range(BATCH_SIZE)]}
+        if csv_field:
+            body.update(csv_field)
+        return body
+
+    return make_body
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(result):
+    key = f"{result['scenario']}/c{result['concurrency']}"
+    return f"{key}/rows{result['csv_rows']}" if result.get('csv_rows') else key
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression descriptions relative to the baseline results"""
+    previous = {case_key(result): result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        key = case_key(result)
+        before = previous.get(key)
+        if before is None:
+            continue
+        if before['p95_s'] and result['p95_s'] > before['p95_s'] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {before['p95_s']}s -> {result['p95_s']}s")
+        if before['throughput_rps'] and result['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        if before['peak_rss_mb'] and result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{key}: peak RSS {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+        error_rate = result['errors'] / result['requests']
+        before_error_rate = before['errors'] / before['requests']
+        if error_rate > before_error_rate + 0.01:
+            regressions.append(f"{key}: error rate {before_error_rate:.1%} -> {error_rate:.1%}")
+    return regressions
+
+
+async def run(args):
+    env = {
+        **os.environ,
+        'PERPLEXITY_API_KEY': 'benchmark',
+        'PERPLEXITY_BASE_URL': f'http://127.0.0.1:{args.upstream_port}',
+    }
+    # Unless set explicitly, measure the request path rather than the caches and admission limits
+    env.setdefault('CACHE_ENABLED', 'true' if args.cache else 'false')
+    env.setdefault('UPSTREAM_MAX_CONCURRENT', '100000')
+    env.setdefault('UPSTREAM_QUEUE_SIZE', '100000')
+    pool_size = max(args.concurrency) * max(PARALLEL_UPSTREAM_CALLS.get(scenario, 1) for scenario in args.scenarios)
+    env.setdefault('PERPLEXITY_POOL_SIZE', str(pool_size))
+    env.setdefault('PERPLEXITY_ASYNC_POOL_SIZE', str(pool_size))
+
+    upstream = start_fake_upstream(
+        args.upstream_port, env, '--latency', args.latency, '--jitter', args.jitter,
+        '--error-rate', args.error_rate, '--malformed-rate', args.malformed_rate,
+        '--fenced-rate', args.fenced_rate, '--seed', args.seed
+    )
+    server = start_server(args.server, args.port, env)
+    base_url = f'http://127.0.0.1:{args.port}'
+    results = []
+    try:
+        await wait_until_up(f'{base_url}/health')
+        await wait_until_up(f'http://127.0.0.1:{args.upstream_port}/stats')
+        for scenario in args.scenarios:
+            path, needs_csv = SCENARIOS[scenario]
+            for rows in (args.csv_rows if needs_csv else [None]):
+                csv_field = None
+                if rows:
+                    csv_data = make_csv(rows, args.seed)
+                    if args.csv_transport == 'dataset':
+                        csv_field = {"dataset_id": await upload_dataset(base_url, csv_data)}
+                    else:
+                        csv_field = {"csv_data": csv_data}
+                for concurrency in args.concurrency:
+                    tag = f'{scenario}-{rows}-{concurrency}-{time.time_ns()}'
+                    make_body = body_factory(scenario, tag, csv_field, args.cache)
+                    result = await drive(base_url, path, make_body, concurrency, concurrency * args.rounds,
+                                         server.pid)
+                    result = {"scenario": scenario, "concurrency": concurrency, "csv_rows": rows, **result}
+                    results.append(result)
+                    print(f"{case_key(result):<28} {result['throughput_rps']:>8} req/s  "
+                          f"p50 {result['p50_s']:>6}s  p95 {result['p95_s']:>6}s  p99 {result['p99_s']:>6}s  "
+                          f"errors {result['errors']:<4} rss {result['peak_rss_mb']:>6} MB", flush=True)
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f'http://127.0.0.1:{args.upstream_port}/stats') as response:
+                upstream_stats = await response.json()
+    finally:
+        stop(server)
+        stop(upstream)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "server": args.server,
+        "upstream": {
+            "latency_s": args.latency, "jitter_s": args.jitter, "error_rate": args.error_rate,
+            "malformed_rate": args.malformed_rate, "fenced_rate": args.fenced_rate, **upstream_stats
+        },
+        "csv_transport": args.csv_transport,
+        "cache": args.cache,
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against (run with --save-baseline first)")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions against baseline {baseline.get('revision')} (tolerance {args.tolerance:.0%})")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the generation endpoints against a fake Perplexity API')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='sync')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=['dashboard', 'csv', 'widget'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 10, 50])
+    parser.add_argument('--rounds', type=int, default=4, help='Requests per client at each concurrency level')
+    parser.add_argument('--csv-rows', nargs='+', type=int, default=[1000, 50000])
+    parser.add_argument('--csv-transport', choices=['dataset', 'inline'], default='dataset',
+                        help='Upload CSVs once and send dataset_id, or send csv_data with every request')
+    parser.add_argument('--cache', action='store_true', help='Enable the response cache and repeat prompts')
+    parser.add_argument('--latency', type=float, default=0.5, help='Fake upstream latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--fenced-rate', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--upstream-port', type=int, default=9100)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative slowdown before failing')
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == '__main__':
+    main()
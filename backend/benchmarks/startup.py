@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from common import BACKEND_DIR, read_proc_status, start, stop, wait_until_up
+
+# Cold start and per-worker memory of the backend.
+#
+#   cd backend && python benchmarks/startup.py --workers 4
+#
+# Import time is measured in fresh interpreters. For the gunicorn run, PSS
+# (proportional set size) shows what each worker really costs: pages shared
+# with the preloading master are split between the processes sharing them.
+
+IMPORT_PROBE = (
+    'import resource, sys, time; started = time.perf_counter(); import {module}; '
+    'print(time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, '
+    '"pandas" in sys.modules)'
+)
+
+
+def measure_import(module, env, repeat):
+    """Median import time (s) and peak RSS (MB) of `import module` in a new interpreter"""
+    times, rss = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(module=module)], cwd=BACKEND_DIR,
+                                env=env, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(output[0]))
+        rss.append(int(output[1]) / 1024)
+        pandas_loaded = output[2] == 'True'
+    return {"import_s": round(statistics.median(times), 3), "peak_rss_mb": round(statistics.median(rss), 1),
+            "pandas_loaded": pandas_loaded}
+
+
+def read_pss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return 0.0
+
+
+def child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+async def measure_gunicorn(args, env):
+    """Time until gunicorn serves /health, then the RSS and PSS of the master and each worker"""
+    started = time.perf_counter()
+    server = start([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{args.port}'],
+                   {**env, 'WEB_CONCURRENCY': str(args.workers)})
+    try:
+        await wait_until_up(f'http://127.0.0.1:{args.port}/health')
+        ready_s = time.perf_counter() - started
+        # Let the remaining workers finish booting
+        deadline = time.monotonic() + 10
+        while len(child_pids(server.pid)) < args.workers and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        processes = [("master", server.pid)] + [("worker", pid) for pid in child_pids(server.pid)]
+        memory = [{"role": role, "pid": pid, "rss_mb": round(read_proc_status(pid)[0], 1),
+                   "pss_mb": round(read_pss_mb(pid), 1)} for role, pid in processes]
+    finally:
+        stop(server)
+    return {"ready_s": round(ready_s, 3), "processes": memory,
+            "total_pss_mb": round(sum(process['pss_mb'] for process in memory), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure backend import time and per-worker memory')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per import measurement')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--server-mode', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--preload-csv-engine', action='store_true')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    env = {**os.environ, 'PERPLEXITY_API_KEY': 'benchmark', 'SERVER_MODE': args.server_mode,
+           'PRELOAD_CSV_ENGINE': 'true' if args.preload_csv_engine else 'false'}
+    report = {module: measure_import(module, env, args.repeat) for module in ('app', 'asgi_app')}
+    for module, result in report.items():
+        print(f"import {module:<9} {result['import_s']:>6}s  peak rss {result['peak_rss_mb']:>6} MB  "
+              f"pandas loaded: {result['pandas_loaded']}")
+
+    report['gunicorn'] = asyncio.run(measure_gunicorn(args, env))
+    print(f"gunicorn ({args.server_mode}, {args.workers} workers) serving after {report['gunicorn']['ready_s']}s")
+    for process in report['gunicorn']['processes']:
+        print(f"  {process['role']:<6} {process['pid']:>7}  rss {process['rss_mb']:>6} MB  pss {process['pss_mb']:>6} MB")
+    print(f"  total pss {report['gunicorn']['total_pss_mb']} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from compression import compress  # noqa: E402
+from widget_data import shape_widget  # noqa: E402
+
+# Response bytes and serialization time of a long line widget, full and shaped
+# for the response (LTTB downsampling, columnar encoding), raw and compressed.
+#
+#   cd backend && python benchmarks/widget_data_bench.py --points 1000 5000 20000
+
+
+def line_widget(points, seed=0):
+    """A daily series with trend, seasonality and noise, like a CSV time series"""
+    rng = random.Random(seed)
+    data = [
+        {"name": f"2020-01-01+{day}", "value": round(100 + day * 0.05 + 20 * math.sin(day / 30) + rng.gauss(0, 5), 2)}
+        for day in range(points)
+    ]
+    return {"name": "Daily sales", "type": "line", "data": data}
+
+
+def median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark widget series shaping and response compression')
+    parser.add_argument('--points', type=int, nargs='+', default=[1000, 5000, 20000], help='Series lengths')
+    parser.add_argument('--max-points', type=int, default=300, help='Point budget for the shaped variants')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement')
+    args = parser.parse_args()
+
+    print(f"{'points':>7} {'variant':<18} {'json':>9} {'gzip':>8} {'br':>8} {'shape':>8} {'dumps':>8}")
+    for points in args.points:
+        widget = line_widget(points)
+        variants = [
+            ('records', 0, False),
+            ('columnar', 0, True),
+            (f'records/{args.max_points}', args.max_points, False),
+            (f'columnar/{args.max_points}', args.max_points, True),
+        ]
+        for name, max_points, columnar in variants:
+            shaped = shape_widget(widget, max_points, columnar)
+            body = json.dumps(shaped, separators=(',', ':')).encode('utf-8')
+            shape_ms = median_ms(lambda: shape_widget(widget, max_points, columnar), args.repeat)
+            dumps_ms = median_ms(lambda: json.dumps(shaped, separators=(',', ':')), args.repeat)
+            print(f"{points:>7} {name:<18} {len(body):>9} {len(compress(body, 'gzip')):>8} "
+                  f"{len(compress(body, 'br')):>8} {shape_ms:>6.2f}ms {dumps_ms:>6.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import gzip
+import os
+
+import brotli
+
+# Response compression settings. Dashboard JSON with long series shrinks several
+# times over; bodies under the minimum size aren't worth the CPU.
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+COMPRESSIBLE_TYPES = ('application/json',)
+# On equal q-values, brotli wins
+ENCODINGS = ('br', 'gzip')
+
+
+def choose_encoding(accept_encoding):
+    """The encoding an Accept-Encoding header value prefers among ENCODINGS, or None"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressible(content_type, content_encoding=None):
+    """Whether a response of this type may be compressed; event streams and encoded bodies never are"""
+    if not COMPRESSION_ENABLED or content_encoding:
+        return False
+    return (content_type or '').split(';')[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def weak_etag(etag):
+    """Compressed bytes differ from the identity ones, so a strong ETag is weakened (as nginx does)"""
+    return etag if not etag or etag.startswith('W/') else 'W/' + etag
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing single-body JSON responses for clients that
+    accept br or gzip. Streamed responses (server-sent events) pass through
+    untouched so each event still reaches the client as soon as it is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        request_headers = dict(scope.get('headers') or [])
+        encoding = choose_encoding(request_headers.get(b'accept-encoding', b'').decode('latin-1'))
+        start = None
+
+        async def compressing_send(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                headers = {key.lower(): value.decode('latin-1') for key, value in message.get('headers', [])}
+                if not compressible(headers.get(b'content-type'), headers.get(b'content-encoding')):
+                    await send(message)
+                    return
+                # Held back until the body shows whether the response is streamed
+                start = message
+                return
+            if start is None or message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            held, start = start, None
+            headers = [(key, value) for key, value in held.get('headers', []) if key.lower() != b'vary']
+            vary = [value.decode('latin-1') for key, value in held.get('headers', []) if key.lower() == b'vary']
+            headers.append((b'vary', ', '.join(vary + ['Accept-Encoding']).encode('latin-1')))
+            body = message.get('body', b'')
+            if encoding and not message.get('more_body') and len(body) >= COMPRESSION_MIN_BYTES:
+                body = compress(body, encoding)
+                headers = [
+                    (key, weak_etag(value.decode('latin-1')).encode('latin-1') if key.lower() == b'etag' else value)
+                    for key, value in headers if key.lower() != b'content-length'
+                ]
+                headers += [(b'content-encoding', encoding.encode('latin-1')), (b'content-length', str(len(body)).encode('latin-1'))]
+                message = dict(message, body=body)
+            await send(dict(held, headers=headers))
+            await send(message)
+
+        await self.app(scope, receive, compressing_send)
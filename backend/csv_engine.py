@@ -0,0 +1,214 @@
+import hashlib
+import io
+import math
+import os
+import threading
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Parsed DataFrame cache settings
+CSV_ENGINE_CACHE_SIZE = int(os.getenv('CSV_ENGINE_CACHE_SIZE', '8'))
+
+# Object columns with at most this share of distinct values are stored as categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+AGGREGATES = {'sum', 'mean', 'median', 'min', 'max', 'count', 'nunique'}
+BUCKETS = {'day': 'D', 'week': 'W', 'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+DEFAULT_BAR_LIMIT = 10
+MAX_BAR_LIMIT = 50
+
+
+class SpecError(ValueError):
+    """A widget spec can't be evaluated against the dataset"""
+
+
+def optimize_dtypes(df):
+    """Downcast numeric columns and store low-cardinality text columns as categoricals"""
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_integer_dtype(series):
+            df[column] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            df[column] = pd.to_numeric(series, downcast='float')
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if len(series) and series.nunique(dropna=True) / len(series) <= CATEGORY_MAX_RATIO:
+                df[column] = series.astype('category')
+    return df
+
+
+class DataFrameCache:
+    """Small LRU of parsed, dtype-optimized DataFrames keyed by content hash"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            df = self._frames.get(key)
+            if df is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return df
+
+    def set(self, key, df):
+        with self._lock:
+            self._frames[key] = df
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_entries:
+                self._frames.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._frames), "hits": self.hits, "misses": self.misses}
+
+
+dataframe_cache = DataFrameCache(CSV_ENGINE_CACHE_SIZE)
+
+
+def load_dataframe(csv_data):
+    """Parse CSV text into an optimized DataFrame, reusing a cached parse of identical content"""
+    key = hashlib.sha256(csv_data.encode('utf-8')).hexdigest()
+    df = dataframe_cache.get(key)
+    if df is None:
+        df = optimize_dtypes(pd.read_csv(io.StringIO(csv_data), skipinitialspace=True))
+        dataframe_cache.set(key, df)
+    return df
+
+
+def looks_like_dates(series, sample_size=20):
+    """Whether most of a text column's leading values parse as dates"""
+    sample = series.dropna().astype(str).head(sample_size)
+    if sample.empty:
+        return False
+    return parse_dates(sample).notna().mean() >= 0.8
+
+
+def parse_dates(series):
+    """Parse a column as datetimes; unparseable values become NaT"""
+    # Per-element format inference warns on mixed formats
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return pd.to_datetime(series.astype(str), errors='coerce')
+
+
+def to_python(value):
+    """Convert a NumPy/pandas scalar to a JSON-friendly Python number"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return 0
+        if value.is_integer():
+            return int(value)
+        return round(value, 4)
+    return value
+
+
+def _require_column(df, column, role):
+    if not column:
+        raise SpecError(f"Spec is missing {role}")
+    if column not in df.columns:
+        raise SpecError(f"Unknown {role} '{column}'")
+    return column
+
+
+def _aggregate_series(df, spec):
+    """Return (aggregate, series) for the spec's value column"""
+    aggregate = (spec.get('aggregate') or 'count').lower()
+    if aggregate not in AGGREGATES:
+        raise SpecError(f"Unsupported aggregate '{aggregate}'")
+
+    value_column = spec.get('value_column')
+    if aggregate == 'count' and not value_column:
+        return aggregate, pd.Series(1, index=df.index)
+
+    _require_column(df, value_column, 'value_column')
+    series = df[value_column]
+    if aggregate not in ('count', 'nunique'):
+        if not pd.api.types.is_numeric_dtype(series):
+            series = pd.to_numeric(series, errors='coerce')
+        elif pd.api.types.is_float_dtype(series):
+            # Stored as float32 to save memory; accumulate in float64 to keep totals exact
+            series = series.astype('float64')
+    return aggregate, series
+
+
+def _time_keys(df, column, bucket):
+    """Return (sort_key, label) Series for grouping a line chart by time"""
+    series = df[column]
+    if pd.api.types.is_numeric_dtype(series):
+        # Years, seasons and other sequential numbers are used as-is
+        return series, series.map(lambda value: str(to_python(value)))
+
+    times = parse_dates(series)
+    if times.notna().mean() < 0.5:
+        return series.astype(str), series.astype(str)
+
+    if not bucket:
+        return times, times.dt.strftime('%Y-%m-%d')
+    if bucket not in BUCKETS:
+        raise SpecError(f"Unsupported bucket '{bucket}'")
+    periods = times.dt.to_period(BUCKETS[bucket])
+    if bucket in ('day', 'week'):
+        labels = periods.dt.start_time.dt.strftime('%Y-%m-%d')
+    else:
+        labels = periods.astype(str)
+    return periods.dt.start_time, labels
+
+
+def _bar_limit(spec):
+    """The number of bars to keep, capped at MAX_BAR_LIMIT"""
+    limit = spec.get('limit')
+    if limit is None:
+        return DEFAULT_BAR_LIMIT
+    # head() with a negative count would drop bars from the end instead of keeping them
+    if isinstance(limit, bool) or not isinstance(limit, (int, float, str)):
+        raise SpecError(f"Invalid limit {limit!r}")
+    try:
+        limit = int(limit)
+    except (ValueError, OverflowError):
+        raise SpecError(f"Invalid limit {limit!r}")
+    if limit < 1:
+        raise SpecError(f"Invalid limit {limit}, must be at least 1")
+    return min(limit, MAX_BAR_LIMIT)
+
+
+def compute_widget_data(df, widget_type, spec):
+    """Evaluate a widget spec over the full DataFrame and return widget data"""
+    if not isinstance(spec, dict):
+        raise SpecError("Spec must be an object")
+    aggregate, values = _aggregate_series(df, spec)
+
+    if widget_type == 'number':
+        value = values.agg(aggregate) if len(values) else 0
+        label = spec.get('label') or f"{aggregate} of {spec.get('value_column') or 'rows'}"
+        return {"value": to_python(value), "label": label}
+
+    if widget_type == 'bar':
+        group_by = _require_column(df, spec.get('group_by'), 'group_by')
+        grouped = values.groupby(df[group_by], observed=True, sort=False).agg(aggregate)
+        sort = spec.get('sort', 'desc')
+        if sort == 'label':
+            grouped = grouped.sort_index()
+        else:
+            grouped = grouped.sort_values(ascending=(sort == 'asc'))
+        grouped = grouped.head(_bar_limit(spec))
+        return [{"name": str(name), "value": to_python(value)} for name, value in grouped.items()]
+
+    if widget_type == 'line':
+        time_column = _require_column(df, spec.get('time_column'), 'time_column')
+        sort_keys, labels = _time_keys(df, time_column, spec.get('bucket'))
+        frame = pd.DataFrame({'key': sort_keys, 'label': labels, 'value': values}).dropna(subset=['key'])
+        grouped = frame.groupby(['key', 'label'], sort=True)['value'].agg(aggregate)
+        return [{"name": label, "value": to_python(value)} for (_, label), value in grouped.items()]
+
+    raise SpecError(f"Unsupported widget type '{widget_type}'")
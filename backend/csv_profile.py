@@ -0,0 +1,244 @@
+import hashlib
+import io
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from csv_engine import looks_like_dates, parse_dates, to_python
+
+# Prompt budgets (approximate tokens) for the CSV part of a prompt
+CSV_PROMPT_TOKEN_BUDGET = int(os.getenv('CSV_PROMPT_TOKEN_BUDGET', '1500'))
+CSV_WIDGET_PROMPT_TOKEN_BUDGET = int(os.getenv('CSV_WIDGET_PROMPT_TOKEN_BUDGET', '800'))
+
+# Profiling settings
+PROFILE_CHUNK_ROWS = int(os.getenv('PROFILE_CHUNK_ROWS', '50000'))
+PROFILE_SAMPLE_ROWS = 20
+PROFILE_TOP_K = 5
+DISTINCT_CAP = 10000  # Distinct values tracked exactly per column before reporting a lower bound
+COUNTER_CAP = 1000  # Top-value candidates kept per column between chunks
+PROFILE_CACHE_SIZE = 16
+
+
+def estimate_tokens(text):
+    """Rough token count for prompt budgeting (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def truncate_to_budget(text, token_budget):
+    """Cut text to the token budget at a line boundary so no row is split"""
+    max_chars = token_budget * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind('\n', 0, max_chars)
+    return text[:cut] if cut > 0 else text[:max_chars]
+
+
+class ColumnProfile:
+    """Running statistics for one column, updated chunk by chunk"""
+
+    def __init__(self, name):
+        self.name = name
+        self.kind = None
+        self.count = 0
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.distinct = set()
+        self.distinct_capped = False
+        self.top = Counter()
+
+    def update(self, series):
+        if self.kind is None:
+            if pd.api.types.is_numeric_dtype(series):
+                self.kind = 'numeric'
+            elif looks_like_dates(series):
+                self.kind = 'date'
+            else:
+                self.kind = 'text'
+
+        non_null = series.dropna()
+        self.nulls += len(series) - len(non_null)
+        self.count += len(non_null)
+        if non_null.empty:
+            return
+
+        if self.kind == 'numeric':
+            values = pd.to_numeric(non_null, errors='coerce').dropna().astype('float64')
+            if values.empty:
+                return
+            self._update_range(values.min(), values.max())
+            self.total += float(values.sum())
+        elif self.kind == 'date':
+            times = parse_dates(non_null).dropna()
+            if not times.empty:
+                self._update_range(times.min(), times.max())
+        else:
+            counts = non_null.astype(str).value_counts()
+            self.top.update(counts.to_dict())
+            if len(self.top) > COUNTER_CAP:
+                # Keep the heaviest candidates so memory stays bounded on high-cardinality columns
+                self.top = Counter(dict(self.top.most_common(COUNTER_CAP)))
+
+        if not self.distinct_capped:
+            self.distinct.update(non_null.unique().tolist())
+            if len(self.distinct) > DISTINCT_CAP:
+                self.distinct_capped = True
+                self.distinct = set()
+
+    def _update_range(self, low, high):
+        self.minimum = low if self.minimum is None else min(self.minimum, low)
+        self.maximum = high if self.maximum is None else max(self.maximum, high)
+
+    def to_dict(self):
+        profile = {
+            "name": self.name,
+            "kind": self.kind or 'text',
+            "nulls": self.nulls,
+            "distinct": f">{DISTINCT_CAP}" if self.distinct_capped else len(self.distinct),
+        }
+        if self.kind == 'numeric' and self.count:
+            profile.update({
+                "min": to_python(self.minimum),
+                "max": to_python(self.maximum),
+                "mean": to_python(self.total / self.count),
+            })
+        elif self.kind == 'date' and self.minimum is not None:
+            profile.update({"min": f"{self.minimum:%Y-%m-%d}", "max": f"{self.maximum:%Y-%m-%d}"})
+        elif self.kind == 'text':
+            profile['top'] = self.top.most_common(PROFILE_TOP_K)
+        return profile
+
+
+def profile_csv(source, chunk_rows=PROFILE_CHUNK_ROWS, sample_rows=PROFILE_SAMPLE_ROWS, seed=0):
+    """
+    Read a CSV (path or file object) in chunks and return its row count,
+    per-column profiles and a uniform reservoir sample of rows. The running
+    statistics are capped per column; the source itself is not, and the
+    request handlers pass text they already hold in memory.
+    """
+    rng = np.random.default_rng(seed)
+    columns = None
+    sample = []
+    rows = 0
+    for chunk in pd.read_csv(source, chunksize=chunk_rows, skipinitialspace=True):
+        if columns is None:
+            columns = [ColumnProfile(str(name)) for name in chunk.columns]
+        for profile, name in zip(columns, chunk.columns):
+            profile.update(chunk[name])
+
+        # Reservoir sampling (Algorithm R), vectorized over the chunk: the row at
+        # global position i replaces slot j = randint(0, i) when j < sample_rows
+        fill = min(len(chunk), max(sample_rows - len(sample), 0))
+        replacements = []
+        if fill < len(chunk):
+            positions = np.arange(rows + fill, rows + len(chunk))
+            slots = (rng.random(len(positions)) * (positions + 1)).astype(np.int64)
+            replacements = [(int(slots[offset]), fill + int(offset)) for offset in np.nonzero(slots < sample_rows)[0]]
+
+        # Only render the rows that end up in the sample
+        needed = sorted(set(range(fill)) | {offset for _, offset in replacements})
+        if needed:
+            picked = chunk.iloc[needed]
+            rendered = dict(zip(needed, picked.astype(str).where(picked.notna(), '').values.tolist()))
+            sample.extend(rendered[offset] for offset in range(fill))
+            for slot, offset in replacements:
+                sample[slot] = rendered[offset]
+        rows += len(chunk)
+
+    return {
+        "rows": rows,
+        "columns": [profile.to_dict() for profile in columns or []],
+        "header": [profile.name for profile in columns or []],
+        "sample": sample,
+    }
+
+
+def _column_line(column, detailed=True):
+    kind = column['kind']
+    parts = [kind]
+    if kind in ('numeric', 'date') and 'min' in column:
+        parts.append(f"min {column['min']}, max {column['max']}")
+        if kind == 'numeric' and detailed:
+            parts.append(f"mean {column['mean']}")
+    parts.append(f"{column['distinct']} distinct")
+    if column['nulls']:
+        parts.append(f"{column['nulls']} empty")
+    if kind == 'text' and detailed and column.get('top'):
+        parts.append('top: ' + ', '.join(f"{value} ({count})" for value, count in column['top']))
+    return f"- {column['name']}: " + '; '.join(parts)
+
+
+def _column_names_line(names, token_budget):
+    """As many column names as fit in the token budget, then how many were left out"""
+    max_chars = token_budget * 4 - 40  # Room for the "and N more" suffix
+    shown = []
+    length = 0
+    for name in names:
+        length += len(name) + 2
+        if length > max_chars:
+            break
+        shown.append(name)
+    line = ', '.join(shown)
+    if len(shown) < len(names):
+        line += f", … and {len(names) - len(shown)} more columns"
+    return line
+
+
+def format_profile(profile, token_budget):
+    """
+    Pack a profile into prompt text within the token budget: the column schema
+    first, then as many sample rows as fit. Per-column detail is dropped before
+    per-column stats, and those before column names, so a wide file still
+    lists its columns (or says how many did not fit).
+    """
+    schema_budget = token_budget * 0.75
+    header = f"The CSV data has {profile['rows']} rows and these columns:"
+    for detailed in (True, False):
+        text = '\n'.join([header] + [_column_line(column, detailed) for column in profile['columns']])
+        if estimate_tokens(text) <= schema_budget:
+            break
+    else:
+        # Too wide to describe each column; sample rows would not fit either, so the names get the budget
+        header = f"The CSV data has {profile['rows']} rows and {len(profile['columns'])} columns:"
+        names = _column_names_line(profile['header'], token_budget - estimate_tokens(header) - 1)
+        text = f"{header}\n{names}"
+
+    buffer = io.StringIO()
+    pd.DataFrame(profile['sample'], columns=profile['header']).to_csv(buffer, index=False)
+    sample_lines = buffer.getvalue().splitlines()
+    if len(sample_lines) < 2:
+        return text
+
+    rows_text = sample_lines[0]
+    for line in sample_lines[1:]:
+        candidate = rows_text + '\n' + line
+        if estimate_tokens(text) + estimate_tokens(candidate) + 10 > token_budget:
+            break
+        rows_text = candidate
+    if rows_text == sample_lines[0]:
+        return text
+    return f"{text}\n\nRandom sample of rows:\n```\n{rows_text}\n```"
+
+
+_profile_cache = OrderedDict()
+_profile_lock = threading.Lock()
+
+
+def get_profile(csv_data):
+    """Profile CSV text, reusing the result for identical content"""
+    key = hashlib.sha256(csv_data.encode('utf-8')).hexdigest()
+    with _profile_lock:
+        profile = _profile_cache.get(key)
+        if profile is not None:
+            _profile_cache.move_to_end(key)
+            return profile
+    profile = profile_csv(io.StringIO(csv_data))
+    with _profile_lock:
+        _profile_cache[key] = profile
+        while len(_profile_cache) > PROFILE_CACHE_SIZE:
+            _profile_cache.popitem(last=False)
+    return profile
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+# Dashboard storage settings
+DASHBOARD_STORE_ENABLED = os.getenv('DASHBOARD_STORE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+DASHBOARD_DB_PATH = os.getenv(
+    'DASHBOARD_DB_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'dashboards.sqlite3')
+)
+DASHBOARD_MAX_ENTRIES = int(os.getenv('DASHBOARD_MAX_ENTRIES', '10000'))
+DASHBOARD_MAX_AGE_SECONDS = float(os.getenv('DASHBOARD_MAX_AGE_SECONDS', str(30 * 24 * 3600)))
+
+# How long a widget's data stays fresh before a refresh regenerates it, by widget
+# type. Single figures (prices, counts, standings) move much faster than series.
+WIDGET_TTL_SECONDS = {
+    'number': float(os.getenv('WIDGET_TTL_NUMBER_SECONDS', str(15 * 60))),
+    'line': float(os.getenv('WIDGET_TTL_LINE_SECONDS', str(24 * 3600))),
+    'bar': float(os.getenv('WIDGET_TTL_BAR_SECONDS', str(24 * 3600))),
+}
+
+_DASHBOARD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def widget_ttl(widget_type):
+    return WIDGET_TTL_SECONDS.get(widget_type, WIDGET_TTL_SECONDS['bar'])
+
+
+def stale_widgets(dashboard, now=None, force=False):
+    """Indexes of the dashboard's widgets whose data has outlived their TTL"""
+    now = time.time() if now is None else now
+    return [
+        index for index, widget in enumerate(dashboard.get('widgets', []))
+        if force or now - widget.get('generated_at', 0) >= widget.get('ttl_seconds', widget_ttl(widget.get('type')))
+    ]
+
+
+def make_etag(text):
+    return f'"{hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value names etag (weak comparison, as for GET)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+
+class DashboardError(Exception):
+    """Dashboard lookup failure that maps to an error response"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DashboardStore:
+    """
+    Generated dashboards in SQLite under random IDs, so they can be reopened
+    and refreshed without regenerating them. Each row keeps the dashboard's
+    compact JSON and its ETag. Dashboards unopened for the max age are purged,
+    then the least recently opened ones over the entry limit.
+    """
+
+    PURGE_EVERY = 100
+
+    def __init__(self, path, max_entries, max_age_seconds):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dashboards ("
+            "id TEXT PRIMARY KEY, value TEXT NOT NULL, etag TEXT NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS dashboards_accessed ON dashboards (accessed_at)")
+        conn.commit()
+
+    def _conn(self):
+        # One connection per thread and per process, as in response_cache.DiskStore
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, dashboard):
+        """Store a new dashboard under a fresh ID, written into it as dashboard_id. Returns its ETag"""
+        dashboard['dashboard_id'] = uuid.uuid4().hex
+        return self.save(dashboard)
+
+    def save(self, dashboard):
+        """Store the dashboard under its dashboard_id, replacing any previous version. Returns its ETag"""
+        text = json.dumps(dashboard, separators=(',', ':'))
+        etag = make_etag(text)
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO dashboards (id, value, etag, accessed_at) VALUES (?, ?, ?, ?)",
+            (dashboard['dashboard_id'], text, etag, time.time())
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge(conn)
+        conn.commit()
+        return etag
+
+    def load(self, dashboard_id):
+        """Return (dashboard, etag), raising DashboardError if the ID is malformed or unknown"""
+        if not isinstance(dashboard_id, str) or not _DASHBOARD_ID_RE.match(dashboard_id):
+            raise DashboardError("Invalid dashboard_id")
+        conn = self._conn()
+        row = conn.execute("SELECT value, etag FROM dashboards WHERE id = ?", (dashboard_id,)).fetchone()
+        if row is None:
+            raise DashboardError("Unknown or expired dashboard_id", 404)
+        conn.execute("UPDATE dashboards SET accessed_at = ? WHERE id = ?", (time.time(), dashboard_id))
+        conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def _purge(self, conn):
+        conn.execute("DELETE FROM dashboards WHERE accessed_at <= ?", (time.time() - self.max_age_seconds,))
+        conn.execute(
+            "DELETE FROM dashboards WHERE id IN ("
+            "SELECT id FROM dashboards ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        count = self._conn().execute("SELECT COUNT(*) FROM dashboards").fetchone()[0]
+        return {"dashboards": count, "path": self.path}
+
+
+dashboard_store = (
+    DashboardStore(DASHBOARD_DB_PATH, DASHBOARD_MAX_ENTRIES, DASHBOARD_MAX_AGE_SECONDS) if DASHBOARD_STORE_ENABLED else None
+)
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+# Dataset storage settings
+DATASET_DIR = os.getenv(
+    'DATASET_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'datasets')
+)
+DATASET_MAX_UPLOAD_BYTES = int(os.getenv('DATASET_MAX_UPLOAD_BYTES', str(100 * 1024 * 1024)))
+DATASET_MAX_TOTAL_BYTES = int(os.getenv('DATASET_MAX_TOTAL_BYTES', str(1024 * 1024 * 1024)))
+DATASET_MAX_AGE_SECONDS = float(os.getenv('DATASET_MAX_AGE_SECONDS', str(7 * 24 * 3600)))
+CHUNK_SIZE = 64 * 1024
+
+_DATASET_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _remove_quietly(path):
+    # Another worker sharing the directory may have removed it already
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class DatasetError(Exception):
+    """Dataset upload or lookup failure that maps to an error response"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DatasetStore:
+    """
+    Content-addressed CSV store on disk. Uploads are streamed to a temp file in
+    chunks while hashing, then renamed to <sha256>.csv, so identical uploads
+    share one file. File mtimes double as last-access times for LRU eviction.
+    """
+
+    def __init__(self, directory, max_upload_bytes, max_total_bytes, max_age_seconds):
+        self.directory = directory
+        self.max_upload_bytes = max_upload_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, dataset_id):
+        """Return the file path for a dataset ID, or None if the ID is malformed"""
+        if not isinstance(dataset_id, str) or not _DATASET_ID_RE.match(dataset_id):
+            return None
+        return os.path.join(self.directory, f'{dataset_id}.csv')
+
+    def save_stream(self, stream):
+        """
+        Write an uploaded stream to the store in chunks.
+        Returns (dataset_id, size_bytes, deduplicated).
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise DatasetError(f"Dataset exceeds the {self.max_upload_bytes} byte upload limit", 413)
+                    digest.update(chunk)
+                    f.write(chunk)
+            if size == 0:
+                raise DatasetError("Empty CSV data provided")
+
+            dataset_id = digest.hexdigest()
+            path = self.path_for(dataset_id)
+            with self._lock:
+                # Another worker's eviction can remove the stored copy at any moment,
+                # so touching it is the existence check; if it is gone, this upload replaces it
+                deduplicated = self.touch(dataset_id)
+                if deduplicated:
+                    os.remove(temp_path)
+                else:
+                    os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self.evict()
+        return dataset_id, size, deduplicated
+
+    def load(self, dataset_id):
+        """Return the dataset's text, raising DatasetError if it is unknown"""
+        path = self.path_for(dataset_id)
+        if path is None:
+            raise DatasetError("Invalid dataset_id")
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        except FileNotFoundError:
+            raise DatasetError("Unknown or expired dataset_id, please upload the file again", 404)
+        self.touch(dataset_id)
+        return text
+
+    def touch(self, dataset_id):
+        """Mark a dataset as recently used; returns whether it exists"""
+        path = self.path_for(dataset_id)
+        try:
+            os.utime(path)
+        except (FileNotFoundError, TypeError):
+            return False
+        return True
+
+    def evict(self):
+        """Drop datasets older than the max age, then least recently used ones over the size limit"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.csv'):
+                    continue
+                stat = entry.stat()
+                if now - stat.st_mtime > self.max_age_seconds:
+                    _remove_quietly(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_total_bytes:
+                    break
+                _remove_quietly(path)
+                total -= size
+
+    def stats(self):
+        sizes = [entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith('.csv')]
+        return {"datasets": len(sizes), "bytes": sum(sizes)}
+
+
+dataset_store = DatasetStore(DATASET_DIR, DATASET_MAX_UPLOAD_BYTES, DATASET_MAX_TOTAL_BYTES, DATASET_MAX_AGE_SECONDS)
@@ -0,0 +1,43 @@
+import importlib
+import os
+
+# Production server: gunicorn -c gunicorn.conf.py
+#
+# The app is imported once in the master and the workers are forked from it,
+# so they share its memory pages and start without re-importing anything.
+# Caches, single-flight, admission limits and /metrics are per worker, so
+# UPSTREAM_MAX_CONCURRENT applies to each worker, not to the whole server.
+#
+#   WEB_CONCURRENCY      worker processes (default 2)
+#   WEB_THREADS          threads per sync worker (default 8)
+#   SERVER_MODE          'sync' for Flask on threads, 'async' for asgi_app (default sync)
+#   PRELOAD_CSV_ENGINE   also import pandas in the master, so CSV-heavy deployments
+#                        share it between workers instead of each loading a copy
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+preload_app = True
+
+if os.getenv('SERVER_MODE', 'sync') == 'async':
+    wsgi_app = 'asgi_app:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'app:app'
+    worker_class = 'gthread'
+    threads = int(os.getenv('WEB_THREADS', '8'))
+
+# Generations can take a minute; anything past this is a stuck worker
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    if os.getenv('PRELOAD_CSV_ENGINE', 'false').lower() == 'true':
+        # Imported only for the side effect of loading pandas and numpy before the fork
+        for module in ('csv_engine', 'csv_profile'):
+            importlib.import_module(module)
@@ -0,0 +1,271 @@
+import json
+import re
+
+# Tolerant extraction of the JSON object in a model completion. Valid output
+# takes the json.loads fast path; anything else is re-tokenized from the first
+# '{' and rebuilt as valid JSON, recording each kind of repair made:
+#
+#   leading_text     prose or a fence label before the object
+#   trailing_text    commentary after the object
+#   truncated        output cut off (e.g. at max_tokens): open structures are
+#                    closed and the array element that was cut off is dropped,
+#                    so a dashboard keeps only its complete widgets
+#   trailing_comma   a comma before a closing bracket, or a doubled comma
+#   missing_comma    adjacent values with no comma between them
+#   single_quotes    'single-quoted' strings
+#   unquoted_keys    {name: "..."} style keys
+#   bare_words       True/False/None, NaN and other unquoted words
+#   coerced_numbers  numeric strings such as "1,234", "$5.2B" or "12%" under a "value" key
+
+# Objects starting at more than this many '{' positions are not tried
+MAX_CANDIDATES = 3
+
+_TOKENS = re.compile(r'''
+    (?P<ws>\s+)
+  | (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+  | (?P<squote>'[^'\\]*(?:\\.[^'\\]*)*')
+  | (?P<open_string>"[^"\\]*(?:\\.[^"\\]*)*\\?\Z|'[^'\\]*(?:\\.[^'\\]*)*\\?\Z)
+  | (?P<open>[{\[])
+  | (?P<close>[}\]])
+  | (?P<comma>,)
+  | (?P<colon>:)
+  | (?P<word>[^\s"'{}\[\],:]+)
+''', re.VERBOSE | re.DOTALL)
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?\Z')
+_NUMERIC_STRING = re.compile(
+    r'([-+])?[$€£¥]?\s*(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?\s*(%|k|m|mn|b|bn|t)?\Z', re.IGNORECASE
+)
+_MULTIPLIERS = {'k': 10 ** 3, 'm': 10 ** 6, 'mn': 10 ** 6, 'b': 10 ** 9, 'bn': 10 ** 9, 't': 10 ** 12}
+_WORDS = {'True': 'true', 'False': 'false', 'None': 'null', 'NaN': 'null', 'Infinity': 'null',
+          '-Infinity': 'null', 'undefined': 'null'}
+_FENCE = re.compile(r'```[a-zA-Z]*')
+_decoder = json.JSONDecoder(strict=False)
+
+
+class JSONRepairError(ValueError):
+    """The completion holds no JSON object that could be recovered"""
+
+
+def strip_fences(text):
+    """Whitespace and ``` fences are not worth reporting; anything else is"""
+    return _FENCE.sub('', text).strip() if '```' in text else text.strip()
+
+
+def parse_number_string(text):
+    """The number a string like "1,234", "-$5.2B" or "12%" stands for, or None"""
+    match = _NUMERIC_STRING.match(text.strip())
+    if match is None:
+        return None
+    sign, whole, fraction, suffix = match.groups()
+    value = int(whole.replace(',', ''))
+    if fraction:
+        value += float('0' + fraction)
+    if suffix and suffix != '%':
+        value *= _MULTIPLIERS[suffix.lower()]
+        if value == int(value):
+            value = int(value)
+    return -value if sign == '-' else value
+
+
+def coerce_numbers(value, keys):
+    """Turn numeric strings under any of keys into numbers in place; returns how many were converted"""
+    converted = 0
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in keys and isinstance(item, str):
+                number = parse_number_string(item)
+                if number is not None:
+                    value[key] = number
+                    converted += 1
+            else:
+                converted += coerce_numbers(item, keys)
+    elif isinstance(value, list):
+        for item in value:
+            converted += coerce_numbers(item, keys)
+    return converted
+
+
+def _quote(text):
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _single_to_double(token):
+    return '"' + token[1:-1].replace("\\'", "'").replace('"', '\\"') + '"'
+
+
+def repair_object(text, start, repairs):
+    """
+    Rebuild the object opening at text[start] as valid JSON text, adding the
+    repairs made to the repairs set. Returns (json_text, end) where end is
+    the index just past the object, or raises JSONRepairError.
+    """
+    out = []
+    # One [closer, expecting, consistent] per open container. expecting is
+    # 'key', 'colon', 'value' or 'comma'; consistent is the length of out at
+    # the container's last complete member, where a truncation can be cut.
+    stack = []
+    end = len(text)
+    completed = False
+
+    for match in _TOKENS.finditer(text, start):
+        kind = match.lastgroup
+        token = match.group()
+        if kind == 'ws':
+            continue
+
+        if kind in ('string', 'squote', 'word', 'open'):
+            if not stack:
+                if kind != 'open':
+                    raise JSONRepairError("No object found")
+            else:
+                if kind == 'word' and match.end() == len(text):
+                    # A number or word running into the end of the output may itself be cut short
+                    break
+                frame = stack[-1]
+                if frame[1] == 'comma':
+                    out.append(',')
+                    frame[1] = 'key' if frame[0] == '}' else 'value'
+                    repairs.add('missing_comma')
+                if frame[1] == 'colon':
+                    raise JSONRepairError(f"Expected ':' at position {match.start()}")
+
+            if kind == 'open':
+                out.append(token)
+                stack.append(['}' if token == '{' else ']', 'key' if token == '{' else 'value', len(out)])
+                continue
+
+            frame = stack[-1]
+            if frame[1] == 'key':
+                if kind == 'string':
+                    out.append(token)
+                elif kind == 'squote':
+                    out.append(_single_to_double(token))
+                    repairs.add('single_quotes')
+                else:
+                    out.append(_quote(token))
+                    repairs.add('unquoted_keys')
+                frame[1] = 'colon'
+                continue
+
+            if kind == 'string':
+                out.append(token)
+            elif kind == 'squote':
+                out.append(_single_to_double(token))
+                repairs.add('single_quotes')
+            elif token in ('true', 'false', 'null') or _NUMBER.match(token):
+                out.append(token)
+            else:
+                out.append(_WORDS.get(token) or _quote(token))
+                repairs.add('bare_words')
+            frame[1] = 'comma'
+            frame[2] = len(out)
+
+        elif kind == 'open_string':
+            # An unterminated string can only be the output being cut off
+            break
+
+        elif kind == 'colon':
+            if not stack or stack[-1][1] != 'colon':
+                raise JSONRepairError(f"Unexpected ':' at position {match.start()}")
+            out.append(':')
+            stack[-1][1] = 'value'
+
+        elif kind == 'comma':
+            if not stack:
+                raise JSONRepairError("No object found")
+            frame = stack[-1]
+            if frame[1] == 'comma':
+                out.append(',')
+                frame[1] = 'key' if frame[0] == '}' else 'value'
+            else:
+                repairs.add('trailing_comma')
+
+        else:  # close
+            if not stack:
+                raise JSONRepairError("No object found")
+            frame = stack.pop()
+            if frame[1] != 'comma' and len(out) > frame[2]:
+                # Drop a dangling comma, or a key with no value
+                del out[frame[2]:]
+                repairs.add('trailing_comma')
+            out.append(frame[0])
+            if not stack:
+                end = match.end()
+                completed = True
+                break
+            stack[-1][1] = 'comma'
+            stack[-1][2] = len(out)
+
+    if not completed:
+        if not stack:
+            raise JSONRepairError("No object found")
+        repairs.add('truncated')
+        # Drop the outermost array element that was cut off, with everything inside it
+        cut = len(stack) - 1
+        for depth in range(1, len(stack)):
+            if stack[depth - 1][0] == ']':
+                cut = depth - 1
+                break
+        del stack[cut + 1:]
+        del out[stack[-1][2]:]
+        while stack:
+            out.append(stack.pop()[0])
+            if stack:
+                stack[-1][2] = len(out)
+    return ''.join(out), end
+
+
+def extract_json(text, numeric_keys=('value',)):
+    """
+    Parse a model completion into JSON, repairing it if needed.
+    Returns (value, repairs) with repairs a sorted list of the repair kinds
+    applied (empty for clean output). Raises JSONRepairError when no object
+    can be recovered.
+    """
+    text = text or ''
+    repairs = set()
+    try:
+        value = json.loads(strip_fences(text))
+    except json.JSONDecodeError:
+        value = None
+    if not isinstance(value, dict):
+        # Not valid JSON, or valid JSON that isn't an object: look for one in the text
+        value = None
+        starts = []
+        start = text.find('{')
+        while start != -1 and len(starts) < MAX_CANDIDATES:
+            starts.append(start)
+            start = text.find('{', start + 1)
+        if not starts:
+            raise JSONRepairError("No JSON object in the response")
+
+        # Candidates in order: an intact object among prose only needs cutting
+        # out; otherwise it is repaired. An empty result means the brace was
+        # prose ("for {topic}") or nothing usable survived, so try the next one.
+        error = None
+        for start in starts:
+            attempt = set()
+            try:
+                candidate, end = _decoder.raw_decode(text, start)
+            except json.JSONDecodeError:
+                try:
+                    repaired, end = repair_object(text, start, attempt)
+                    candidate = json.loads(repaired, strict=False)
+                except (JSONRepairError, json.JSONDecodeError) as e:
+                    error = e
+                    continue
+            if isinstance(candidate, dict) and candidate:
+                value = candidate
+                repairs |= attempt
+                break
+        if value is None:
+            raise JSONRepairError(str(error) if error else "No JSON object in the response")
+
+        if strip_fences(text[:start]):
+            repairs.add('leading_text')
+        if strip_fences(text[end:]):
+            repairs.add('trailing_text')
+
+    if numeric_keys and coerce_numbers(value, numeric_keys):
+        repairs.add('coerced_numbers')
+    return value, sorted(repairs)
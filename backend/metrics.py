@@ -0,0 +1,177 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, spanning cache hits to full upstream timeouts
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}' for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            # Store per-bucket counts and accumulate at render time to keep observe() cheap
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}')
+        return lines
+
+
+class Registry:
+    """Holds metrics plus collector callbacks and renders the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """Add a callable returning [(name, kind, documentation, {labels}, value)] at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+
+        # Group collector samples by name, since each metric family must be contiguous
+        families = {}
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception:
+                # A broken collector must not take the whole scrape down
+                continue
+            for name, kind, documentation, labels, value in samples:
+                family = families.setdefault(name, (kind, documentation, []))
+                family[2].append(f'{name}{_format_labels(labels.keys(), labels.values())} {value}')
+        for name, (kind, documentation, samples) in families.items():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    'fastboard_requests_total', 'Requests by endpoint, model and outcome', ('endpoint', 'model', 'outcome'))
+REQUEST_SECONDS = registry.histogram(
+    'fastboard_request_seconds', 'End-to-end handler latency', ('endpoint',))
+STAGE_SECONDS = registry.histogram(
+    'fastboard_stage_seconds', 'Latency of each handler stage', ('endpoint', 'stage'))
+UPSTREAM_SECONDS = registry.histogram(
+    'fastboard_upstream_seconds', 'Perplexity call latency by phase (connect is new connections only, ttfb includes it, total includes retries)',
+    ('model', 'phase'))
+UPSTREAM_RESPONSES = registry.counter(
+    'fastboard_upstream_responses_total', 'Perplexity responses by model and HTTP status', ('model', 'status'))
+UPSTREAM_TOKENS = registry.counter(
+    'fastboard_upstream_tokens_total', 'Tokens reported in Perplexity usage', ('endpoint', 'model', 'kind'))
+JSON_DECODE_FAILURES = registry.counter(
+    'fastboard_json_decode_failures_total', 'Model outputs that failed to parse as JSON', ('endpoint',))
+JSON_REPAIRS = registry.counter(
+    'fastboard_json_repairs_total', 'Model outputs that parsed only after repair, by kind of repair', ('endpoint', 'repair'))
+ROUTED_CALLS = registry.counter(
+    'fastboard_routed_calls_total', 'Generation attempts by endpoint, kind of output, model and outcome',
+    ('endpoint', 'kind', 'model', 'outcome'))
+MODEL_ROUTES = registry.counter(
+    'fastboard_model_routes_total', 'Routing decisions by requested and routed model', ('endpoint', 'requested', 'routed'))
+MODEL_ESCALATIONS = registry.counter(
+    'fastboard_model_escalations_total', 'Generations retried on an escalated route, by reason', ('endpoint', 'reason'))
+FALLBACK_WIDGETS = registry.counter(
+    'fastboard_fallback_widgets_total', 'Widgets whose data was replaced by a fallback', ('endpoint', 'widget_type'))
+
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    'fastboard_admission_wait_seconds', 'Time spent waiting for an upstream slot', ('priority',))
+ADMISSION_REJECTIONS = registry.counter(
+    'fastboard_admission_rejections_total', 'Requests turned away by the upstream limiter', ('reason',))
+
+
+def record_stage(endpoint, stage, started):
+    """Observe the time since a perf_counter() start for one handler stage"""
+    STAGE_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, stage=stage)
+
+
+def record_usage(endpoint, model, usage):
+    """Count the token usage Perplexity reports for a completion"""
+    if not isinstance(usage, dict):
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        if isinstance(usage.get(kind), (int, float)):
+            UPSTREAM_TOKENS.inc(usage[kind], endpoint=endpoint, model=model, kind=kind.replace('_tokens', ''))
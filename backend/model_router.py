@@ -0,0 +1,201 @@
+import math
+import os
+import threading
+from collections import deque
+
+from metrics import MODEL_ESCALATIONS, MODEL_ROUTES, ROUTED_CALLS
+
+# Model routing settings
+ROUTING_ENABLED = os.getenv('ROUTING_ENABLED', 'false').lower() in ('1', 'true', 'yes')  # off: always the requested model
+MODEL_TIERS = os.getenv('MODEL_TIERS', 'sonar,sonar-pro')  # cheapest first
+ROUTING_SIMPLE_KINDS = os.getenv('ROUTING_SIMPLE_KINDS', 'number')  # outputs always sent to the cheapest tier
+ROUTING_SIMPLE_MAX_TOKENS = int(os.getenv('ROUTING_SIMPLE_MAX_TOKENS', '200'))
+ROUTING_MAX_ESCALATION_RATE = float(os.getenv('ROUTING_MAX_ESCALATION_RATE', '0.2'))
+ROUTING_WINDOW = int(os.getenv('ROUTING_WINDOW', '200'))
+ROUTING_MIN_SAMPLES = int(os.getenv('ROUTING_MIN_SAMPLES', '20'))
+ROUTING_TOKEN_HEADROOM = float(os.getenv('ROUTING_TOKEN_HEADROOM', '1.5'))
+ROUTING_MIN_MAX_TOKENS = int(os.getenv('ROUTING_MIN_MAX_TOKENS', '256'))
+ROUTING_MAX_MAX_TOKENS = int(os.getenv('ROUTING_MAX_MAX_TOKENS', '4000'))
+ROUTING_MAX_ESCALATIONS = int(os.getenv('ROUTING_MAX_ESCALATIONS', '1'))
+
+# Attempt outcomes; the last two are retried on an escalated route
+OUTCOMES = ('ok', 'upstream_error', 'invalid', 'truncated')
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+class Route:
+    """The model and max_tokens chosen for one generation call"""
+
+    def __init__(self, endpoint, kind, requested_model, model, max_tokens, default_max_tokens=None, escalations=0):
+        self.endpoint = endpoint
+        self.kind = kind
+        self.requested_model = requested_model
+        self.model = model
+        self.max_tokens = max_tokens
+        self.default_max_tokens = default_max_tokens
+        self.escalations = escalations
+
+    def apply(self, payload):
+        """A copy of payload sent on this route"""
+        return dict(payload, model=self.model, max_tokens=self.max_tokens)
+
+
+class _Bucket:
+    """Recent attempts for one endpoint, kind of output and model"""
+
+    def __init__(self, window):
+        self.attempts = deque(maxlen=window)  # (completion_tokens or None, seconds, outcome)
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.default_max_tokens = None
+
+    def tokens(self):
+        return [tokens for tokens, _, _ in self.attempts if tokens is not None]
+
+    def escalation_rate(self):
+        if len(self.attempts) < ROUTING_MIN_SAMPLES:
+            return 0.0
+        return sum(outcome in ('invalid', 'truncated') for _, _, outcome in self.attempts) / len(self.attempts)
+
+
+class ModelRouter:
+    """
+    Picks the model and max_tokens for each generation call from the
+    completion sizes, latencies and outcomes observed for the same endpoint,
+    kind of output ('dashboard', 'plan', a widget type, or 'csv' for CSV widget
+    specs) and model:
+
+    - max_tokens is the recent p95 completion size plus headroom, once a
+      bucket has enough samples; until then the payload's own max_tokens
+    - requests likely to be simple (a kind in ROUTING_SIMPLE_KINDS, or whose
+      p95 completion is under ROUTING_SIMPLE_MAX_TOKENS) go to the cheapest
+      tier, unless outputs there have recently needed escalating too often
+    - a truncated output is retried with twice the max_tokens, an invalid one
+      on the next tier up, at most ROUTING_MAX_ESCALATIONS times
+
+    A truncated completion only shows a lower bound on the size it needed, so
+    it is recorded at twice its max_tokens. Statistics are per process.
+    """
+
+    def __init__(self, tiers, simple_kinds, window=ROUTING_WINDOW):
+        self.tiers = tiers
+        self.simple_kinds = set(simple_kinds)
+        self.window = window
+        self._buckets = {}
+        self._routed_down = 0
+        self._escalations = {'invalid': 0, 'truncated': 0}
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint, kind, model):
+        # Called with the lock held
+        key = (endpoint, kind, model)
+        if key not in self._buckets:
+            self._buckets[key] = _Bucket(self.window)
+        return self._buckets[key]
+
+    def _budget(self, bucket, default):
+        tokens = bucket.tokens()
+        if default is None or len(tokens) < ROUTING_MIN_SAMPLES:
+            return default
+        needed = math.ceil(percentile(tokens, 0.95) * ROUTING_TOKEN_HEADROOM)
+        return max(ROUTING_MIN_MAX_TOKENS, min(ROUTING_MAX_MAX_TOKENS, needed))
+
+    def _is_simple(self, endpoint, kind, model):
+        if kind in self.simple_kinds:
+            return True
+        tokens = self._bucket(endpoint, kind, model).tokens()
+        return len(tokens) >= ROUTING_MIN_SAMPLES and percentile(tokens, 0.95) <= ROUTING_SIMPLE_MAX_TOKENS
+
+    def route(self, endpoint, kind, payload):
+        """The Route for a payload built with the client's model and the endpoint's default max_tokens"""
+        requested = payload.get('model', '')
+        default = payload.get('max_tokens')
+        if not ROUTING_ENABLED:
+            return Route(endpoint, kind, requested, requested, default, default)
+        with self._lock:
+            model = requested
+            cheapest = self.tiers[0] if self.tiers else requested
+            if (requested in self.tiers and cheapest != requested and self._is_simple(endpoint, kind, requested)
+                    and self._bucket(endpoint, kind, cheapest).escalation_rate() <= ROUTING_MAX_ESCALATION_RATE):
+                model = cheapest
+                self._routed_down += 1
+            max_tokens = self._budget(self._bucket(endpoint, kind, model), default)
+        MODEL_ROUTES.inc(endpoint=endpoint, requested=requested, routed=model)
+        return Route(endpoint, kind, requested, model, max_tokens, default)
+
+    def escalate(self, route, outcome, record=True):
+        """
+        The Route to retry a truncated or invalid output on, or None if it can't
+        be escalated further. Counted in the stats only with record.
+        """
+        if not ROUTING_ENABLED or route.escalations >= ROUTING_MAX_ESCALATIONS:
+            return None
+        model, max_tokens = route.model, route.max_tokens
+        if outcome == 'truncated' and max_tokens is not None:
+            max_tokens = min(max_tokens * 2, max(ROUTING_MAX_MAX_TOKENS, max_tokens))
+        elif outcome == 'invalid' and model in self.tiers[:-1]:
+            model = self.tiers[self.tiers.index(model) + 1]
+        if (model, max_tokens) == (route.model, route.max_tokens):
+            return None
+        if record:
+            with self._lock:
+                self._escalations[outcome] += 1
+            MODEL_ESCALATIONS.inc(endpoint=route.endpoint, reason=outcome)
+        return Route(route.endpoint, route.kind, route.requested_model, model, max_tokens, route.default_max_tokens,
+                     route.escalations + 1)
+
+    def record(self, route, usage, seconds, outcome):
+        """Record one attempt on route: the usage Perplexity reported, its latency and outcome (one of OUTCOMES)"""
+        tokens = usage.get('completion_tokens') if isinstance(usage, dict) else None
+        if not isinstance(tokens, (int, float)):
+            tokens = None
+        if outcome == 'truncated':
+            tokens = 2 * max(tokens or 0, route.max_tokens or 0) or None
+        with self._lock:
+            bucket = self._bucket(route.endpoint, route.kind, route.model)
+            bucket.default_max_tokens = route.default_max_tokens
+            bucket.attempts.append((tokens, seconds, outcome))
+            bucket.outcomes[outcome] += 1
+        ROUTED_CALLS.inc(endpoint=route.endpoint, kind=route.kind, model=route.model, outcome=outcome)
+
+    def stats(self):
+        with self._lock:
+            buckets = []
+            for (endpoint, kind, model), bucket in sorted(self._buckets.items()):
+                if not bucket.attempts:
+                    continue
+                tokens = bucket.tokens()
+                seconds = [attempt[1] for attempt in bucket.attempts]
+                buckets.append({
+                    "endpoint": endpoint,
+                    "kind": kind,
+                    "model": model,
+                    "outcomes": dict(bucket.outcomes),
+                    "window": len(bucket.attempts),
+                    "completion_tokens": {
+                        "p50": percentile(tokens, 0.5), "p95": percentile(tokens, 0.95), "max": max(tokens)
+                    } if tokens else None,
+                    "latency_seconds": {
+                        "p50": round(percentile(seconds, 0.5), 3), "p95": round(percentile(seconds, 0.95), 3)
+                    },
+                    "escalation_rate": round(bucket.escalation_rate(), 3),
+                    "max_tokens": self._budget(bucket, bucket.default_max_tokens),
+                })
+            return {
+                "enabled": ROUTING_ENABLED,
+                "tiers": self.tiers,
+                "simple_kinds": sorted(self.simple_kinds),
+                "routed_down": self._routed_down,
+                "escalations": dict(self._escalations),
+                "buckets": buckets,
+            }
+
+
+model_router = ModelRouter(
+    [tier.strip() for tier in MODEL_TIERS.split(',') if tier.strip()],
+    [kind.strip() for kind in ROUTING_SIMPLE_KINDS.split(',') if kind.strip()]
+)
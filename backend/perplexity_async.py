@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+
+from metrics import UPSTREAM_RESPONSES, UPSTREAM_SECONDS
+from perplexity_client import (
+    CONNECT_TIMEOUT, MAX_RETRIES, PERPLEXITY_API_KEY, PERPLEXITY_BASE_URL, READ_TIMEOUT, RETRY_STATUSES,
+    UpstreamError, _backoff_delay
+)
+
+# One pooled connection per pending generation is cheap on an event loop, so the
+# async pool can be much larger than the threaded one
+ASYNC_POOL_SIZE = int(os.getenv('PERPLEXITY_ASYNC_POOL_SIZE', '200'))
+
+_session = None
+
+
+async def _on_connection_create_start(session, context, params):
+    context.connect_started = time.perf_counter()
+
+
+async def _on_connection_create_end(session, context, params):
+    model = (context.trace_request_ctx or {}).get('model', '')
+    UPSTREAM_SECONDS.observe(time.perf_counter() - context.connect_started, model=model, phase='connect')
+
+
+def _connect_trace():
+    """Records how long opening each new connection takes (DNS, TCP, plus TLS for HTTPS)"""
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_start.append(_on_connection_create_start)
+    trace.on_connection_create_end.append(_on_connection_create_end)
+    return trace
+
+
+def get_async_session():
+    """Return the shared pooled aiohttp session, creating it on first use (inside the running loop)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ASYNC_POOL_SIZE),
+            headers={'Content-Type': 'application/json'},
+            trace_configs=[_connect_trace()]
+        )
+    return _session
+
+
+async def close_async_session():
+    """Close the shared session's connections, e.g. on ASGI shutdown"""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def _timeout(read_timeout, connect_timeout):
+    # sock_read bounds the gap between reads, like the read timeout in requests
+    return aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout or CONNECT_TIMEOUT,
+                                 sock_read=read_timeout or READ_TIMEOUT)
+
+
+def _is_retryable(error):
+    # Read timeouts are not retried: the upstream may still be working on it
+    return not isinstance(error, aiohttp.SocketTimeoutError)
+
+
+async def _open(session, payload, headers, timeout, retries, model):
+    """POST with the retry policy of post_chat_completion, returning the open final response"""
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            response = await session.post(f'{PERPLEXITY_BASE_URL}/chat/completions', json=payload,
+                                          headers=headers, timeout=timeout, trace_request_ctx={'model': model})
+        except aiohttp.ClientConnectionError as e:
+            UPSTREAM_RESPONSES.inc(model=model, status='connection_error')
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            await asyncio.sleep(_backoff_delay(attempt))
+            continue
+
+        UPSTREAM_RESPONSES.inc(model=model, status=response.status)
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, phase='ttfb')
+        if response.status not in RETRY_STATUSES or attempt >= retries:
+            return response
+
+        delay = _backoff_delay(attempt, response)
+        response.release()
+        await asyncio.sleep(delay)
+
+
+async def async_post_chat_completion(payload, read_timeout=None, connect_timeout=None, max_retries=None):
+    """
+    Async counterpart of post_chat_completion with the same retry and backoff
+    policy. Returns (status_code, body_text) for the final response.
+    """
+    headers = {'Authorization': f'Bearer {PERPLEXITY_API_KEY}'}
+    retries = MAX_RETRIES if max_retries is None else max_retries
+    model = payload.get('model', '')
+    started = time.perf_counter()
+
+    response = await _open(get_async_session(), payload, headers, _timeout(read_timeout, connect_timeout), retries, model)
+    async with response:
+        text = await response.text(encoding='utf-8')
+    UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, phase='total')
+    return response.status, text
+
+
+async def async_stream_chat_completion(payload, read_timeout=None, connect_timeout=None, max_retries=None):
+    """
+    Async counterpart of stream_chat_completion: yields ('delta', text) for each
+    content chunk and finally ('usage', dict). Raises UpstreamError on a non-200 status.
+    """
+    headers = {'Authorization': f'Bearer {PERPLEXITY_API_KEY}', 'Accept': 'text/event-stream'}
+    retries = MAX_RETRIES if max_retries is None else max_retries
+    model = payload.get('model', '')
+    started = time.perf_counter()
+
+    response = await _open(get_async_session(), {**payload, 'stream': True}, headers,
+                           _timeout(read_timeout, connect_timeout), retries, model)
+    async with response:
+        if response.status != 200:
+            raise UpstreamError(response.status, await response.text(encoding='utf-8'))
+
+        usage = None
+        first_token = True
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            usage = chunk.get('usage') or usage
+            for choice in chunk.get('choices', []):
+                content = (choice.get('delta') or {}).get('content')
+                if content:
+                    if first_token:
+                        UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, phase='first_token')
+                        first_token = False
+                    yield 'delta', content
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, phase='total')
+        if usage:
+            yield 'usage', usage
@@ -0,0 +1,222 @@
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from metrics import UPSTREAM_RESPONSES, UPSTREAM_SECONDS
+
+# Configure Perplexity API
+PERPLEXITY_API_KEY = os.getenv('PERPLEXITY_API_KEY')
+PERPLEXITY_BASE_URL = os.getenv('PERPLEXITY_BASE_URL', 'https://api.perplexity.ai')
+
+# Connection pool and timeout settings (seconds)
+POOL_SIZE = int(os.getenv('PERPLEXITY_POOL_SIZE', '20'))
+CONNECT_TIMEOUT = float(os.getenv('PERPLEXITY_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('PERPLEXITY_READ_TIMEOUT', '45'))
+
+# Retry settings for 429 and 5xx responses
+MAX_RETRIES = int(os.getenv('PERPLEXITY_MAX_RETRIES', '2'))
+BACKOFF_BASE = float(os.getenv('PERPLEXITY_BACKOFF_BASE', '0.5'))
+BACKOFF_MAX = float(os.getenv('PERPLEXITY_BACKOFF_MAX', '8'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+# The model of the call the current thread is making, for labelling its connect time
+_calling = threading.local()
+
+
+class UpstreamError(Exception):
+    """Non-200 response from the Perplexity API"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Perplexity API error: {status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """Records how long opening each new connection takes (TCP, plus TLS for HTTPS)"""
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=getattr(_calling, 'model', ''), phase='connect')
+
+
+class _TimedHTTPSConnection(_TimedHTTPConnection, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools open connections that record their connect phase"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+
+def get_session():
+    """Return the shared pooled session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Keep-alive connections are reused from this pool across requests
+                adapter = _TimedHTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Content-Type': 'application/json', 'Connection': 'keep-alive'})
+                _session = session
+    return _session
+
+
+def _retry_after_seconds(response):
+    """Parse a Retry-After header (delta-seconds or HTTP date), or None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(attempt, response=None):
+    """Full-jitter exponential backoff, honouring Retry-After when present"""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+    if response is not None:
+        retry_after = _retry_after_seconds(response)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, BACKOFF_MAX))
+    return delay
+
+
+def post_chat_completion(payload, read_timeout=None, connect_timeout=None, max_retries=None):
+    """
+    POST a chat completion to Perplexity through the shared session.
+    Retries with jittered exponential backoff on 429/5xx responses and connection
+    errors, and returns the final requests.Response (callers check status_code).
+    """
+    headers = {'Authorization': f'Bearer {PERPLEXITY_API_KEY}'}
+    timeout = (connect_timeout or CONNECT_TIMEOUT, read_timeout or READ_TIMEOUT)
+    retries = MAX_RETRIES if max_retries is None else max_retries
+    session = get_session()
+    model = payload.get('model', '')
+    started = time.perf_counter()
+    _calling.model = model
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.post(
+                f'{PERPLEXITY_BASE_URL}/chat/completions',
+                headers=headers,
+                json=payload,
+                timeout=timeout
+            )
+        except requests.exceptions.ConnectionError:
+            UPSTREAM_RESPONSES.inc(model=model, status='connection_error')
+            # Read timeouts are not retried: the upstream may still be working on it
+            if attempt >= retries:
+                raise
+            time.sleep(_backoff_delay(attempt))
+            continue
+
+        UPSTREAM_RESPONSES.inc(model=model, status=response.status_code)
+        UPSTREAM_SECONDS.observe(response.elapsed.total_seconds(), model=model, phase='ttfb')
+        if response.status_code not in RETRY_STATUSES or attempt >= retries:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, phase='total')
+            return response
+
+        delay = _backoff_delay(attempt, response)
+        response.close()
+        time.sleep(delay)
+
+
+def stream_chat_completion(payload, read_timeout=None, connect_timeout=None, max_retries=None):
+    """
+    Stream a chat completion from Perplexity as server-sent events.
+    Retries like post_chat_completion until the stream is open, then yields
+    ('delta', text) for each content chunk and finally ('usage', dict) if the
+    upstream reported token usage. Raises UpstreamError on a non-200 status.
+    """
+    headers = {'Authorization': f'Bearer {PERPLEXITY_API_KEY}', 'Accept': 'text/event-stream'}
+    timeout = (connect_timeout or CONNECT_TIMEOUT, read_timeout or READ_TIMEOUT)
+    retries = MAX_RETRIES if max_retries is None else max_retries
+    session = get_session()
+    stream_payload = {**payload, 'stream': True}
+    model = payload.get('model', '')
+    started = time.perf_counter()
+    _calling.model = model
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.post(
+                f'{PERPLEXITY_BASE_URL}/chat/completions',
+                headers=headers,
+                json=stream_payload,
+                timeout=timeout,
+                stream=True
+            )
+        except requests.exceptions.ConnectionError:
+            UPSTREAM_RESPONSES.inc(model=model, status='connection_error')
+            if attempt >= retries:
+                raise
+            time.sleep(_backoff_delay(attempt))
+            continue
+
+        UPSTREAM_RESPONSES.inc(model=model, status=response.status_code)
+        UPSTREAM_SECONDS.observe(response.elapsed.total_seconds(), model=model, phase='ttfb')
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            delay = _backoff_delay(attempt, response)
+            response.close()
+            time.sleep(delay)
+            continue
+        break
+
+    with response:
+        if response.status_code != 200:
+            raise UpstreamError(response.status_code, response.text)
+
+        usage = None
+        first_token = True
+        for raw_line in response.iter_lines():
+            # Decode per line: event streams often omit a charset, and a line never splits a character
+            line = raw_line.decode('utf-8')
+            if not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            usage = chunk.get('usage') or usage
+            for choice in chunk.get('choices', []):
+                content = (choice.get('delta') or {}).get('content')
+                if content:
+                    if first_token:
+                        UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, phase='first_token')
+                        first_token = False
+                    yield 'delta', content
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, model=model, phase='total')
+        if usage:
+            yield 'usage', usage
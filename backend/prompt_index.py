@@ -0,0 +1,230 @@
+import os
+import random
+import re
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from operator import eq
+
+# Approximate prompt matching settings
+PROMPT_INDEX_ENABLED = os.getenv('PROMPT_INDEX_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+PROMPT_INDEX_THRESHOLD = float(os.getenv('PROMPT_INDEX_THRESHOLD', '0.75'))
+# Roughly 0.8 KB per indexed prompt, per worker
+PROMPT_INDEX_MAX_ENTRIES = int(os.getenv('PROMPT_INDEX_MAX_ENTRIES', '50000'))
+
+# 32 MinHash values per prompt, banded 6 x 5 for LSH. A prompt whose shingles
+# overlap an indexed one's by 0.8 finds it as a candidate 91% of the time
+# (0.9: 99.5%), while prompts at 0.4, which mostly share a common word, do so
+# 6% of the time. Candidates are then checked exactly.
+NUM_HASHES = 32
+BANDS = 6
+ROWS = 5
+# Candidates whose estimated similarity is this far below the threshold skip the exact check
+ESTIMATE_MARGIN = 0.2
+
+STOPWORDS = frozenset(
+    'a an and are about as at by for from how in is me my of on over show the to vs versus was were what with'.split()
+)
+# Words that ask for the same dashboard, folded to one token. Only true
+# equivalents: near-synonyms that change the question ("market share" vs
+# "stock", "most popular" vs "largest") must stay apart.
+SYNONYMS = {
+    'scoring': 'score', 'scored': 'score', 'point': 'score', 'pt': 'score',
+    'historical': 'history', 'yearly': 'annual',
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_MASK = (1 << 64) - 1
+_EMPTY = _MASK + 1
+_LANES = struct.Struct(f'<{NUM_HASHES}H')
+# Fixed probe order per bin for filling empty bins (optimal densification), so
+# that two prompts fill a bin from the same place
+_PROBES = [random.Random(i).sample([j for j in range(NUM_HASHES) if j != i], NUM_HASHES - 1)
+           for i in range(NUM_HASHES)]
+
+
+def prompt_tokens(prompt):
+    """Lowercased content words with possessives, plurals and synonyms folded"""
+    tokens = []
+    for token in _TOKEN.findall((prompt or '').lower().replace("'s", '')):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(SYNONYMS.get(token, token))
+    return tokens
+
+
+def shingles(tokens):
+    """Character trigrams of each padded token, so word order and small typos barely matter"""
+    grams = set()
+    for token in tokens:
+        padded = f' {token} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def prompt_similarity(tokens_a, tokens_b):
+    """
+    Mean of the trigram and word Jaccard similarities. The word term keeps
+    prompts that differ in one short but decisive word ("US GDP" and "UK GDP")
+    apart, which trigrams alone rate as close.
+    """
+    return (jaccard(shingles(tokens_a), shingles(tokens_b)) + jaccard(set(tokens_a), set(tokens_b))) / 2
+
+
+def minhash(grams):
+    """
+    One-permutation MinHash: each shingle is hashed once and kept if it is the
+    smallest in its bin, then empty bins borrow from a fixed other bin. Costs
+    one hash per shingle instead of NUM_HASHES. Uses the process's str hash,
+    so signatures are only comparable within one process.
+    """
+    if not grams:
+        return None
+    bins = [_EMPTY] * NUM_HASHES
+    for h in map(hash, grams):
+        h &= _MASK
+        lane = h % NUM_HASHES
+        if h < bins[lane]:
+            bins[lane] = h
+    signature = bins[:]
+    for lane, value in enumerate(bins):
+        if value == _EMPTY:
+            signature[lane] = next(bins[j] for j in _PROBES[lane] if bins[j] != _EMPTY)
+    return signature
+
+
+def estimate_similarity(lanes, packed):
+    """Share of equal MinHash values, an estimate of the shingle sets' Jaccard similarity"""
+    return sum(map(eq, lanes, _LANES.unpack(packed))) / NUM_HASHES
+
+
+class PromptIndex:
+    """
+    MinHash/LSH index from prompts to the response cache keys of their results,
+    so paraphrases of a recent prompt can be served from the cache. Entries are
+    scoped by namespace (endpoint and model); numbers in the prompt must match
+    exactly, so "revenue 2023" never answers "revenue 2024". Bounded by LRU eviction.
+    """
+
+    def __init__(self, threshold, max_entries):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # cache key -> (namespace, prompt, packed 16-bit signature lanes, numbers), in LRU order
+        self._entries = OrderedDict()
+        # band key -> cache key, or a list of them on collision
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.counters = {"lookups": 0, "hits": 0, "adds": 0, "evictions": 0}
+
+    @staticmethod
+    def _features(namespace, prompt):
+        """(tokens, band keys, 16-bit lanes, numbers) for a prompt, or None if it has no content words"""
+        tokens = prompt_tokens(prompt)
+        signature = minhash(shingles(tokens))
+        if signature is None:
+            return None
+        # The namespace is part of every band key, so other endpoints and models never collide
+        bands = [hash((namespace, band, *signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+        lanes = [value & 0xFFFF for value in signature]
+        numbers = tuple(sorted(token for token in tokens if any(c.isdigit() for c in token)))
+        return tokens, bands, lanes, numbers
+
+    def add(self, namespace, prompt, cache_key):
+        """Index prompt's result, stored in the response cache under cache_key"""
+        with self._lock:
+            if cache_key in self._entries:
+                # Same endpoint, model and normalized prompt, so the same features
+                self._entries.move_to_end(cache_key)
+                return
+        features = self._features(namespace, prompt)
+        if features is None:
+            return
+        _, bands, lanes, numbers = features
+        with self._lock:
+            if cache_key in self._entries:
+                return
+            self._entries[cache_key] = (sys.intern(namespace), prompt, _LANES.pack(*lanes), numbers)
+            for band in bands:
+                current = self._buckets.get(band)
+                if current is None:
+                    self._buckets[band] = cache_key
+                elif isinstance(current, list):
+                    current.append(cache_key)
+                else:
+                    self._buckets[band] = [current, cache_key]
+            self.counters['adds'] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def lookup(self, namespace, prompt):
+        """Return (cache_key, indexed_prompt, similarity) of the closest match above the threshold, or None"""
+        features = self._features(namespace, prompt)
+        with self._lock:
+            self.counters['lookups'] += 1
+            if features is None:
+                return None
+            tokens, bands, lanes, numbers = features
+            candidates = set()
+            for band in bands:
+                current = self._buckets.get(band)
+                if current is None:
+                    continue
+                if isinstance(current, list):
+                    candidates.update(current)
+                else:
+                    candidates.add(current)
+
+            best = None
+            for cache_key in candidates:
+                entry_namespace, entry_prompt, entry_lanes, entry_numbers = self._entries[cache_key]
+                if entry_namespace != namespace or entry_numbers != numbers:
+                    continue
+                if estimate_similarity(lanes, entry_lanes) < self.threshold - ESTIMATE_MARGIN:
+                    continue
+                similarity = prompt_similarity(tokens, prompt_tokens(entry_prompt))
+                if similarity >= self.threshold and (best is None or similarity > best[2]):
+                    best = (cache_key, entry_prompt, round(similarity, 3))
+            if best is not None:
+                self._entries.move_to_end(best[0])
+                self.counters['hits'] += 1
+            return best
+
+    def discard(self, cache_key):
+        """Forget an entry, e.g. once its cached result has expired"""
+        with self._lock:
+            if cache_key in self._entries:
+                self._remove(cache_key)
+
+    def _remove(self, cache_key):
+        # Band keys are recomputed rather than stored, which would double the memory per entry
+        namespace, prompt, _, _ = self._entries.pop(cache_key)
+        for band in self._features(namespace, prompt)[1]:
+            current = self._buckets.get(band)
+            if isinstance(current, list):
+                current.remove(cache_key)
+                if len(current) == 1:
+                    self._buckets[band] = current[0]
+            elif current == cache_key:
+                del self._buckets[band]
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            entries = len(self._entries)
+        return {
+            **counters,
+            "entries": entries,
+            "threshold": self.threshold,
+            "hit_rate": round(counters['hits'] / counters['lookups'], 4) if counters['lookups'] else 0.0,
+        }
+
+
+prompt_index = PromptIndex(PROMPT_INDEX_THRESHOLD, PROMPT_INDEX_MAX_ENTRIES) if PROMPT_INDEX_ENABLED else None
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Cache settings
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', '3600'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1000'))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_DISK_MAX_ENTRIES = int(os.getenv('CACHE_DISK_MAX_ENTRIES', '10000'))
+CACHE_DB_PATH = os.getenv(
+    'CACHE_DB_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'responses.sqlite3')
+)
+
+
+def normalize_prompt(prompt):
+    """Lowercase and collapse whitespace so trivially different prompts share a key"""
+    return ' '.join((prompt or '').lower().split())
+
+
+def make_cache_key(endpoint, prompt, model, widget_type='', dashboard_context=''):
+    """Build a stable cache key from the fields that determine a generation"""
+    parts = [
+        endpoint,
+        normalize_prompt(prompt),
+        model or '',
+        widget_type or '',
+        normalize_prompt(dashboard_context),
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class MemoryLRU:
+    """In-process LRU tier with per-entry TTL and entry/byte limits"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, text)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, text = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def set(self, key, text, expires_at):
+        size = len(text)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, text)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, text = self._entries.pop(key)
+        self._bytes -= len(text)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class DiskStore:
+    """
+    Persistent SQLite tier that survives restarts and is shared by workers.
+    Every PURGE_EVERY writes, expired rows are deleted, then the oldest written
+    rows over max_entries, so the file stays bounded however long the TTL.
+    """
+
+    PURGE_EVERY = 100
+
+    def __init__(self, path, max_entries=CACHE_DISK_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires_at)")
+        conn.commit()
+
+    def _conn(self):
+        # SQLite connections are not shareable across threads, so keep one per thread.
+        # Nor across processes: a worker forked from a preloading master must not
+        # reuse the master's connection, so open a fresh one when the pid changes.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        return row
+
+    def set(self, key, text, expires_at):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, text, expires_at)
+        )
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            evicted = self._purge(conn)
+            with self._lock:
+                self.evictions += evicted
+        conn.commit()
+
+    def _purge(self, conn):
+        """Delete expired rows, then the oldest over max_entries; returns how many went"""
+        evicted = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+        # INSERT OR REPLACE gives a rewritten key a new rowid, so rowid order is write order
+        evicted += conn.execute(
+            "DELETE FROM responses WHERE rowid IN ("
+            "SELECT rowid FROM responses ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        ).rowcount
+        return evicted
+
+    def stats(self):
+        count = self._conn().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"entries": count, "max_entries": self.max_entries, "evictions": self.evictions, "path": self.path}
+
+
+class TieredCache:
+    """Memory LRU in front of a persistent disk store, with hit/miss counters"""
+
+    def __init__(self, ttl_seconds, max_entries, max_bytes, db_path=None, disk_max_entries=CACHE_DISK_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.memory = MemoryLRU(max_entries, max_bytes)
+        self.disk = None
+        if db_path:
+            try:
+                self.disk = DiskStore(db_path, disk_max_entries)
+            except (OSError, sqlite3.Error):
+                # Fall back to memory-only caching if the disk tier can't be opened
+                self.disk = None
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        text = self.memory.get(key)
+        if text is not None:
+            self._count('memory_hits')
+            return json.loads(text)
+
+        if self.disk is not None:
+            try:
+                row = self.disk.get(key)
+            except sqlite3.Error:
+                self._count('errors')
+                row = None
+            if row is not None:
+                text, expires_at = row
+                # Promote to the memory tier for subsequent lookups
+                self.memory.set(key, text, expires_at)
+                self._count('disk_hits')
+                return json.loads(text)
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value, ttl_seconds=None):
+        """Store a JSON-serializable value in both tiers"""
+        text = json.dumps(value, separators=(',', ':'))
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        self.memory.set(key, text, expires_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, text, expires_at)
+            except sqlite3.Error:
+                self._count('errors')
+        self._count('sets')
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+        hits = counters['memory_hits'] + counters['disk_hits']
+        stats = {
+            **counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": self.memory.stats(),
+        }
+        if self.disk is not None:
+            try:
+                stats['disk'] = self.disk.stats()
+            except sqlite3.Error:
+                stats['disk'] = None
+        return stats
+
+
+response_cache = TieredCache(CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_DB_PATH) if CACHE_ENABLED else None
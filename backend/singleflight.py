@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+def payload_key(payload):
+    """Stable key for an upstream request payload"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller (the leader)
+    runs the function, and every caller that arrives while it is in flight waits
+    on the same future and receives its result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.counters = {"leaders": 0, "coalesced": 0, "wait_timeouts": 0}
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn() once per in-flight key and return its result to every caller.
+        Waiters raise TimeoutError if the leader hasn't finished within timeout
+        seconds; the leader itself is bounded only by fn's own timeouts.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+                self.counters['leaders'] += 1
+            else:
+                self.counters['coalesced'] += 1
+
+        if is_leader:
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                # Later callers start a fresh flight instead of reusing this result
+                with self._lock:
+                    self._calls.pop(key, None)
+            return future.result()
+
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.counters['wait_timeouts'] += 1
+            raise TimeoutError(f"Timed out after {timeout}s waiting for an identical in-flight request") from None
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), **self.counters}
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight for coroutines running on one event loop:
+    concurrent awaits that share a key wait on the leader's task.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.counters = {"leaders": 0, "coalesced": 0, "wait_timeouts": 0}
+
+    async def do(self, key, fn, timeout=None):
+        """
+        Await fn() once per in-flight key and return its result to every caller.
+        Waiters raise TimeoutError if the leader hasn't finished within timeout
+        seconds; a waiter giving up does not cancel the leader.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.counters['leaders'] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            # Later callers start a fresh flight instead of reusing this result
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            return await asyncio.shield(task)
+
+        self.counters['coalesced'] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.counters['wait_timeouts'] += 1
+            raise TimeoutError(f"Timed out after {timeout}s waiting for an identical in-flight request") from None
+
+    def stats(self):
+        return {"in_flight": len(self._calls), **self.counters}
@@ -0,0 +1,94 @@
+from json_repair import JSONRepairError, extract_json
+
+
+class WidgetStreamParser:
+    """
+    Incremental scanner for a streamed dashboard JSON object.
+    Feed it text chunks as they arrive; it returns each element of the
+    top-level "widgets" array as soon as that element's closing brace is seen.
+    Anything before the first '{' (such as a ```json fence) is ignored.
+    Widgets and the final object go through json_repair, so near-miss JSON
+    still yields them.
+    """
+
+    def __init__(self):
+        self._text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._pending_key = None
+        self._current_key = None
+        self._widgets_depth = None
+        self._widget_start = None
+        self.widgets_seen = 0
+        self.repairs = []
+
+    def feed(self, chunk):
+        """Consume a chunk of model output and return any widgets it completed"""
+        self._text += chunk
+        completed = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        # Top-level strings are candidate keys until we see what follows them
+                        self._pending_key = text[self._string_start + 1:i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ':' and self._depth == 1:
+                self._current_key = self._pending_key
+            elif ch == ',' and self._depth == 1:
+                self._current_key = None
+            elif ch in '{[':
+                if ch == '[' and self._depth == 1 and self._current_key == 'widgets':
+                    self._widgets_depth = 2
+                elif ch == '{' and self._widgets_depth is not None and self._depth == self._widgets_depth:
+                    self._widget_start = i
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._widgets_depth is not None:
+                    if ch == '}' and self._depth == self._widgets_depth and self._widget_start is not None:
+                        widget = self._parse_widget(text[self._widget_start:i + 1])
+                        if widget is not None:
+                            completed.append(widget)
+                        self._widget_start = None
+                    elif ch == ']' and self._depth == 1:
+                        self._widgets_depth = None
+        self._pos = len(text)
+        return completed
+
+    def _parse_widget(self, fragment):
+        try:
+            widget, _ = extract_json(fragment)
+        except JSONRepairError:
+            return None
+        if not isinstance(widget, dict):
+            return None
+        self.widgets_seen += 1
+        return widget
+
+    @property
+    def text(self):
+        """All model output received so far"""
+        return self._text
+
+    def finish(self):
+        """Parse the complete output, returning the dashboard dict or None; repairs lists what it needed"""
+        try:
+            result, self.repairs = extract_json(self._text)
+        except JSONRepairError:
+            return None
+        return result if isinstance(result, dict) else None
@@ -0,0 +1,155 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Settings are read when the backend modules are imported, so the caches and
+# stores must point at a scratch directory before any test imports them
+SCRATCH_DIR = tempfile.mkdtemp(prefix='fastboard-tests-')
+os.environ['CACHE_DB_PATH'] = os.path.join(SCRATCH_DIR, 'responses.sqlite3')
+os.environ['DASHBOARD_DB_PATH'] = os.path.join(SCRATCH_DIR, 'dashboards.sqlite3')
+os.environ['DATASET_DIR'] = os.path.join(SCRATCH_DIR, 'datasets')
+os.environ.setdefault('PERPLEXITY_API_KEY', 'test-key')
+os.environ.setdefault('PERPLEXITY_MAX_RETRIES', '0')
+
+WIDGET = '{"name": "Total", "type": "number", "data": {"value": 1, "label": "Total"}}'
+DASHBOARD = ('{"dash_name": "Test", "category": "other", "widgets": ['
+             '{"name": "Bars", "type": "bar", "data": [{"name": "a", "value": 1}]},'
+             '{"name": "Total", "type": "number", "data": {"value": 1, "label": "Total"}}]}')
+
+
+class FakeUpstream:
+    """
+    A stand-in for the Perplexity chat completions API. Replies with content(payload),
+    wrapped in a ```json fence, after delay seconds; finish_reason is 'length' while
+    truncated is set. Each entry in failures is used up by one request first: a
+    (status_code, headers) error reply, or DROP to close the connection unanswered.
+    """
+
+    DROP = 'drop'
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.payloads = []
+        self.content = self.default_content
+        self.delay = 0
+        self.truncated = False
+        self.failures = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self.max_active = 0
+
+    @staticmethod
+    def default_content(payload):
+        return WIDGET if 'SINGLE widget' in json.dumps(payload) else DASHBOARD
+
+    @property
+    def calls(self):
+        return len(self.payloads)
+
+    def next_failure(self, payload):
+        """The failure to answer this request with, or None to answer it normally"""
+        with self._lock:
+            if not self.failures:
+                return None
+            self.payloads.append(payload)
+            return self.failures.pop(0)
+
+    def handle(self, payload):
+        with self._lock:
+            self.payloads.append(payload)
+            self._active += 1
+            self.max_active = max(self.max_active, self._active)
+        try:
+            time.sleep(self.delay)
+            return {
+                "model": payload.get('model'),
+                "choices": [{
+                    "message": {"content": '```json\n' + self.content(payload) + '\n```'},
+                    "finish_reason": 'length' if self.truncated else 'stop',
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5},
+            }
+        finally:
+            with self._lock:
+                self._active -= 1
+
+
+fake_upstream = FakeUpstream()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        failure = fake_upstream.next_failure(payload)
+        if failure == FakeUpstream.DROP:
+            self.close_connection = True
+            return
+        if failure is not None:
+            status_code, headers = failure
+            self.send_response(status_code)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '5')
+            self.end_headers()
+            self.wfile.write(b'error')
+            return
+        body = json.dumps(fake_upstream.handle(payload)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+_server.daemon_threads = True
+threading.Thread(target=_server.serve_forever, daemon=True).start()
+os.environ['PERPLEXITY_BASE_URL'] = f'http://127.0.0.1:{_server.server_port}'
+
+
+def json_body(response):
+    """The JSON body of a Flask or Starlette test client response"""
+    return response.get_json() if hasattr(response, 'get_json') else response.json()
+
+
+@pytest.fixture
+def upstream():
+    fake_upstream.reset()
+    yield fake_upstream
+    fake_upstream.reset()
+
+
+@pytest.fixture
+def client(upstream):
+    # Responses are cached across tests, so each test uses prompts of its own
+    return pytest.importorskip('app').app.test_client()
+
+
+@pytest.fixture
+def async_client(upstream):
+    asgi_app = pytest.importorskip('asgi_app')
+    from starlette.testclient import TestClient
+    with TestClient(asgi_app.application) as test_client:
+        yield test_client
+
+
+@pytest.fixture(params=['flask', 'asgi'])
+def any_client(request):
+    """The Flask test client, then the ASGI one, for routes both apps serve"""
+    return request.getfixturevalue('client' if request.param == 'flask' else 'async_client')
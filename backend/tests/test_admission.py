@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+
+from admission import PRIORITY_DASHBOARD, PRIORITY_WIDGET, AdmissionController, Overloaded, upstream_admission
+from conftest import json_body
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.005)
+
+
+def queue_in_thread(controller, model, priority, admitted):
+    """Start a thread that waits for a slot, records (model, priority) when admitted and releases it"""
+    def run():
+        with controller.acquire(model, priority):
+            admitted.append((model, priority))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_higher_priority_waiter_is_dispatched_first():
+    controller = AdmissionController(1, max_queue=4, queue_timeout=2)
+    held = controller.acquire('sonar-pro')
+    admitted = []
+    threads = [queue_in_thread(controller, 'sonar-pro', PRIORITY_DASHBOARD, admitted)]
+    wait_until(lambda: controller.stats()['queue_depth'] == 1)
+    threads.append(queue_in_thread(controller, 'sonar-pro', PRIORITY_WIDGET, admitted))
+    wait_until(lambda: controller.stats()['queue_depth'] == 2)
+
+    held.release()
+    for thread in threads:
+        thread.join()
+
+    assert admitted == [('sonar-pro', PRIORITY_WIDGET), ('sonar-pro', PRIORITY_DASHBOARD)]
+    assert controller.stats()['active'] == 0
+
+
+def test_model_limit_does_not_block_other_models():
+    controller = AdmissionController(4, {'sonar-pro': 1}, max_queue=0)
+    held = controller.acquire('sonar-pro')
+
+    with pytest.raises(Overloaded):
+        controller.acquire('sonar-pro')
+    with controller.acquire('sonar'):
+        assert controller.stats()['active_by_model'] == {'sonar-pro': 1, 'sonar': 1}
+    held.release()
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    controller = AdmissionController(1, max_queue=0, retry_after=7)
+    held = controller.acquire('sonar-pro')
+
+    with pytest.raises(Overloaded) as rejected:
+        controller.acquire('sonar-pro')
+    assert rejected.value.retry_after == 7
+    assert controller.stats()['rejected'] == 1
+    held.release()
+
+
+def test_wait_timeout_is_rejected_and_leaves_the_queue():
+    controller = AdmissionController(1, max_queue=4, queue_timeout=0.05)
+    held = controller.acquire('sonar-pro')
+
+    with pytest.raises(Overloaded):
+        controller.acquire('sonar-pro')
+    stats = controller.stats()
+    assert stats['wait_timeouts'] == 1
+    assert stats['queue_depth'] == 0
+    held.release()
+    assert controller.stats()['active'] == 0
+
+
+def test_slot_is_released_when_the_call_raises():
+    controller = AdmissionController(1)
+    with pytest.raises(RuntimeError):
+        with controller.acquire('sonar-pro'):
+            raise RuntimeError("upstream failed")
+
+    assert controller.stats()['active'] == 0
+    controller.acquire('sonar-pro').release()
+
+
+def test_async_waiters_follow_priority_and_cancelled_ones_leave_the_queue():
+    controller = AdmissionController(1, max_queue=4, queue_timeout=2)
+
+    async def scenario():
+        held = await controller.acquire_async('sonar-pro')
+        admitted = []
+
+        async def waiter(priority):
+            with await controller.acquire_async('sonar-pro', priority):
+                admitted.append(priority)
+
+        dashboard = asyncio.create_task(waiter(PRIORITY_DASHBOARD))
+        await asyncio.sleep(0.01)
+        cancelled = asyncio.create_task(waiter(PRIORITY_WIDGET))
+        widget = asyncio.create_task(waiter(PRIORITY_WIDGET))
+        await asyncio.sleep(0.01)
+        assert controller.stats()['queue_depth'] == 3
+
+        cancelled.cancel()
+        await asyncio.sleep(0.01)
+        assert controller.stats()['queue_depth'] == 2
+
+        held.release()
+        await asyncio.gather(dashboard, widget)
+        return admitted
+
+    assert asyncio.run(scenario()) == [PRIORITY_WIDGET, PRIORITY_DASHBOARD]
+    assert controller.stats()['active'] == 0
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    """The app's admission controller with no slots and no queue"""
+    monkeypatch.setattr(upstream_admission, 'max_concurrent', 0)
+    monkeypatch.setattr(upstream_admission, 'max_queue', 0)
+
+
+@pytest.mark.parametrize('path', ['/generate-single-widget', '/generate-dashboard', '/generate-dashboard/stream'])
+def test_overload_is_a_503_with_retry_after(any_client, upstream, saturated, path):
+    response = any_client.post(path, json={"prompt": f"revenue {uuid.uuid4().hex}"})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(upstream_admission.retry_after)
+    assert json_body(response)['retry_after'] == upstream_admission.retry_after
+    assert upstream.calls == 0
+
+
+def test_route_releases_its_slot_when_the_upstream_call_raises(any_client, upstream, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise ConnectionError("connection refused")
+
+    async def refuse_async(*args, **kwargs):
+        refuse()
+
+    monkeypatch.setattr(pytest.importorskip('app'), 'post_chat_completion', refuse)
+    monkeypatch.setattr(pytest.importorskip('asgi_app'), 'async_post_chat_completion', refuse_async)
+    response = any_client.post('/generate-single-widget', json={"prompt": f"revenue {uuid.uuid4().hex}"})
+
+    assert response.status_code == 500
+    assert upstream_admission.stats()['active'] == 0
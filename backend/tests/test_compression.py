@@ -0,0 +1,118 @@
+import asyncio
+import gzip
+import json
+import uuid
+
+import brotli
+import pytest
+
+from compression import COMPRESSION_MIN_BYTES, CompressionMiddleware, choose_encoding
+
+BIG = json.dumps({"data": [{"name": f"p{index}", "value": index} for index in range(200)]}).encode()
+SMALL = b'{"ok": true}'
+
+
+@pytest.mark.parametrize('accept_encoding, encoding', [
+    ('gzip, deflate, br', 'br'),
+    ('gzip', 'gzip'),
+    ('br;q=0.5, gzip;q=0.8', 'gzip'),
+    ('*', 'br'),
+    ('br;q=0, *;q=0.1', 'gzip'),
+    ('identity', None),
+    ('br;q=bogus', None),
+    ('', None),
+    (None, None),
+])
+def test_choose_encoding(accept_encoding, encoding):
+    assert choose_encoding(accept_encoding) == encoding
+
+
+def asgi_app(body, content_type=b'application/json', extra_headers=(), chunks=1):
+    """An ASGI app sending body in chunks with the given headers"""
+    async def app(scope, receive, send):
+        headers = [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers + list(extra_headers)})
+        size = -(-len(body) // chunks)
+        for index in range(chunks):
+            await send({'type': 'http.response.body', 'body': body[index * size:(index + 1) * size],
+                        'more_body': index < chunks - 1})
+    return app
+
+
+def run(app, accept_encoding=None):
+    """(headers, body) the middleware sends for one request"""
+    headers = [(b'accept-encoding', accept_encoding.encode())] if accept_encoding else []
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(CompressionMiddleware(app)({'type': 'http', 'headers': headers}, receive, send))
+    start, bodies = sent[0], sent[1:]
+    return ({key.decode(): value.decode() for key, value in start['headers']},
+            b''.join(message['body'] for message in bodies))
+
+
+@pytest.mark.parametrize('accept_encoding, encoding, decompress', [
+    ('br', 'br', brotli.decompress),
+    ('gzip', 'gzip', gzip.decompress),
+])
+def test_json_body_is_compressed_with_the_negotiated_encoding(accept_encoding, encoding, decompress):
+    headers, body = run(asgi_app(BIG, extra_headers=[(b'etag', b'"abc"')]), accept_encoding)
+
+    assert headers['content-encoding'] == encoding
+    assert decompress(body) == BIG
+    assert headers['content-length'] == str(len(body))
+    assert headers['vary'] == 'Accept-Encoding'
+    assert headers['etag'] == 'W/"abc"'
+
+
+def test_body_under_the_minimum_is_sent_as_is():
+    assert len(SMALL) < COMPRESSION_MIN_BYTES
+    headers, body = run(asgi_app(SMALL), 'br')
+
+    assert 'content-encoding' not in headers
+    assert body == SMALL
+    assert headers['vary'] == 'Accept-Encoding'
+
+
+def test_client_without_accept_encoding_gets_identity_with_vary():
+    headers, body = run(asgi_app(BIG))
+
+    assert 'content-encoding' not in headers
+    assert body == BIG
+    assert headers['vary'] == 'Accept-Encoding'
+
+
+def test_existing_vary_is_extended():
+    headers, _ = run(asgi_app(BIG, extra_headers=[(b'vary', b'Origin')]), 'gzip')
+    assert headers['vary'] == 'Origin, Accept-Encoding'
+
+
+def test_event_streams_pass_through():
+    headers, body = run(asgi_app(BIG, content_type=b'text/event-stream', chunks=3), 'br')
+
+    assert 'content-encoding' not in headers and 'vary' not in headers
+    assert body == BIG
+
+
+def test_streamed_json_is_not_compressed():
+    headers, body = run(asgi_app(BIG, chunks=3), 'br')
+
+    assert 'content-encoding' not in headers
+    assert body == BIG
+
+
+def test_routes_compress_large_responses(any_client, upstream):
+    widgets = [{"name": f"Bars {index}", "type": "bar", "data": [{"name": f"b{bar}", "value": bar} for bar in range(40)]}
+               for index in range(3)]
+    upstream.content = lambda payload: json.dumps({"dash_name": "Big", "category": "other", "widgets": widgets})
+    response = any_client.post('/generate-dashboard', json={"prompt": f"sales {uuid.uuid4().hex}"},
+                               headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
@@ -0,0 +1,128 @@
+import uuid
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from conftest import json_body
+from csv_engine import MAX_BAR_LIMIT, SpecError, compute_widget_data, load_dataframe
+
+SALES = '''date,region,product,units,price
+2024-01-03,North,Widget,3,2.5
+2024-01-20,South,Gadget,5,4.0
+2024-02-11,North,Gadget,2,4.0
+2024-02-28,East,Widget,7,2.5
+2024-04-02,North,Widget,1,2.5
+2024-04-15,South,Widget,4,2.5
+2024-05-30,West,Gadget,6,4.0
+2024-07-01,North,Gadget,8,4.0
+'''
+
+
+@pytest.fixture
+def sales():
+    return load_dataframe(SALES)
+
+
+@pytest.mark.parametrize('aggregate, value', [
+    ('sum', 36), ('mean', 4.5), ('median', 4.5), ('min', 1), ('max', 8), ('count', 8), ('nunique', 8),
+])
+def test_number_aggregates(sales, aggregate, value):
+    data = compute_widget_data(sales, 'number', {"aggregate": aggregate, "value_column": "units"})
+    assert data == {"value": value, "label": f"{aggregate} of units"}
+
+
+def test_number_counts_rows_without_a_value_column(sales):
+    assert compute_widget_data(sales, 'number', {"label": "Orders"}) == {"value": 8, "label": "Orders"}
+
+
+def test_bar_groups_a_categorical_column(sales):
+    assert str(sales['region'].dtype) == 'category'
+    data = compute_widget_data(sales, 'bar', {"group_by": "region", "aggregate": "sum", "value_column": "units"})
+    assert data == [{"name": "North", "value": 14}, {"name": "South", "value": 9},
+                    {"name": "East", "value": 7}, {"name": "West", "value": 6}]
+
+
+@pytest.mark.parametrize('sort, names', [
+    ('asc', ['West', 'East', 'South', 'North']),
+    ('label', ['East', 'North', 'South', 'West']),
+])
+def test_bar_sort_orders(sales, sort, names):
+    data = compute_widget_data(sales, 'bar', {"group_by": "region", "aggregate": "sum", "value_column": "units",
+                                              "sort": sort})
+    assert [bar['name'] for bar in data] == names
+
+
+@pytest.mark.parametrize('limit, bars', [(2, 2), ('3', 3), (1000, 4)])
+def test_bar_limit_keeps_the_top_groups(sales, limit, bars):
+    data = compute_widget_data(sales, 'bar', {"group_by": "region", "aggregate": "count", "limit": limit})
+    assert len(data) == bars
+    assert data[0] == {"name": "North", "value": 4}
+
+
+def test_bar_limit_is_capped():
+    df = load_dataframe('key\n' + '\n'.join(f'k{index}' for index in range(200)))
+    assert len(compute_widget_data(df, 'bar', {"group_by": "key", "limit": 500})) == MAX_BAR_LIMIT
+
+
+@pytest.mark.parametrize('limit', [0, -3, '-1', 'all', [5], True, float('inf')])
+def test_bar_limit_below_one_or_not_a_number_is_rejected(sales, limit):
+    with pytest.raises(SpecError):
+        compute_widget_data(sales, 'bar', {"group_by": "region", "limit": limit})
+
+
+@pytest.mark.parametrize('bucket, points', [
+    ('month', [('2024-01', 8), ('2024-02', 9), ('2024-04', 5), ('2024-05', 6), ('2024-07', 8)]),
+    ('quarter', [('2024Q1', 17), ('2024Q2', 11), ('2024Q3', 8)]),
+    ('year', [('2024', 36)]),
+    ('week', [('2024-01-01', 3), ('2024-01-15', 5), ('2024-02-05', 2), ('2024-02-26', 7), ('2024-04-01', 1),
+              ('2024-04-15', 4), ('2024-05-27', 6), ('2024-07-01', 8)]),
+])
+def test_line_buckets_dates(sales, bucket, points):
+    data = compute_widget_data(sales, 'line', {"time_column": "date", "bucket": bucket, "aggregate": "sum",
+                                               "value_column": "units"})
+    assert [(point['name'], point['value']) for point in data] == points
+
+
+def test_line_without_a_bucket_keeps_each_day(sales):
+    data = compute_widget_data(sales, 'line', {"time_column": "date", "aggregate": "mean", "value_column": "price"})
+    assert data[0] == {"name": "2024-01-03", "value": 2.5}
+    assert len(data) == 8
+
+
+def test_line_uses_numeric_time_columns_as_is():
+    df = load_dataframe('year,units\n2022,5\n2021,3\n2022,1\n')
+    data = compute_widget_data(df, 'line', {"time_column": "year", "aggregate": "sum", "value_column": "units"})
+    assert data == [{"name": "2021", "value": 3}, {"name": "2022", "value": 6}]
+
+
+@pytest.mark.parametrize('widget_type, spec', [
+    ('bar', {"group_by": "city"}),
+    ('bar', {}),
+    ('number', {"aggregate": "mode", "value_column": "units"}),
+    ('line', {"time_column": "date", "bucket": "decade"}),
+    ('pie', {"group_by": "region"}),
+    ('number', ["units"]),
+])
+def test_invalid_specs_are_rejected(sales, widget_type, spec):
+    with pytest.raises(SpecError):
+        compute_widget_data(sales, widget_type, spec)
+
+
+def spec_widget(limit):
+    return ('{"name": "Units by region", "type": "bar", "source_url": "CSV Data Analysis", '
+            '"spec": {"group_by": "region", "aggregate": "sum", "value_column": "units", "limit": %s}}' % limit)
+
+
+def test_route_rejects_a_negative_limit_like_other_spec_errors(any_client, upstream):
+    upstream.content = lambda payload: spec_widget(-2)
+    negative = any_client.post('/generate-single-widget', json={"prompt": f"units {uuid.uuid4().hex}", "csv_data": SALES})
+    upstream.content = lambda payload: spec_widget(2).replace('"region"', '"city"')
+    unknown = any_client.post('/generate-single-widget', json={"prompt": f"units {uuid.uuid4().hex}", "csv_data": SALES})
+    upstream.content = lambda payload: spec_widget(2)
+    valid = any_client.post('/generate-single-widget', json={"prompt": f"units {uuid.uuid4().hex}", "csv_data": SALES})
+
+    assert negative.status_code == unknown.status_code != 200
+    assert 'Invalid limit' in json_body(negative)['error']
+    assert valid.status_code == 200
+    assert json_body(valid)['widget']['data'] == [{"name": "North", "value": 14}, {"name": "South", "value": 9}]
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from csv_profile import estimate_tokens, format_profile, profile_csv, truncate_to_budget
+
+
+def profile_of(csv_text, **kwargs):
+    return profile_csv(io.StringIO(csv_text), **kwargs)
+
+
+def test_profile_covers_every_row_across_chunks():
+    rows = '\n'.join(f"2024-01-{day:02d},{'north' if day % 3 else 'south'},{day}" for day in range(1, 31))
+    profile = profile_of('date,region,sales\n' + rows, chunk_rows=7, sample_rows=5)
+
+    assert profile['rows'] == 30
+    assert len(profile['sample']) == 5
+    date, region, sales = profile['columns']
+    assert (date['kind'], date['min'], date['max']) == ('date', '2024-01-01', '2024-01-30')
+    assert region['top'] == [('north', 20), ('south', 10)]
+    assert (sales['min'], sales['max'], sales['mean'], sales['distinct']) == (1, 30, 15.5, 30)
+
+
+def test_profile_fits_the_budget_with_sample_rows():
+    rows = '\n'.join(f"{index},name {index},{index * 1.5}" for index in range(500))
+    text = format_profile(profile_of('id,name,value\n' + rows), 300)
+
+    assert estimate_tokens(text) <= 300
+    assert '- name: text' in text
+    assert 'Random sample of rows:' in text
+
+
+def test_wide_profile_keeps_column_names_over_per_column_stats():
+    names = [f'col_{index}' for index in range(300)]
+    text = format_profile(profile_of(','.join(names) + '\n' + ','.join('1' * 300)), 800)
+
+    assert estimate_tokens(text) <= 800
+    assert text.startswith('The CSV data has 1 rows and 300 columns:')
+    assert 'col_299' in text
+    assert 'more columns' not in text
+
+
+def test_too_many_column_names_say_how_many_were_left_out():
+    names = [f'measurement_{index}' for index in range(300)]
+    text = format_profile(profile_of(','.join(names) + '\n' + ','.join('1' * 300)), 400)
+
+    assert estimate_tokens(text) <= 400
+    shown = [name for name in names if f'{name},' in text]
+    assert shown == names[:len(shown)]
+    assert f"… and {300 - len(shown)} more columns" in text
+
+
+def test_truncation_cuts_at_a_line_boundary():
+    text = 'a,b\n' + '\n'.join('1234567,7654321' for _ in range(50))
+    cut = truncate_to_budget(text, 20)
+
+    assert len(cut) <= 80
+    assert cut.split('\n')[-1] == '1234567,7654321'
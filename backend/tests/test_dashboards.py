@@ -0,0 +1,25 @@
+import uuid
+
+import pytest
+
+pytest.importorskip('app')
+from conftest import json_body  # noqa: E402
+from dashboard_store import dashboard_store  # noqa: E402
+
+
+def stored_dashboards():
+    return dashboard_store.stats()['dashboards']
+
+
+@pytest.mark.parametrize('repeat', ['{} Microsoft yearly revenue', '{} Microsoft annual revenue'])
+def test_cache_hits_reuse_the_stored_dashboard(any_client, upstream, repeat):
+    topic = uuid.uuid4().hex
+    created = json_body(any_client.post('/generate-dashboard', json={"prompt": f"{topic} Microsoft yearly revenue"}))
+    stored = stored_dashboards()
+
+    response = json_body(any_client.post('/generate-dashboard', json={"prompt": repeat.format(topic)}))
+
+    assert response['cached'] is True
+    assert response['dashboard']['dashboard_id'] == created['dashboard']['dashboard_id']
+    assert stored_dashboards() == stored
+    assert upstream.calls == 1
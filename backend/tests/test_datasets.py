@@ -0,0 +1,113 @@
+import io
+import os
+import time
+import uuid
+
+import pytest
+
+from dataset_store import DatasetError, DatasetStore
+
+app_module = pytest.importorskip('app')
+
+
+@pytest.fixture
+def small_limit(monkeypatch):
+    monkeypatch.setattr(app_module, 'MAX_REQUEST_BYTES', 64)
+    monkeypatch.setitem(app_module.app.config, 'MAX_CONTENT_LENGTH', 64)
+
+
+def test_upload_returns_a_dataset_id(client):
+    response = client.post('/datasets', data=b'region,units\nNorth,3\nSouth,5\n', content_type='text/csv')
+    assert response.status_code == 200
+    assert response.get_json()['dataset_id']
+
+
+def test_repeat_upload_is_deduplicated(client):
+    csv = f'region,units\n{uuid.uuid4().hex},3\n'.encode()
+    first = client.post('/datasets', data=csv, content_type='text/csv').get_json()
+    second = client.post('/datasets', data=csv, content_type='text/csv').get_json()
+
+    assert first['deduplicated'] is False
+    assert second == dict(first, deduplicated=True)
+
+
+def test_evicted_dataset_id_is_a_404(client, upstream):
+    # The frontend's cue to resend the CSV inline
+    response = client.post('/generate-single-widget', json={"prompt": "units by region", "dataset_id": "0" * 64})
+    assert response.status_code == 404
+
+
+def test_oversized_raw_upload_is_rejected(client, small_limit):
+    response = client.post('/datasets', data=b'a,b\n' + b'1,2\n' * 100, content_type='text/csv')
+    assert response.status_code == 413
+    assert 'error' in response.get_json()
+
+
+def test_oversized_multipart_upload_is_rejected(client, small_limit):
+    response = client.post('/datasets', data={"file": (io.BytesIO(b'a,b\n' + b'1,2\n' * 100), 'data.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
+
+
+def test_oversized_body_is_rejected_on_async_routes(async_client, monkeypatch):
+    monkeypatch.setattr(pytest.importorskip('asgi_app'), 'MAX_REQUEST_BYTES', 64)
+    response = async_client.post('/generate-csv-dashboard', json={"prompt": "units", "csv_data": 'a,b\n' + '1,2\n' * 100})
+    assert response.status_code == 413
+
+
+def store_in(directory, max_total_bytes=10 ** 9, max_age_seconds=3600):
+    return DatasetStore(str(directory), 10 ** 6, max_total_bytes, max_age_seconds)
+
+
+def save(store, text, age=0):
+    """Store text as a dataset last used age seconds ago, returning its ID"""
+    dataset_id, _, _ = store.save_stream(io.BytesIO(text.encode()))
+    stamp = time.time() - age
+    os.utime(store.path_for(dataset_id), (stamp, stamp))
+    return dataset_id
+
+
+def test_upload_replaces_a_copy_removed_before_it_was_reused(tmp_path):
+    store = store_in(tmp_path)
+    dataset_id = save(store, 'a,b\n1,2\n')
+    # As if another worker evicted it between uploads
+    os.remove(store.path_for(dataset_id))
+
+    assert store.save_stream(io.BytesIO(b'a,b\n1,2\n')) == (dataset_id, 8, False)
+    assert store.load(dataset_id) == 'a,b\n1,2\n'
+    assert [name for name in os.listdir(tmp_path) if not name.endswith('.csv')] == []
+
+
+def test_datasets_past_the_max_age_are_evicted(tmp_path):
+    store = store_in(tmp_path, max_age_seconds=60)
+    old = save(store, 'a\n1\n', age=120)
+    fresh = save(store, 'a\n2\n', age=30)
+    store.evict()
+
+    with pytest.raises(DatasetError) as missing:
+        store.load(old)
+    assert missing.value.status_code == 404
+    assert store.load(fresh) == 'a\n2\n'
+
+
+def test_least_recently_used_datasets_are_evicted_over_the_size_limit(tmp_path):
+    store = store_in(tmp_path, max_total_bytes=15)
+    first = save(store, 'a\n0001\n', age=30)
+    second = save(store, 'a\n0002\n', age=20)
+    # Loading the first marks it as the most recently used
+    store.load(first)
+    third = save(store, 'a\n0003\n')
+
+    assert store.stats() == {"datasets": 2, "bytes": 14}
+    assert store.touch(first) and store.touch(third)
+    assert not store.touch(second)
+
+
+def test_repeat_upload_refreshes_the_stored_copy(tmp_path):
+    store = store_in(tmp_path, max_total_bytes=15)
+    first = save(store, 'a\n0001\n', age=30)
+    save(store, 'a\n0002\n', age=20)
+    assert store.save_stream(io.BytesIO(b'a\n0001\n'))[2] is True
+    save(store, 'a\n0003\n')
+
+    assert store.load(first) == 'a\n0001\n'
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+app_module = pytest.importorskip('app')
+
+
+def plan_or_widget(payload):
+    """A four-widget plan whose widget prompts carry the request's topic, or a number widget"""
+    prompt = payload['messages'][-1]['content']
+    if 'User topic: ' in prompt:
+        topic = prompt.rsplit('User topic: ', 1)[1]
+        return json.dumps({"dash_name": topic, "category": "other", "widgets": [
+            {"prompt": f"{topic} metric {index}", "type": "number"} for index in range(4)
+        ]})
+    return '{"name": "Total", "type": "number", "data": {"value": 1, "label": "Total"}}'
+
+
+def test_run_with_deadlines_times_calls_from_their_start():
+    executor = ThreadPoolExecutor(max_workers=1)
+    calls = [(key, lambda: time.sleep(0.2) or 'done') for key in ('a', 'b')]
+    # 'b' waits 0.2s for the only worker, then runs 0.2s: over the timeout from submission, within it from start
+    outcomes = dict(app_module.run_with_deadlines(executor, calls, 0.3))
+    assert outcomes == {'a': 'done', 'b': 'done'}
+
+
+def test_run_with_deadlines_gives_up_on_slow_and_unstarted_calls():
+    executor = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    ran = []
+    calls = [('slow', lambda: release.wait(5)), ('queued', lambda: ran.append('queued'))]
+    outcomes = dict(app_module.run_with_deadlines(executor, calls, 0.2))
+    release.set()
+    executor.shutdown(wait=True)
+
+    assert isinstance(outcomes['slow'], TimeoutError)
+    assert isinstance(outcomes['queued'], TimeoutError)
+    assert ran == []
+
+
+def test_concurrent_fanouts_get_their_own_widget_deadlines(client, upstream, monkeypatch):
+    # A pool with room for one request's widgets, so the second request's widgets queue behind the first's
+    monkeypatch.setattr(app_module, 'fanout_executor', ThreadPoolExecutor(max_workers=app_module.FANOUT_MAX_WIDGETS))
+    monkeypatch.setattr(app_module, 'FANOUT_WIDGET_TIMEOUT', 0.8)
+    upstream.content = plan_or_widget
+    upstream.delay = 0.5
+
+    def fanout(_):
+        return client.post('/generate-dashboard', json={"prompt": f"topic {uuid.uuid4().hex}", "mode": "fanout"})
+
+    with ThreadPoolExecutor(max_workers=2) as requests:
+        responses = list(requests.map(fanout, range(2)))
+
+    for response in responses:
+        dashboard = response.get_json()['dashboard']
+        assert response.status_code == 200
+        assert len(dashboard['widgets']) == 4
+        assert not dashboard['partial']
+
+
+def test_run_with_deadlines_bounds_running_calls():
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return 'done'
+
+    executor = ThreadPoolExecutor(max_workers=8)
+    outcomes = dict(app_module.run_with_deadlines(executor, [(key, call) for key in range(8)], 1, max_running=2))
+    assert outcomes == dict.fromkeys(range(8), 'done')
+    assert max(peak) == 2
@@ -0,0 +1,79 @@
+import pytest
+
+from json_repair import JSONRepairError, extract_json, parse_number_string
+
+
+def test_clean_output_needs_no_repairs():
+    assert extract_json('{"name": "Total", "value": 5}') == ({"name": "Total", "value": 5}, [])
+
+
+@pytest.mark.parametrize('text, expected, repairs', [
+    ('```json\n{"name": "Total", "value": 5}\n```', {"name": "Total", "value": 5}, []),
+    ('{"data": [1, 2, 3,], "name": "a",}', {"data": [1, 2, 3], "name": "a"}, ['trailing_comma']),
+    ('{"data": [1,, 2]}', {"data": [1, 2]}, ['trailing_comma']),
+    ("{'name': 'Sales', 'label': 'it\\'s'}", {"name": "Sales", "label": "it's"}, ['single_quotes']),
+    ('{name: "Sales", type: "bar"}', {"name": "Sales", "type": "bar"}, ['unquoted_keys']),
+    ('{"a": 1 "b": 2}', {"a": 1, "b": 2}, ['missing_comma']),
+    ('{"ok": True, "missing": None, "score": NaN}', {"ok": True, "missing": None, "score": None}, ['bare_words']),
+    ('{"data": {"value": "$1,234", "label": "Revenue"}}', {"data": {"value": 1234, "label": "Revenue"}},
+     ['coerced_numbers']),
+])
+def test_repairs(text, expected, repairs):
+    assert extract_json(text) == (expected, repairs)
+
+
+def test_truncated_object_is_closed():
+    value, repairs = extract_json('{"dash_name": "Sales", "category": "busi')
+    assert value == {"dash_name": "Sales"}
+    assert repairs == ['truncated']
+
+
+def test_truncated_array_keeps_only_complete_elements():
+    text = ('{"dash_name": "D", "widgets": [{"name": "a", "type": "number", "data": {"value": 1}}, '
+            '{"name": "b", "type": "bar", "data": [{"name": "x", "val')
+    value, repairs = extract_json(text)
+    assert value == {"dash_name": "D", "widgets": [{"name": "a", "type": "number", "data": {"value": 1}}]}
+    assert repairs == ['truncated']
+
+
+def test_number_cut_off_at_the_end_is_dropped():
+    assert extract_json('{"a": 1, "b": 12') == ({"a": 1}, ['truncated'])
+
+
+def test_prose_around_the_object_is_cut():
+    text = 'Here is the dashboard:\n{"name": "Total", "value": 5}\nLet me know if you need more.'
+    assert extract_json(text) == ({"name": "Total", "value": 5}, ['leading_text', 'trailing_text'])
+
+
+def test_brace_in_prose_before_the_object_is_skipped():
+    text = 'Dashboard for {topic}: {"name": "Total", "value": 5}'
+    assert extract_json(text) == ({"name": "Total", "value": 5}, ['leading_text'])
+
+
+def test_repairs_combine():
+    text = "Sure! ```json\n{name: 'Sales', data: [{'name': 'a', 'value': '12%'},],}\n```"
+    value, repairs = extract_json(text)
+    assert value == {"name": "Sales", "data": [{"name": "a", "value": 12}]}
+    assert repairs == ['coerced_numbers', 'leading_text', 'single_quotes', 'trailing_comma', 'unquoted_keys']
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    None,
+    'I could not find any data for that topic.',
+    '[1, 2, 3]',
+    '```json\n```',
+    'Results for {topic} are unavailable',
+    '{"a" "b": 1}',
+    '{"a": 1 : 2}',
+])
+def test_unrecoverable_output_raises(text):
+    with pytest.raises(JSONRepairError):
+        extract_json(text)
+
+
+@pytest.mark.parametrize('text, number', [
+    ('1,234', 1234), ('-$5.2B', -5200000000), ('12%', 12), ('3.5k', 3500), ('about 5', None), ('1,23', None),
+])
+def test_parse_number_string(text, number):
+    assert parse_number_string(text) == number
@@ -0,0 +1,48 @@
+import uuid
+
+import pytest
+
+pytest.importorskip('app')
+import perplexity_client  # noqa: E402
+from metrics import REQUEST_SECONDS, UPSTREAM_SECONDS  # noqa: E402
+
+
+def observed(histogram, *labels):
+    """(count, sum) of a histogram's observations for one set of label values"""
+    series = histogram._series.get(tuple(labels))
+    return (series[-1], series[-2]) if series else (0, 0)
+
+
+def stream_batch(client):
+    topic = uuid.uuid4().hex
+    response = client.post('/generate-widgets/stream', json={"widgets": [{"prompt": f"{topic} revenue"}]})
+    body = response.get_data() if hasattr(response, 'get_data') else response.content
+    if hasattr(response, 'close'):
+        response.close()
+    return body
+
+
+def test_stream_routes_are_timed_to_the_end_of_the_stream(any_client, upstream):
+    upstream.delay = 0.3
+    count, total = observed(REQUEST_SECONDS, 'generate-widgets-stream')
+    body = stream_batch(any_client)
+
+    assert b'event: done' in body
+    new_count, new_total = observed(REQUEST_SECONDS, 'generate-widgets-stream')
+    assert new_count == count + 1
+    assert new_total - total >= 0.3
+
+
+def test_new_upstream_connections_record_a_connect_phase(client, upstream, monkeypatch):
+    monkeypatch.setattr(perplexity_client, '_session', None)
+    count, _ = observed(UPSTREAM_SECONDS, 'sonar-pro', 'connect')
+    client.post('/generate-single-widget', json={"prompt": f"revenue {uuid.uuid4().hex}", "widget_type": "bar"})
+
+    assert observed(UPSTREAM_SECONDS, 'sonar-pro', 'connect')[0] > count
+
+
+def test_new_async_upstream_connections_record_a_connect_phase(async_client, upstream):
+    count, _ = observed(UPSTREAM_SECONDS, 'sonar-pro', 'connect')
+    async_client.post('/generate-single-widget', json={"prompt": f"revenue {uuid.uuid4().hex}", "widget_type": "bar"})
+
+    assert observed(UPSTREAM_SECONDS, 'sonar-pro', 'connect')[0] > count
@@ -0,0 +1,84 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+app_module = pytest.importorskip('app')
+import model_router as model_router_module  # noqa: E402
+from conftest import WIDGET, json_body  # noqa: E402
+from model_router import model_router  # noqa: E402
+
+
+def ok_count(endpoint, kind, model):
+    for bucket in model_router.stats()['buckets']:
+        if (bucket['endpoint'], bucket['kind'], bucket['model']) == (endpoint, kind, model):
+            return bucket['outcomes']['ok']
+    return 0
+
+
+def number_widget(client, prompt):
+    return client.post('/generate-single-widget', json={"prompt": prompt, "widget_type": "number"})
+
+
+def test_routing_is_off_by_default(client, upstream):
+    assert not model_router_module.ROUTING_ENABLED
+    response = number_widget(client, f"headcount {uuid.uuid4().hex}")
+
+    assert upstream.payloads[-1]['model'] == 'sonar-pro'
+    assert response.get_json()['widget']['model_used'] == 'sonar-pro'
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    """Model routing turned on, as ROUTING_ENABLED=true does"""
+    monkeypatch.setattr(model_router_module, 'ROUTING_ENABLED', True)
+
+
+def test_routed_model_is_reported(any_client, upstream, routing):
+    response = number_widget(any_client, f"headcount {uuid.uuid4().hex}")
+
+    assert upstream.payloads[-1]['model'] == 'sonar'
+    assert json_body(response)['widget']['model_used'] == 'sonar'
+    assert json_body(any_client.get('/admin/routing/stats'))['enabled'] is True
+
+
+def test_invalid_output_escalates_to_the_next_tier(any_client, upstream, routing):
+    upstream.content = lambda payload: WIDGET if payload['model'] == 'sonar-pro' else 'No widget today.'
+    response = number_widget(any_client, f"headcount {uuid.uuid4().hex}")
+
+    assert response.status_code == 200
+    assert [payload['model'] for payload in upstream.payloads] == ['sonar', 'sonar-pro']
+    assert json_body(response)['widget']['model_used'] == 'sonar-pro'
+
+
+def test_truncated_output_is_retried_with_a_larger_budget(any_client, upstream, routing):
+    # Still a usable widget once repaired, but cut off at max_tokens
+    cut_off = WIDGET[:-1] + ', "source_url": "https://exa'
+    upstream.content = lambda payload: WIDGET if upstream.calls > 1 else cut_off
+    response = number_widget(any_client, f"headcount {uuid.uuid4().hex}")
+
+    assert response.status_code == 200
+    first, retry = upstream.payloads
+    assert retry['model'] == first['model']
+    assert retry['max_tokens'] == 2 * first['max_tokens']
+
+
+def test_escalation_stops_after_one_retry(any_client, upstream, routing):
+    upstream.content = lambda payload: 'No widget today.'
+    response = number_widget(any_client, f"headcount {uuid.uuid4().hex}")
+
+    assert response.status_code == 500
+    assert upstream.calls == 2
+
+
+def test_coalesced_calls_are_recorded_once(client, upstream, routing):
+    upstream.delay = 0.3
+    prompt = f"headcount {uuid.uuid4().hex}"
+    before = ok_count('generate-single-widget', 'number', 'sonar')
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        responses = list(pool.map(lambda _: number_widget(client, prompt), range(3)))
+
+    assert all(response.status_code == 200 for response in responses)
+    assert upstream.calls == 1
+    assert ok_count('generate-single-widget', 'number', 'sonar') == before + 1
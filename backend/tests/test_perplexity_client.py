@@ -0,0 +1,98 @@
+import time
+import types
+from email.utils import formatdate
+
+import pytest
+import requests
+
+import perplexity_client
+from conftest import FakeUpstream
+from perplexity_client import BACKOFF_BASE, BACKOFF_MAX, post_chat_completion
+
+PAYLOAD = {"model": "sonar-pro", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 10}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """The backoff delays post_chat_completion sleeps for, without waiting them out"""
+    slept = []
+    monkeypatch.setattr(perplexity_client, 'time', types.SimpleNamespace(
+        sleep=slept.append, perf_counter=time.perf_counter, time=time.time))
+    return slept
+
+
+@pytest.mark.parametrize('status_code', [429, 503])
+def test_retry_after_seconds_is_honoured(upstream, sleeps, status_code):
+    upstream.failures = [(status_code, {'Retry-After': '3'})]
+    response = post_chat_completion(PAYLOAD, max_retries=2)
+
+    assert response.status_code == 200
+    assert upstream.calls == 2
+    assert sleeps == [3.0]
+
+
+def test_retry_after_date_is_honoured(upstream, sleeps):
+    upstream.failures = [(503, {'Retry-After': formatdate(time.time() + 5, usegmt=True)})]
+    response = post_chat_completion(PAYLOAD, max_retries=1)
+
+    assert response.status_code == 200
+    assert 3 <= sleeps[0] <= 5
+
+
+def test_retry_after_is_capped_at_the_backoff_max(upstream, sleeps):
+    upstream.failures = [(429, {'Retry-After': '3600'})]
+    post_chat_completion(PAYLOAD, max_retries=1)
+
+    assert sleeps == [BACKOFF_MAX]
+
+
+def test_backoff_is_jittered_and_grows_per_attempt(upstream, sleeps):
+    upstream.failures = [(502, {})] * 3
+    response = post_chat_completion(PAYLOAD, max_retries=3)
+
+    assert response.status_code == 200
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps):
+        assert 0 <= delay <= BACKOFF_BASE * 2 ** attempt
+
+
+def test_connection_error_is_retried(upstream, sleeps):
+    upstream.failures = [FakeUpstream.DROP]
+    response = post_chat_completion(PAYLOAD, max_retries=1)
+
+    assert response.status_code == 200
+    assert upstream.calls == 2
+    assert len(sleeps) == 1
+
+
+def test_exhausted_retries_return_the_last_error_response(upstream, sleeps):
+    upstream.failures = [(503, {})] * 3
+    response = post_chat_completion(PAYLOAD, max_retries=2)
+
+    assert response.status_code == 503
+    assert upstream.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_exhausted_retries_raise_the_last_connection_error(upstream, sleeps):
+    upstream.failures = [FakeUpstream.DROP] * 2
+    with pytest.raises(requests.exceptions.ConnectionError):
+        post_chat_completion(PAYLOAD, max_retries=1)
+    assert upstream.calls == 2
+
+
+def test_client_errors_are_not_retried(upstream, sleeps):
+    upstream.failures = [(400, {})]
+    response = post_chat_completion(PAYLOAD, max_retries=2)
+
+    assert response.status_code == 400
+    assert upstream.calls == 1
+    assert sleeps == []
+
+
+def test_read_timeout_is_not_retried(upstream, sleeps):
+    upstream.delay = 0.5
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        post_chat_completion(PAYLOAD, read_timeout=0.1, max_retries=2)
+    assert upstream.calls == 1
+    assert sleeps == []
@@ -0,0 +1,44 @@
+import pytest
+
+from prompt_index import PROMPT_INDEX_THRESHOLD, PromptIndex, prompt_similarity, prompt_tokens
+
+# Prompts that share most of their words but ask for a different dashboard
+DIFFERENT = [
+    ("Apple market share", "Apple stock market"),
+    ("Apple market share", "Apple share price"),
+    ("most popular programming languages", "largest programming languages"),
+    ("best selling cars", "biggest selling cars"),
+    ("leading tech companies", "largest tech companies"),
+    ("NBA points per season", "NBA points per year"),
+]
+
+# Rewordings of the same question
+SAME = [
+    ("Lakers points", "Lakers scoring"),
+    ("LeBron James scoring history", "LeBron James points historical"),
+    ("Microsoft yearly revenue", "Microsoft annual revenue"),
+]
+
+
+def similarity(a, b):
+    return prompt_similarity(prompt_tokens(a), prompt_tokens(b))
+
+
+@pytest.mark.parametrize('prompt, other', DIFFERENT)
+def test_different_questions_stay_below_threshold(prompt, other):
+    assert similarity(prompt, other) < PROMPT_INDEX_THRESHOLD
+
+
+@pytest.mark.parametrize('prompt, other', DIFFERENT)
+def test_different_questions_miss_the_index(prompt, other):
+    index = PromptIndex(PROMPT_INDEX_THRESHOLD, 100)
+    index.add('dashboard', prompt, 'key')
+    assert index.lookup('dashboard', other) is None
+
+
+@pytest.mark.parametrize('prompt, other', SAME)
+def test_rewordings_hit_the_index(prompt, other):
+    index = PromptIndex(PROMPT_INDEX_THRESHOLD, 100)
+    index.add('dashboard', prompt, 'key')
+    hit = index.lookup('dashboard', other)
+    assert hit is not None and hit[0] == 'key'
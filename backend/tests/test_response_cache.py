@@ -0,0 +1,79 @@
+import threading
+
+from response_cache import DiskStore, TieredCache, make_cache_key
+
+
+def test_cache_key_is_stable_and_ignores_case_and_spacing():
+    key = make_cache_key('generate-dashboard', 'Tesla stock price', 'sonar-pro')
+    assert key == make_cache_key('generate-dashboard', '  tesla   STOCK price ', 'sonar-pro')
+    # The key is what the disk tier and other workers look entries up by, so it must not drift
+    assert key == 'cfb20f06eb2eeaf1099ab6713731e2dae0eb0dfeac2fd1108db61a2aa89811ac'
+
+
+def test_cache_key_covers_every_field():
+    base = ('generate-single-widget', 'revenue', 'sonar-pro', 'bar', 'Apple')
+    keys = {make_cache_key(*base)}
+    for index, other in enumerate(['generate-dashboard', 'profit', 'sonar', 'line', 'Microsoft']):
+        keys.add(make_cache_key(*base[:index], other, *base[index + 1:]))
+    assert len(keys) == 6
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    path = str(tmp_path / 'responses.sqlite3')
+    TieredCache(60, 10, 1024 * 1024, path).set('key', {"value": 1})
+
+    # A fresh process or worker starts with an empty memory tier
+    cache = TieredCache(60, 10, 1024 * 1024, path)
+    assert cache.get('key') == {"value": 1}
+    assert cache.get('key') == {"value": 1}
+    assert cache.counters['disk_hits'] == 1
+    assert cache.counters['memory_hits'] == 1
+
+
+def test_expired_entries_miss_in_both_tiers(tmp_path):
+    cache = TieredCache(60, 10, 1024 * 1024, str(tmp_path / 'responses.sqlite3'))
+    cache.set('key', {"value": 1}, ttl_seconds=-1)
+
+    assert cache.get('key') is None
+    assert cache.disk.get('key') is None
+    assert cache.counters['misses'] == 1
+
+
+def test_disk_tier_keeps_the_newest_entries_under_its_cap(tmp_path):
+    store = DiskStore(str(tmp_path / 'responses.sqlite3'), max_entries=5)
+    store.PURGE_EVERY = 10
+    for index in range(9):
+        store.set(f'key{index}', str(index), 2e9)
+    # Rewriting an old key makes it the newest
+    store.set('key0', '0', 2e9)
+
+    kept = {f'key{index}' for index in range(9) if store.get(f'key{index}') is not None}
+    assert kept == {'key0', 'key5', 'key6', 'key7', 'key8'}
+    assert store.evictions == 4
+
+
+def test_disk_tier_purges_expired_entries_first(tmp_path):
+    store = DiskStore(str(tmp_path / 'responses.sqlite3'), max_entries=5)
+    store.PURGE_EVERY = 4
+    store.set('old', 'x', 1)
+    for index in range(3):
+        store.set(f'key{index}', str(index), 2e9)
+
+    assert store.stats()['entries'] == 3
+    assert store.evictions == 1
+
+
+def test_disk_write_counter_is_thread_safe(tmp_path):
+    store = DiskStore(str(tmp_path / 'responses.sqlite3'))
+    store.PURGE_EVERY = 10 ** 9
+
+    def write(thread):
+        for index in range(50):
+            store.set(f'{thread}-{index}', 'x', 2e9)
+
+    threads = [threading.Thread(target=write, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store._writes == 400
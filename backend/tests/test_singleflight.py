@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight, payload_key
+
+CALLERS = 5
+
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.005)
+
+
+class Upstream:
+    """A call that blocks until released and counts how often it ran"""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.hits = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.hits += 1
+        self.release.wait(2)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def run_concurrently(flight, upstream, key='key', timeout=None):
+    """Outcomes of CALLERS threads calling flight.do at once, released once all but the leader wait"""
+    def call(_):
+        try:
+            return flight.do(key, upstream, timeout)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+        outcomes = pool.map(call, range(CALLERS))
+        wait_until(lambda: flight.stats()['coalesced'] >= CALLERS - 1)
+        upstream.release.set()
+        return list(outcomes)
+
+
+def test_concurrent_identical_calls_share_one_upstream_hit():
+    flight = SingleFlight()
+    upstream = Upstream(result={"value": 1})
+
+    assert run_concurrently(flight, upstream) == [{"value": 1}] * CALLERS
+    assert upstream.hits == 1
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": CALLERS - 1, "wait_timeouts": 0}
+
+
+def test_exception_reaches_every_waiter_then_clears_the_key():
+    flight = SingleFlight()
+    error = ConnectionError("upstream down")
+
+    outcomes = run_concurrently(flight, Upstream(error=error))
+    assert all(outcome is error for outcome in outcomes)
+    assert flight.stats()['in_flight'] == 0
+
+    retry = Upstream(result="ok")
+    retry.release.set()
+    assert flight.do('key', retry) == "ok"
+    assert retry.hits == 1
+
+
+def test_waiter_times_out_without_stopping_the_leader():
+    flight = SingleFlight()
+    upstream = Upstream(result="ok")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flight.do, 'key', upstream)
+        wait_until(lambda: upstream.hits == 1)
+        with pytest.raises(TimeoutError):
+            flight.do('key', upstream, timeout=0.05)
+        upstream.release.set()
+        assert leader.result() == "ok"
+    assert upstream.hits == 1
+    assert flight.stats()['wait_timeouts'] == 1
+
+
+def test_async_concurrent_identical_calls_share_one_upstream_hit():
+    flight = AsyncSingleFlight()
+    hits = []
+
+    async def fetch():
+        hits.append(1)
+        await asyncio.sleep(0.05)
+        return {"value": 1}
+
+    async def scenario():
+        return await asyncio.gather(*[flight.do('key', fetch) for _ in range(CALLERS)])
+
+    assert asyncio.run(scenario()) == [{"value": 1}] * CALLERS
+    assert len(hits) == 1
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_async_exception_reaches_every_waiter_then_clears_the_key():
+    flight = AsyncSingleFlight()
+    hits = []
+
+    async def failing():
+        hits.append(1)
+        await asyncio.sleep(0.05)
+        raise ConnectionError("upstream down")
+
+    async def succeeding():
+        hits.append(1)
+        return "ok"
+
+    async def scenario():
+        outcomes = await asyncio.gather(*[flight.do('key', failing) for _ in range(CALLERS)], return_exceptions=True)
+        assert flight.stats()['in_flight'] == 0
+        return outcomes, await flight.do('key', succeeding)
+
+    outcomes, retried = asyncio.run(scenario())
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+    assert retried == "ok"
+    assert len(hits) == 2
+
+
+def test_payload_key_ignores_field_order():
+    assert payload_key({"model": "sonar", "max_tokens": 10}) == payload_key({"max_tokens": 10, "model": "sonar"})
+    assert payload_key({"model": "sonar"}) != payload_key({"model": "sonar-pro"})
+
+
+def test_identical_widget_requests_make_one_upstream_call(client, upstream):
+    upstream.delay = 0.2
+    prompt = f"quarterly revenue {uuid.uuid4().hex}"
+    with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+        responses = list(pool.map(
+            lambda _: client.post('/generate-single-widget', json={"prompt": prompt}), range(CALLERS)))
+
+    assert [response.status_code for response in responses] == [200] * CALLERS
+    assert upstream.calls == 1
+
+
+def test_identical_async_widget_requests_make_one_upstream_call(async_client, upstream):
+    upstream.delay = 0.2
+    prompt = f"quarterly revenue {uuid.uuid4().hex}"
+    with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+        responses = list(pool.map(
+            lambda _: async_client.post('/generate-single-widget', json={"prompt": prompt}), range(CALLERS)))
+
+    assert [response.status_code for response in responses] == [200] * CALLERS
+    assert upstream.calls == 1
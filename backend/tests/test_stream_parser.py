@@ -0,0 +1,82 @@
+import json
+import random
+
+import pytest
+
+from stream_parser import WidgetStreamParser
+
+WIDGETS = [
+    {"name": "Sales {by} [region]", "type": "bar", "data": [{"name": "North \"}\"", "value": 3}]},
+    {"name": "Path C:\\data\\", "type": "number", "data": {"value": 5, "label": "} ] ,"}},
+    {"name": "Nested", "type": "line", "data": [{"name": "2024", "value": 1}], "meta": {"widgets": [{"x": 1}]}},
+]
+DASHBOARD = {"dash_name": "Stream \"test\"", "notes": "widgets: [{not a widget}]", "category": "other",
+             "widgets": WIDGETS}
+TEXT = '```json\n' + json.dumps(DASHBOARD) + '\n```'
+
+
+def stream(chunks):
+    """Every widget the parser emits while fed chunks, and its final dashboard"""
+    parser = WidgetStreamParser()
+    emitted = []
+    for chunk in chunks:
+        emitted.extend(parser.feed(chunk))
+    return emitted, parser.finish()
+
+
+def split_at(text, *cuts):
+    bounds = [0, *cuts, len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize('marker, offset', [
+    ('Sales {by', 5),        # Mid-string, before a brace inside it
+    ('North \\"}', 7),       # Between a backslash and the quote it escapes
+    ('C:\\\\data', 3),       # Between the two backslashes of an escaped backslash
+    ('"label"', 4),          # Mid-key inside a widget's nested object
+    ('"meta"', 0),           # Mid-object, before a nested "widgets" key
+    ('}, {', 1),             # Between one widget's closing brace and the next
+])
+def test_split_inside_tokens_emits_each_widget_once(marker, offset):
+    cut = TEXT.index(marker) + offset
+    emitted, dashboard = stream(split_at(TEXT, cut))
+
+    assert emitted == WIDGETS
+    assert dashboard == DASHBOARD
+
+
+def test_every_two_chunk_split_emits_each_widget_once():
+    for cut in range(len(TEXT) + 1):
+        emitted, _ = stream(split_at(TEXT, cut))
+        assert emitted == WIDGETS, f"split at {cut}: {TEXT[max(cut - 10, 0):cut]!r} | {TEXT[cut:cut + 10]!r}"
+
+
+def test_one_character_at_a_time():
+    emitted, dashboard = stream(TEXT)
+    assert emitted == WIDGETS
+    assert dashboard == DASHBOARD
+
+
+def test_random_chunk_sizes():
+    rng = random.Random(0)
+    for _ in range(50):
+        cuts = sorted(rng.sample(range(1, len(TEXT)), 8))
+        emitted, _ = stream(split_at(TEXT, *cuts))
+        assert emitted == WIDGETS
+
+
+def test_widget_is_emitted_as_soon_as_it_closes():
+    parser = WidgetStreamParser()
+    first_end = TEXT.index('}]', TEXT.index('North')) + 3
+    assert parser.feed(TEXT[:first_end - 1]) == []
+    assert parser.feed(TEXT[first_end - 1:first_end]) == [WIDGETS[0]]
+    assert parser.feed(TEXT[first_end:]) == WIDGETS[1:]
+    assert parser.widgets_seen == 3
+
+
+def test_truncated_stream_keeps_the_completed_widgets():
+    cut = TEXT.index('"Nested"')
+    emitted, dashboard = stream(split_at(TEXT[:cut], 100))
+
+    assert emitted == WIDGETS[:2]
+    assert dashboard['widgets'] == WIDGETS[:2]
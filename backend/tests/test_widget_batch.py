@@ -0,0 +1,50 @@
+import uuid
+
+import pytest
+
+app_module = pytest.importorskip('app')
+from admission import PRIORITY_WIDGET, upstream_admission  # noqa: E402
+
+
+@pytest.fixture
+def priorities(monkeypatch):
+    """The admission priority of each upstream call"""
+    seen = []
+    acquire = upstream_admission.acquire
+
+    def recording_acquire(model, priority):
+        seen.append(priority)
+        return acquire(model, priority)
+
+    monkeypatch.setattr(upstream_admission, 'acquire', recording_acquire)
+    return seen
+
+
+@pytest.mark.parametrize('path', ['/generate-widgets', '/generate-widgets/stream'])
+def test_batches_get_widget_priority(client, upstream, priorities, path):
+    topic = uuid.uuid4().hex
+    response = client.post(path, json={"widgets": [{"prompt": f"{topic} revenue"}, {"prompt": f"{topic} profit"}]})
+    response.get_data()
+
+    assert response.status_code == 200
+    assert priorities == [PRIORITY_WIDGET, PRIORITY_WIDGET]
+
+
+def test_refresh_gets_widget_priority(client, upstream, priorities):
+    created = client.post('/generate-dashboard', json={"prompt": f"topic {uuid.uuid4().hex}"}).get_json()
+    del priorities[:]
+    response = client.post(f"/dashboards/{created['dashboard']['dashboard_id']}/refresh", json={"force": True})
+
+    assert response.status_code == 200
+    assert priorities and set(priorities) == {PRIORITY_WIDGET}
+
+
+def test_batch_runs_a_bounded_number_of_widgets_at_once(client, upstream):
+    upstream.delay = 0.1
+    topic = uuid.uuid4().hex
+    widgets = [{"prompt": f"{topic} metric {index}"} for index in range(app_module.WIDGET_BATCH_MAX_ITEMS)]
+    response = client.post('/generate-widgets', json={"widgets": widgets})
+
+    assert response.status_code == 200
+    assert all(result['status'] == 'success' for result in response.get_json()['results'])
+    assert upstream.max_active == app_module.WIDGET_BATCH_CONCURRENCY
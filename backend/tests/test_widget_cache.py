@@ -0,0 +1,33 @@
+import uuid
+
+from conftest import json_body
+
+# A bar widget cut off mid-series, which json_repair closes as 'truncated'
+TRUNCATED_WIDGET = '{"name": "Sales", "type": "bar", "data": [{"name": "a", "value": 1}, {"name": "b", "val'
+
+
+def test_widget_is_served_from_cache(any_client, upstream):
+    prompt = f"quarterly sales {uuid.uuid4().hex}"
+    first = any_client.post('/generate-single-widget', json={"prompt": prompt})
+    calls = upstream.calls
+    second = any_client.post('/generate-single-widget', json={"prompt": prompt})
+
+    assert first.status_code == second.status_code == 200
+    assert json_body(second)['cached']
+    assert upstream.calls == calls
+
+
+def test_truncated_widget_is_not_cached(any_client, upstream):
+    upstream.content = lambda payload: TRUNCATED_WIDGET
+    upstream.truncated = True
+    prompt = f"quarterly sales {uuid.uuid4().hex}"
+
+    first = any_client.post('/generate-single-widget', json={"prompt": prompt, "widget_type": "bar"})
+    calls = upstream.calls
+    second = any_client.post('/generate-single-widget', json={"prompt": prompt, "widget_type": "bar"})
+
+    assert first.status_code == second.status_code == 200
+    body = json_body(second)
+    assert 'truncated' in body['widget']['json_repairs']
+    assert 'cached' not in body
+    assert upstream.calls > calls
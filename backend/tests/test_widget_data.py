@@ -0,0 +1,113 @@
+import math
+
+import pytest
+
+from widget_data import (OTHER_LABEL, SeriesOptionsError, lttb, parse_series_options, series_etag, shape_dashboard,
+                         shape_widget, top_k)
+
+
+def line(values):
+    return {"name": "Trend", "type": "line", "data": [{"name": f"p{index}", "value": value}
+                                                      for index, value in enumerate(values)]}
+
+
+def bars(values, aggregate=None):
+    widget = {"name": "Bars", "type": "bar", "data": [{"name": f"b{index}", "value": value}
+                                                      for index, value in enumerate(values)]}
+    if aggregate:
+        widget['spec'] = {"group_by": "name", "aggregate": aggregate}
+    return widget
+
+
+@pytest.mark.parametrize('n, budget', [(1000, 300), (1000, 3), (10, 9), (301, 300), (7, 5)])
+def test_lttb_keeps_the_ends_and_exactly_the_budget(n, budget):
+    kept = lttb([math.sin(index / 7) for index in range(n)], budget)
+
+    assert len(kept) == budget
+    assert kept[0] == 0 and kept[-1] == n - 1
+    assert kept == sorted(set(kept))
+
+
+def test_lttb_keeps_peaks_and_dips():
+    values = [0] * 1000
+    values[123], values[777] = 50, -50
+    kept = lttb(values, 20)
+
+    assert 123 in kept and 777 in kept
+
+
+@pytest.mark.parametrize('budget', [2, 1000, 1500])
+def test_lttb_keeps_everything_outside_its_range(budget):
+    assert lttb(list(range(1000)), budget) == list(range(1000))
+
+
+def test_top_k_keeps_the_largest_bars_in_order_and_preserves_the_total():
+    points = bars([5, 40, 1, 30, 2, 20.5, 3])['data']
+    result = top_k(points, 4)
+
+    assert [point['name'] for point in result] == ['b1', 'b3', 'b5', OTHER_LABEL]
+    assert result[-1]['value'] == 11
+    assert sum(point['value'] for point in result) == sum(point['value'] for point in points)
+
+
+def test_top_k_without_other_drops_the_rest():
+    result = top_k(bars([5, 40, 1, 30])['data'], 2, other=False)
+    assert [point['name'] for point in result] == ['b1', 'b3']
+
+
+def test_shape_widget_downsamples_lines_and_reports_the_full_length():
+    widget = line(list(range(1000)))
+    shaped = shape_widget(widget, 300)
+
+    assert len(shaped['data']) == 300
+    assert shaped['total_points'] == 1000
+    assert len(widget['data']) == 1000
+
+
+def test_shape_widget_bars_get_other_only_for_additive_aggregates():
+    assert shape_widget(bars(range(20), 'sum'), 5)['data'][-1]['name'] == OTHER_LABEL
+    assert OTHER_LABEL not in [point['name'] for point in shape_widget(bars(range(20), 'mean'), 5)['data']]
+
+
+def test_shape_widget_returns_the_widget_when_nothing_changes():
+    widget = line([1, 2, 3])
+    assert shape_widget(widget, 300) is widget
+    assert shape_widget(widget, 0) is widget
+    number = {"name": "Total", "type": "number", "data": {"value": 1}}
+    assert shape_widget(number, 3) is number
+
+
+def test_shape_widget_columnar():
+    shaped = shape_widget(line([1, 2, 3]), 300, columnar=True)
+    assert shaped['data'] == {"names": ['p0', 'p1', 'p2'], "values": [1, 2, 3]}
+    assert 'total_points' not in shaped
+
+
+def test_shape_dashboard_copies_only_when_a_widget_changes():
+    dashboard = {"dash_name": "D", "widgets": [line([1, 2, 3]), bars([1, 2])]}
+    assert shape_dashboard(dashboard, 300) is dashboard
+
+    dashboard['widgets'].append(line(range(500)))
+    shaped = shape_dashboard(dashboard, 300)
+    assert shaped['widgets'][:2] == dashboard['widgets'][:2]
+    assert len(shaped['widgets'][2]['data']) == 300
+    assert len(dashboard['widgets'][2]['data']) == 500
+
+
+@pytest.mark.parametrize('max_points, series_format, expected', [
+    (None, None, (300, False)), ('', 'records', (300, False)), ('0', None, (0, False)), (50, 'columnar', (50, True)),
+])
+def test_parse_series_options(max_points, series_format, expected):
+    assert parse_series_options(max_points, series_format) == expected
+
+
+@pytest.mark.parametrize('max_points, series_format', [('many', None), (2, None), (10 ** 6, None), (-1, None),
+                                                       (50, 'csv')])
+def test_invalid_series_options_are_rejected(max_points, series_format):
+    with pytest.raises(SeriesOptionsError):
+        parse_series_options(max_points, series_format)
+
+
+def test_series_etag_differs_per_representation():
+    assert series_etag('"abc"', 300) == '"abc-300"'
+    assert series_etag('"abc"', 300, columnar=True) == '"abc-300c"'
@@ -0,0 +1,140 @@
+import os
+
+# Series shaping settings: line and bar data are cut down to a point budget at
+# response time, so cached and stored dashboards keep the full series
+SERIES_MAX_POINTS = int(os.getenv('SERIES_MAX_POINTS', '300'))
+SERIES_MAX_POINTS_LIMIT = int(os.getenv('SERIES_MAX_POINTS_LIMIT', '10000'))
+OTHER_LABEL = 'Other'
+
+# Bars whose values can be added up; the rest (means, medians, ...) get no "Other" bucket
+ADDITIVE_AGGREGATES = {'sum', 'count'}
+SERIES_FORMATS = {'records', 'columnar'}
+
+
+class SeriesOptionsError(ValueError):
+    """Invalid max_points or format in a request"""
+
+
+def parse_series_options(max_points=None, series_format=None):
+    """(max_points, columnar) from request values; max_points 0 turns downsampling off"""
+    if max_points is None or max_points == '':
+        max_points = SERIES_MAX_POINTS
+    try:
+        max_points = int(max_points)
+    except (TypeError, ValueError):
+        raise SeriesOptionsError("max_points must be an integer")
+    if max_points != 0 and not 3 <= max_points <= SERIES_MAX_POINTS_LIMIT:
+        raise SeriesOptionsError(f"max_points must be 0 or between 3 and {SERIES_MAX_POINTS_LIMIT}")
+    series_format = series_format or 'records'
+    if series_format not in SERIES_FORMATS:
+        raise SeriesOptionsError(f"format must be one of: {', '.join(sorted(SERIES_FORMATS))}")
+    return max_points, series_format == 'columnar'
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def lttb(values, budget):
+    """
+    Indexes of the points Largest-Triangle-Three-Buckets keeps from a series,
+    with positions as x. Always keeps the first and last point; from each
+    bucket in between, the point forming the largest triangle with the point
+    kept before it and the next bucket's average, so peaks and dips survive.
+    """
+    n = len(values)
+    if budget >= n or budget < 3:
+        return list(range(n))
+    every = (n - 2) / (budget - 2)
+    kept = [0]
+    previous = 0
+    for bucket in range(budget - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, n)
+        average_x = (end + next_end - 1) / 2
+        average_y = sum(values[end:next_end]) / (next_end - end)
+        previous_x, previous_y = previous, values[previous]
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs((previous_x - average_x) * (values[index] - previous_y)
+                       - (previous_x - index) * (average_y - previous_y))
+            if area > best_area:
+                best, best_area = index, area
+        kept.append(best)
+        previous = best
+    kept.append(n - 1)
+    return kept
+
+
+def top_k(points, budget, other=True):
+    """
+    The budget largest bars in their original order. With other, the last
+    slot is an "Other" bar holding the sum of the bars that were left out.
+    """
+    if len(points) <= budget:
+        return points
+    keep = budget - 1 if other else budget
+    ranked = sorted(range(len(points)), key=lambda index: _number(points[index].get('value')), reverse=True)
+    result = [points[index] for index in sorted(ranked[:keep])]
+    if other:
+        rest = sum(_number(points[index].get('value')) for index in ranked[keep:])
+        result.append({"name": OTHER_LABEL, "value": round(rest, 4) if isinstance(rest, float) else rest})
+    return result
+
+
+def downsample(widget, max_points):
+    """The widget's series cut down to max_points: LTTB for lines, top-k for bars"""
+    data = widget.get('data')
+    if not max_points or not isinstance(data, list) or len(data) <= max_points:
+        return data
+    if widget.get('type') == 'line':
+        values = [_number(point.get('value')) if isinstance(point, dict) else 0 for point in data]
+        return [data[index] for index in lttb(values, max_points)]
+    if widget.get('type') == 'bar':
+        spec = widget.get('spec')
+        additive = not isinstance(spec, dict) or (spec.get('aggregate') or 'count').lower() in ADDITIVE_AGGREGATES
+        return top_k([point for point in data if isinstance(point, dict)], max_points, other=additive)
+    return data
+
+
+def to_columnar(data):
+    """{"names": [...], "values": [...]} for a list of {"name", "value"} points"""
+    return {
+        "names": [point.get('name') if isinstance(point, dict) else None for point in data],
+        "values": [point.get('value') if isinstance(point, dict) else None for point in data],
+    }
+
+
+def shape_widget(widget, max_points, columnar=False):
+    """
+    The widget as sent to the client: series downsampled to max_points and,
+    with columnar, encoded as parallel names/values arrays. Returns the widget
+    itself when nothing changes, otherwise a copy.
+    """
+    if not isinstance(widget, dict) or not isinstance(widget.get('data'), list):
+        return widget
+    data = downsample(widget, max_points)
+    if columnar:
+        data = to_columnar(data)
+    elif data is widget['data']:
+        return widget
+    shaped = dict(widget, data=data)
+    if len(widget['data']) != len(data if not columnar else data['names']):
+        shaped['total_points'] = len(widget['data'])
+    return shaped
+
+
+def shape_dashboard(dashboard, max_points, columnar=False):
+    """shape_widget for each of a dashboard's widgets; the dashboard is copied only if one changes"""
+    if not isinstance(dashboard, dict) or not isinstance(dashboard.get('widgets'), list):
+        return dashboard
+    widgets = [shape_widget(widget, max_points, columnar) for widget in dashboard['widgets']]
+    if all(shaped is widget for shaped, widget in zip(widgets, dashboard['widgets'])):
+        return dashboard
+    return dict(dashboard, widgets=widgets)
+
+
+def series_etag(etag, max_points, columnar=False):
+    """A stored dashboard's ETag for its representation shaped with these options"""
+    return f'{etag[:-1]}-{max_points}{"c" if columnar else ""}"'
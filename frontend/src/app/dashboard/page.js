@@ -3,6 +3,7 @@
 import { useState, useEffect, useRef } from 'react';
 import { useRouter } from 'next/navigation';
 import { HiOutlineUpload, HiOutlineX } from 'react-icons/hi';
+import { postWithDataset, uploadDataset } from '@/lib/datasets';
 import DashboardGrid from '../../components/DashboardGrid';
 import GradientBackground from '../../components/background';
 
@@ -12,7 +13,9 @@ export default function Dashboard() {
   const [error, setError] = useState(null);
   const [uploadedFile, setUploadedFile] = useState(null);
   const [csvData, setCsvData] = useState(null);
+  const [datasetId, setDatasetId] = useState(null);
   const textareaRef = useRef(null);
+  const currentFileRef = useRef(null);
   const router = useRouter();
 
   // Auto-resize textarea
@@ -66,24 +69,15 @@ export default function Dashboard() {
     try {
       const baseUrl = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000';
       let endpoint = `${baseUrl}/generate-dashboard`;
-      let payload = { prompt: prompt };
+      let dataset = {};
 
       // If CSV is uploaded, use the CSV endpoint
       if (csvData) {
         endpoint = `${baseUrl}/generate-csv-dashboard`;
-        payload = { 
-          prompt: prompt,
-          csv_data: csvData 
-        };
+        dataset = { datasetId, csvData, onExpired: () => setDatasetId(null) };
       }
 
-      const response = await fetch(endpoint, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(payload)
-      });
+      const response = await postWithDataset(endpoint, { prompt: prompt }, dataset);
 
       if (!response.ok) {
         throw new Error('Failed to generate dashboard');
@@ -108,14 +102,25 @@ export default function Dashboard() {
     const file = e.target.files[0];
     if (file) {
       setUploadedFile(file);
+      // Reads and uploads of a file replaced or removed since are ignored when they finish
+      currentFileRef.current = file;
       
       // Read file content based on type
       const reader = new FileReader();
       reader.onload = (event) => {
+        if (currentFileRef.current !== file) return;
         const fileContent = event.target.result;
         setCsvData(fileContent); // Keep the same state name for compatibility
       };
       
+      // Upload once so generation requests can send the dataset ID instead of the file contents
+      setDatasetId(null);
+      uploadDataset(file)
+        .then((id) => {
+          if (currentFileRef.current === file) setDatasetId(id);
+        })
+        .catch(() => {}); // Fall back to sending the CSV text
+      
       // Read as text for most file types
       if (file.type.startsWith('text/') || file.name.endsWith('.csv') || file.name.endsWith('.txt') || file.name.endsWith('.json')) {
         reader.readAsText(file);
@@ -132,8 +137,10 @@ export default function Dashboard() {
   };
 
   const removeUploadedFile = () => {
+    currentFileRef.current = null;
     setUploadedFile(null);
     setCsvData(null);
+    setDatasetId(null);
     // Reset the file input
     const fileInput = document.querySelector('input[type="file"]');
     if (fileInput) fileInput.value = '';
@@ -234,6 +241,8 @@ export default function Dashboard() {
             modelUsed={dashboardData.model_used}
             onWidgetReplace={handleWidgetReplace}
             csvData={csvData}
+            datasetId={datasetId}
+            onDatasetExpired={() => setDatasetId(null)}
             dashboardContext={dashboardData.dash_name}
           />
         )}
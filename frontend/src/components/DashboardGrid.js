@@ -1,6 +1,6 @@
 import WidgetCard from './WidgetCard';
 
-export default function DashboardGrid({ widgets, category, dataSource, modelUsed, onWidgetReplace, csvData, dashboardContext }) {
+export default function DashboardGrid({ widgets, category, dataSource, modelUsed, onWidgetReplace, csvData, datasetId, onDatasetExpired, dashboardContext }) {
   if (!widgets || widgets.length === 0) {
     return (
       <div className="text-center text-gray-400 py-8">
@@ -20,6 +20,8 @@ export default function DashboardGrid({ widgets, category, dataSource, modelUsed
           dataSource={"Web Research"}
           onWidgetReplace={onWidgetReplace}
           csvData={csvData}
+          datasetId={datasetId}
+          onDatasetExpired={onDatasetExpired}
           dashboardContext={dashboardContext}
         />
       ))}
@@ -3,6 +3,7 @@
 import { BarChart, Bar, LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from 'recharts';
 import { useState, useRef, useEffect } from 'react';
 import { HiOutlineX, HiOutlinePencil } from 'react-icons/hi';
+import { postWithDataset } from '@/lib/datasets';
 
 const getIcon = (type) => {
   switch (type) {
@@ -32,7 +33,7 @@ const formatNumber = (value) => {
   }
 };
 
-export default function WidgetCard({ widget, category, index, dataSource = "AI Research", onWidgetReplace, csvData, dashboardContext }) {
+export default function WidgetCard({ widget, category, index, dataSource = "AI Research", onWidgetReplace, csvData, datasetId, onDatasetExpired, dashboardContext }) {
   const { name, type, data, source_url } = widget;
   const [showReplaceModal, setShowReplaceModal] = useState(false);
   const [replacePrompt, setReplacePrompt] = useState('');
@@ -71,18 +72,12 @@ export default function WidgetCard({ widget, category, index, dataSource = "AI R
         dashboard_context: dashboardContext || ''
       };
 
-      // Include CSV data if available
-      if (csvData) {
-        payload.csv_data = csvData;
-      }
-
+      // Include the uploaded dataset (or raw CSV data) if available
       const baseUrl = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000';
-      const response = await fetch(`${baseUrl}/generate-single-widget`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(payload)
+      const response = await postWithDataset(`${baseUrl}/generate-single-widget`, payload, {
+        datasetId,
+        csvData,
+        onExpired: onDatasetExpired
       });
 
       if (!response.ok) {
@@ -0,0 +1,40 @@
+// Upload a file once so later requests can reference it by dataset ID
+export async function uploadDataset(file) {
+  const baseUrl = process.env.NEXT_PUBLIC_API_BASE_URL || 'http://localhost:8000';
+  const response = await fetch(`${baseUrl}/datasets`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'text/csv',
+    },
+    body: file
+  });
+
+  if (!response.ok) {
+    throw new Error('Failed to upload dataset');
+  }
+
+  const data = await response.json();
+  return data.dataset_id;
+}
+
+// POST a generation request with the uploaded dataset's ID, or the CSV text when there is
+// no ID. Uploaded datasets can be evicted, so a 404 for the ID is retried with the CSV text
+// inline and reported through onExpired so the caller stops sending the ID.
+export async function postWithDataset(url, payload, { datasetId, csvData, onExpired } = {}) {
+  const post = (body) => fetch(url, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(body)
+  });
+
+  if (datasetId) {
+    const response = await post({ ...payload, dataset_id: datasetId });
+    if (response.status !== 404 || !csvData) {
+      return response;
+    }
+    onExpired?.();
+  }
+  return post(csvData ? { ...payload, csv_data: csvData } : payload);
+}